@@ -1,18 +1,24 @@
-import json
-import os
-import pkg_resources
+import logging
 import re
 import subprocess as sp
-import sys
 
-import conda_helpers as ch
-import path_helpers as ph
+from .cache import cache_key, load_cached, save_cached
+from .conda_meta import conda_meta_index, history_mtime
+from .version_context import VERSION_CONTEXT
 
+logger = logging.getLogger(__name__)
 
-f_major_version = lambda v: int(v.split('.')[0])
 
+f_major_version = VERSION_CONTEXT.major
 
-def conda_version_info(package_name):
+#: Conda channels searched for available packages.
+DEFAULT_CHANNELS = ('sci-bots', 'wheeler-microfluidics')
+#: Default maximum age (in seconds) of cached Conda package search results.
+SEARCH_CACHE_TTL = 6 * 60 * 60
+
+
+def conda_version_info(package_name, channels=None, ttl=SEARCH_CACHE_TTL,
+                       refresh=False):
     '''
     .. versionadded:: 0.2.post5
 
@@ -30,17 +36,39 @@ def conda_version_info(package_name):
         of MicroDrop if the version cannot be determined using ``conda
         search``.
 
+    .. versionchanged:: 0.8
+        Cache search results in the launcher user cache directory, keyed by
+        channel list and package name.  Cached results are reused until
+        :data:`ttl` seconds have passed or the packages installed in the Conda
+        environment change.
+
+        Search for :data:`package_name` (previously, ``microdrop`` was always
+        searched).
+
+        Fall back to reading installed version from ``conda-meta`` index (see
+        :func:`microdrop_launcher.conda_meta.package_version`) rather than
+        running ``conda list``.
+
+        Implemented using :func:`conda_versions_info`.
+
     Parameters
     ----------
     package_name : str
         Conda package name.
+    channels : list, optional
+        Conda channels to search (default: :data:`DEFAULT_CHANNELS`).
+    ttl : float, optional
+        Maximum age (in seconds) of cached search results.
+    refresh : bool, optional
+        If ``True``, ignore cached search results and query Conda channels.
 
     Returns
     -------
     dict
         Version information:
 
-         - ``latest``: Latest available version.
+         - ``versions``: Available versions (Conda package description
+           dictionaries, in ascending version order).
          - ``installed``: Conda package description dictionary for installed
            version (`None` if not installed).
 
@@ -53,24 +81,134 @@ def conda_version_info(package_name):
 
         This happens, for example, if no internet connection is available.
     '''
-    # Use `-f` flag to search for package, but *no other packages that have
-    # `<package_name>` in the name).
-    json_output = ch.conda_exec('search', '-c', 'sci-bots', '-c',
-                                'wheeler-microfluidics', '-f', 'microdrop',
-                                '--json', verbose=False)
-    versions = json.loads(json_output)['microdrop']
-    installed_versions = [v_i for v_i in versions if v_i['installed']]
-    installed_version = installed_versions[0] if installed_versions else None
-
-    if installed_version is None:
-        # If not able to find installed version from `microdrop` Conda package
-        # search, use `conda list ...` to try determine the installed version of
-        # MicroDrop.
-        try:
-            installed_version = ch.package_version('microdrop', verbose=False)
-        except NameError:
-            # Installed MicroDrop Conda package not found (perhaps this is a
-            # development environment?)
-            pass
+    return conda_versions_info([package_name], channels=channels, ttl=ttl,
+                               refresh=refresh)[package_name]
+
+
+def _conda_search(package_names, channels):
+    from .conda_stream import stream_conda
+
+    channel_args = [arg_i for channel_i in channels
+                    for arg_i in ('-c', channel_i)]
+    # Search for packages by regular expression matching *exact* package
+    # names (i.e., no other packages that have a package name in their name).
+    regex = '^({})$'.format('|'.join(re.escape(name_i)
+                                      for name_i in package_names))
+    # **N.B.**, command is killed if the deadline of the calling task expires
+    # (see :class:`microdrop_launcher.conda_stream.deadline`).
+    results = stream_conda('search', *(channel_args + [regex, '--json']))
+    return dict((name_i, results.get(name_i, [])) for name_i in package_names)
+
+
+def _repodata_search(package_names, channels):
+    from .repodata import cached_package_versions
+
+    versions = cached_package_versions(package_names, channels=channels)
+    return dict((name_i, [{'name': name_i, 'version': version_j,
+                           'installed': False}
+                          for version_j in sorted(versions[name_i],
+                                                  key=VERSION_CONTEXT.parse)])
+                for name_i in package_names)
+
+
+def conda_versions_info(package_names, channels=None, ttl=SEARCH_CACHE_TTL,
+                        refresh=False, offline=False):
+    '''
+    Look up available and installed versions of several Conda packages using
+    a single ``conda search`` command.
+
+    If Conda channel hosts are not reachable (see
+    :func:`microdrop_launcher.network.channels_reachable`) or ``conda search``
+    fails, available versions are read from Conda's cached channel repodata
+    (see :func:`microdrop_launcher.repodata.cached_package_versions`) in a
+    single pass instead.
+
+    .. versionadded:: 0.8
+
+    Parameters
+    ----------
+    package_names : list
+        Conda package names, e.g., ``['microdrop', 'microdrop-launcher']``.
+    channels : list, optional
+        Conda channels to search (default: :data:`DEFAULT_CHANNELS`).
+    ttl : float, optional
+        Maximum age (in seconds) of cached search results.
+    refresh : bool, optional
+        If ``True``, ignore cached search results and query Conda channels.
+    offline : bool, optional
+        If ``True``, do not query Conda channels; use cached search results
+        (regardless of age) or cached channel repodata instead, e.g., while
+        backing off after ``conda search`` timed out.
 
-    return {'installed': installed_version, 'versions': versions}
+    Returns
+    -------
+    dict
+        Mapping from each package name to version information (see
+        :func:`conda_version_info`), including the ``source`` of available
+        versions, i.e., ``"conda-search"``, ``"cache"`` (cached search
+        results) or ``"repodata"`` (cached channel repodata).
+
+    Raises
+    ------
+    microdrop_launcher.network.OfflineError
+        If Conda channel hosts are not reachable (and no cached repodata is
+        available).
+    IOError
+        If Conda executable not found (and no cached repodata is available).
+    RuntimeError
+        If `conda search` command fails (and no cached repodata is
+        available).
+    '''
+    from .network import OfflineError, channels_reachable
+
+    if channels is None:
+        channels = DEFAULT_CHANNELS
+    package_names = sorted(set(package_names))
+    key = cache_key(list(channels), package_names)
+    mtime = history_mtime()
+
+    cached = (None if refresh else
+              load_cached('conda-search', key,
+                          ttl=None if offline else ttl))
+    if cached is not None and cached.get('history_mtime') == mtime:
+        search_results = cached['versions']
+        source = 'cache'
+    elif offline or not channels_reachable(channels):
+        # Skip `conda search`, which would take several seconds to fail.
+        search_results = _repodata_search(package_names, channels)
+        source = 'repodata'
+        if not offline and not any(search_results.itervalues()):
+            raise OfflineError('Conda channels are not reachable.')
+    else:
+        try:
+            search_results = _conda_search(package_names, channels)
+        except (IOError, RuntimeError, ValueError, sp.CalledProcessError):
+            # Fall back to cached channel repodata (e.g., if offline).
+            search_results = _repodata_search(package_names, channels)
+            if not any(search_results.itervalues()):
+                raise
+            logger.info('`conda search` failed; using cached repodata.',
+                        exc_info=True)
+            source = 'repodata'
+        else:
+            source = 'conda-search'
+            try:
+                save_cached('conda-search', key,
+                            {'history_mtime': mtime,
+                             'versions': search_results})
+            except Exception:
+                # Caching is an optimization; search results are still valid.
+                pass
+
+    installed_index = conda_meta_index()
+    info = {}
+    for name_i in package_names:
+        versions_i = search_results.get(name_i, [])
+        installed_i = [v_j for v_j in versions_i if v_j.get('installed')]
+        # If not able to find installed version from Conda package search, use
+        # `conda-meta` index to try determine the installed version (`None`
+        # if not found, perhaps this is a development environment?).
+        info[name_i] = {'installed': (installed_i[0] if installed_i
+                                      else installed_index.get(name_i)),
+                        'versions': versions_i, 'source': source}
+    return info
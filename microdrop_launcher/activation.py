@@ -0,0 +1,159 @@
+'''
+Cached activated Conda environment.
+
+Activating a Conda environment (i.e., running the ``activate`` script in a
+shell) only modifies environment variables.  The changes made by activation
+are captured once and cached in the launcher cache directory, keyed by the
+Conda prefix and the modified time of ``<prefix>/conda-meta/history`` (i.e.,
+the cache is refreshed whenever packages are installed or removed).
+
+Programs may then be launched in the activated environment directly, without
+a shell and without running the activation script each time.
+
+.. versionadded:: 0.8
+'''
+import json
+import logging
+import os
+import subprocess as sp
+import sys
+
+from .cache import cache_key, load_cached, save_cached
+from .conda_meta import history_mtime
+
+logger = logging.getLogger(__name__)
+
+# Marker surrounding environment JSON in output of activated shell (activation
+# scripts may write to standard output).
+_MARKER = '--- microdrop-launcher environment ---'
+_DUMP_ENVIRONMENT = ('import json, os, sys; '
+                     'sys.stdout.write({marker!r} + '
+                     'json.dumps(dict(os.environ), '
+                     'encoding=sys.getfilesystemencoding() or \'utf-8\') + '
+                     '{marker!r})'.format(marker=_MARKER))
+
+
+def _encoding():
+    return sys.getfilesystemencoding() or 'utf-8'
+
+
+def _encode(value):
+    # `subprocess` requires byte string environment variables on Windows.
+    if isinstance(value, unicode):
+        return value.encode(_encoding())
+    return value
+
+
+def capture_activation_delta(base_env=None):
+    '''
+    Run activation script of active Conda environment in a shell and capture
+    resulting changes to environment variables.
+
+    Parameters
+    ----------
+    base_env : dict, optional
+        Environment to activate from (default: :data:`os.environ`).
+
+    Returns
+    -------
+    dict
+        Environment changes, i.e., ``{'set': {<name>: <value>, ...},
+        'unset': [<name>, ...]}``.
+
+    Raises
+    ------
+    RuntimeError
+        If activated environment could not be captured.
+    '''
+    import conda_helpers as ch
+
+    if base_env is None:
+        base_env = os.environ.copy()
+    # **N.B.**, same activation command as used by
+    # :func:`microdrop_launcher.profile.launch_profile` without a cached
+    # environment.
+    command = (ch.conda_activate_command() +
+               ['&', sys.executable, '-c', _DUMP_ENVIRONMENT])
+    output = sp.check_output(command, env=base_env, shell=True)
+    try:
+        start = output.index(_MARKER) + len(_MARKER)
+        end = output.index(_MARKER, start)
+    except ValueError:
+        raise RuntimeError('Activated environment not found in output:\n{}'
+                           .format(output))
+    activated = json.loads(output[start:end], encoding=_encoding())
+    base = dict((key_i.decode(_encoding()) if isinstance(key_i, str)
+                 else key_i,
+                 value_i.decode(_encoding()) if isinstance(value_i, str)
+                 else value_i) for key_i, value_i in base_env.iteritems())
+    return {'set': dict((key_i, value_i)
+                        for key_i, value_i in activated.iteritems()
+                        if base.get(key_i) != value_i),
+            'unset': [key_i for key_i in base if key_i not in activated]}
+
+
+def activation_delta(refresh=False):
+    '''
+    Parameters
+    ----------
+    refresh : bool, optional
+        If ``True``, ignore cached activation changes.
+
+    Returns
+    -------
+    dict or None
+        Cached environment changes (see :func:`capture_activation_delta`), or
+        ``None`` if not running in a Conda environment or if the activated
+        environment could not be captured.
+    '''
+    import conda_helpers as ch
+
+    prefix = ch.conda_prefix()
+    if prefix is None:
+        return None
+    # **N.B.**, activation prepends to `PATH`, so changes are only valid for
+    # the same original `PATH`.
+    key = cache_key(str(prefix), history_mtime(prefix),
+                    os.environ.get('PATH'))
+    delta = None if refresh else load_cached('conda-activate', key)
+    if delta is None:
+        try:
+            delta = capture_activation_delta()
+        except Exception:
+            logger.warning('Error capturing activated Conda environment.',
+                           exc_info=True)
+            return None
+        try:
+            save_cached('conda-activate', key, delta)
+        except Exception:
+            logger.debug('Error caching activated Conda environment.',
+                         exc_info=True)
+    return delta
+
+
+def activated_environment(env=None, refresh=False):
+    '''
+    Parameters
+    ----------
+    env : dict, optional
+        Environment to apply activation changes to (default:
+        :data:`os.environ`), e.g., with additional variables set.
+    refresh : bool, optional
+        If ``True``, ignore cached activation changes.
+
+    Returns
+    -------
+    dict or None
+        Copy of :data:`env` with activation changes applied, or ``None`` if
+        the activated environment is not available (see
+        :func:`activation_delta`).
+    '''
+    delta = activation_delta(refresh=refresh)
+    if delta is None:
+        return None
+    env = dict(os.environ if env is None else env)
+    for key_i in delta['unset']:
+        env.pop(_encode(key_i), None)
+    for key_i, value_i in delta['set'].iteritems():
+        env[_encode(key_i)] = _encode(value_i)
+    return env
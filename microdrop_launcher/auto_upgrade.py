@@ -1,46 +1,358 @@
-import json
 import logging
-import re
 import sys
 
-import pip_helpers as pih
-
 import conda_helpers as ch
 
+from . import tracing
+from .conda_meta import installed_package
+from .conda_stream import CondaError, stream_conda
+from .network import channels_reachable
+from .repodata import latest_cached_version
+from .version_cache import (MAX_STAGED_FAILURES, clear_staged_launcher,
+                            load_version_cache, record_staged_launcher,
+                            record_staged_launcher_failure,
+                            staged_launcher_version, update_version_cache)
+from .version_context import VERSION_CONTEXT
+
 
 logger = logging.getLogger(__name__)
 
 
-def _strip_conda_menuinst_messages(conda_output):
+def _print_progress(event):
     '''
-    Strip away Conda menuinst log messages to work around [issue with
-    `menuinst`][0].
+    Print Conda download progress event (see
+    :class:`microdrop_launcher.conda_stream.CondaOutputReader`).
 
     For example:
 
-        INFO menuinst_win32:__init__(182): Menu: name: 'MicroDrop', prefix: 'C:\Users\chris\Miniconda2\envs\dropbot.py', env_name: 'dropbot.py', mode: 'None', used_mode: 'user'
+        {"maxval": 133256, "finished": false, "fetch": "microdrop-laun", "progress": 0}
+
+    .. versionadded:: 0.8
+    '''
+    maxval = event.get('maxval') or 0
+    if event.get('finished'):
+        percent = 100
+    elif maxval:
+        percent = int(100 * (event.get('progress') or 0) / float(maxval))
+    else:
+        percent = 0
+    sys.stderr.write('\rDownloading `{}`: {:3d}%{}'
+                     .format(event.get('fetch'), percent,
+                             '\n' if event.get('finished') else ''))
+    sys.stderr.flush()
 
-    See [here][1] for more information.
 
-    [0]: https://github.com/ContinuumIO/menuinst/issues/49
-    [1]: https://groups.google.com/a/continuum.io/forum/#!topic/anaconda/RWs9of4I2KM
+def cached_up_to_date(package_name='microdrop-launcher'):
     '''
-    return '\n'.join(line_i for line_i in conda_output.splitlines()
-                     if not line_i.strip().startswith('INFO'))
+    Check for new package version *without* running the Conda solver.
 
+    The installed version is read from the ``conda-meta`` directory of the
+    active Conda environment and the latest available version is read from
+    Conda's cached channel repodata.
 
-def _strip_progress_messages(conda_output):
+    Parameters
+    ----------
+    package_name : str, optional
+        Conda package name.
+
+    Returns
+    -------
+    dict or None
+        Installed package info (see
+        :func:`microdrop_launcher.conda_meta.installed_package`) if the
+        installed version is at least the latest cached version, otherwise
+        ``None`` (i.e., a newer version appears to be available, or the
+        versions could not be determined).
+
+    .. versionadded:: 0.8
     '''
-    Strip progress messages from Conda install output log.
+    try:
+        installed = installed_package(package_name)
+        if installed is None:
+            return None
+        latest_version = latest_cached_version(package_name)
+        if latest_version is None:
+            return None
+        if (VERSION_CONTEXT.parse(latest_version) <=
+                VERSION_CONTEXT.parse(installed['version'])):
+            return installed
+    except Exception:
+        logger.debug('Error checking cached `%s` version.', package_name,
+                     exc_info=True)
+    return None
 
-    For example:
 
-        {"maxval": 133256, "finished": false, "fetch": "microdrop-laun", "progress": 0}
+def upgrade_launcher(on_progress=None, version_info=None,
+                     download_only=False):
     '''
-    cre_json_progress = re.compile(r'{"maxval":[^,]+,\s+"finished":[^,]+,'
-                                   r'\s+"fetch":\s+[^,]+,\s+"progress":[^}]+}')
-    return '\n'.join(line_i for line_i in conda_output.splitlines()
-                     if not cre_json_progress.search(line_i))
+    Upgrade ``microdrop-launcher`` package if a new version is available.
+
+    If :data:`download_only` is ``True``, the new version is only downloaded
+    to the Conda package cache (at low priority) and recorded in the staging
+    manifest, to be installed at the next launcher start (see
+    :func:`apply_staged_upgrade`).
+
+    Parameters
+    ----------
+    on_progress : callable, optional
+        Called with each Conda download progress event (see
+        :class:`microdrop_launcher.conda_stream.CondaOutputReader`).
+    version_info : dict, optional
+        Available and installed ``microdrop-launcher`` versions (see
+        :func:`microdrop_launcher.conda_version_info`), e.g., from a combined
+        query for several packages.
+
+        If not specified, cached Conda metadata is used instead (see
+        :func:`cached_up_to_date`).
+    download_only : bool, optional
+        If ``True``, stage upgrade rather than installing it.
+
+    Returns
+    -------
+    dict
+        Upgrade result:
+
+         - ``original_version``: Installed version before upgrade (or
+           ``None`` if not installed as a Conda package).
+         - ``new_version``: Version installed by upgrade (or ``None`` if not
+           upgraded).
+         - ``unlinked``, ``linked``: Packages uninstalled and installed by
+           upgrade, respectively (see :func:`conda_helpers.install_info`).
+         - ``error``: Error message (or ``None`` if no error occurred).
+         - ``network_error``: ``True`` if Conda server could not be reached.
+         - ``staged_version``: Version downloaded to be installed at the next
+           launcher start (or ``None`` if no upgrade is staged).
+
+    .. versionadded:: 0.8
+    '''
+    installed = installed_package('microdrop-launcher')
+    result = {'original_version': installed['version'] if installed else None,
+              'new_version': None, 'unlinked': [], 'linked': [],
+              'error': None, 'network_error': False, 'staged_version': None}
+
+    staged = {}
+    if download_only:
+        prefix = ch.conda_prefix()
+        staged = staged_launcher_version(load_version_cache(), prefix)
+    if version_info is not None:
+        versions = [v_i['version'] for v_i in version_info['versions']]
+        if (installed and (not versions or
+                           max(VERSION_CONTEXT.parse(v_i) for v_i in versions)
+                           <= VERSION_CONTEXT.parse(installed['version']))):
+            # No newer version available.
+            return result
+        if staged.get('version') and not staged.get('failures') and \
+                versions and \
+                (max(VERSION_CONTEXT.parse(v_i) for v_i in versions) <=
+                 VERSION_CONTEXT.parse(staged['version'])):
+            # Latest version already staged.
+            result['staged_version'] = staged['version']
+            return result
+    elif cached_up_to_date('microdrop-launcher') is not None:
+        return result
+
+    if not channels_reachable():
+        # Skip Conda install dry-run, which would take several seconds to
+        # fail with `CondaHTTPError`.
+        result['error'] = 'Conda channels are not reachable.'
+        result['network_error'] = True
+        return result
+
+    try:
+        # Check if new version of `microdrop-launcher` would be installed.
+        dry_run_response = stream_conda('install', '--dry-run', '--json',
+                                        'microdrop-launcher')
+    except (CondaError, ValueError), exception:
+        result['error'] = str(exception)
+        result['network_error'] = 'CondaHTTPError' in str(exception)
+        return result
+
+    # Get the list of packages that would be **uninstalled** (i.e., unlinked)
+    # and the list of packages that would be **installed** (i.e., linked).
+    dry_run_unlinked, dry_run_linked = ch.install_info(dry_run_response,
+                                                       split_version=True)
+
+    # Try to find package specifier for new version of `midrodrop-launcher`.
+    # **N.B.**, `dry_run_linked` will be `None` if there is no new version.
+    launcher_versions = [version_i for package_i, version_i, channel_i in
+                         (dry_run_linked or [])
+                         if 'microdrop-launcher' == package_i]
+    if not launcher_versions:
+        # No new version of the launcher is available for installation.
+        return result
+
+    if download_only:
+        if (staged.get('version') == launcher_versions[0] and
+                not staged.get('failures')):
+            result['staged_version'] = launcher_versions[0]
+            return result
+        logger.info('Downloading `microdrop-launcher` %s.',
+                    launcher_versions[0])
+        try:
+            response = stream_conda('install', '--download-only', '--json',
+                                    '--quiet', 'microdrop-launcher =={}'
+                                    .format(launcher_versions[0]),
+                                    on_progress=on_progress,
+                                    on_message=logger.debug,
+                                    low_priority=True)
+        except CondaError, exception:
+            result['error'] = str(exception)
+            result['network_error'] = 'CondaHTTPError' in str(exception)
+            return result
+        except ValueError, exception:
+            # Download could not be verified, so do not stage it.
+            result['error'] = ('Could not decode download log:\n{}'
+                               .format(getattr(exception, 'text',
+                                               exception)))
+            return result
+        if isinstance(response, dict) and response.get('success') is False:
+            result['error'] = (response.get('message') or
+                               response.get('error') or 'Download failed.')
+            return result
+        with update_version_cache() as cache:
+            record_staged_launcher(cache, launcher_versions[0], prefix)
+        result['staged_version'] = launcher_versions[0]
+        return result
+
+    # A new version of the launcher is available for installation.
+    logger.info('Upgrading `microdrop-launcher` to: %s', launcher_versions[0])
+    try:
+        # **N.B.**, never kill an install in progress, since this may leave
+        # the environment in an inconsistent state.
+        install_response = \
+            stream_conda('install', '--json', 'microdrop-launcher', '--quiet',
+                         on_progress=on_progress, on_message=logger.debug,
+                         cancellable=False)
+    except CondaError, exception:
+        result['error'] = str(exception)
+        result['network_error'] = 'CondaHTTPError' in str(exception)
+        return result
+    except ValueError, exception:
+        # Install result could not be verified.
+        result['error'] = ('Could not decode install log:\n{}'
+                           .format(getattr(exception, 'text', exception)))
+        return result
+    if (isinstance(install_response, dict) and
+            install_response.get('success') is False):
+        result['error'] = (install_response.get('message') or
+                           install_response.get('error') or 'Install failed.')
+        return result
+    result['unlinked'], result['linked'] = ch.install_info(install_response)
+    # Confirm new version is installed (e.g., Conda may have resolved a
+    # different version than the dry run).
+    installed = installed_package('microdrop-launcher')
+    if installed is None or (VERSION_CONTEXT.parse(installed['version']) <
+                             VERSION_CONTEXT.parse(launcher_versions[0])):
+        result['error'] = ('`microdrop-launcher` {} not installed (installed '
+                           'version: {}).'
+                           .format(launcher_versions[0],
+                                   installed['version'] if installed
+                                   else None))
+        return result
+    result['new_version'] = installed['version']
+    return result
+
+
+def apply_staged_upgrade(on_progress=None, ignore_pids=None):
+    '''
+    Install ``microdrop-launcher`` upgrade staged by a previous session (see
+    :func:`upgrade_launcher`), using only the Conda package cache (i.e.,
+    ``conda install --offline``).
+
+    The upgrade is deferred while another launcher session is running (see
+    :func:`microdrop_launcher.sessions.other_sessions_running`), since its
+    files would be replaced underneath it.
+
+    **N.B.**, run in a helper process (see :func:`apply_staged_main`), such
+    that no process runs a mix of modules loaded before and after the
+    upgrade.
+
+    Parameters
+    ----------
+    on_progress : callable, optional
+        See :func:`upgrade_launcher`.
+    ignore_pids : list, optional
+        Process IDs of launcher sessions to ignore (i.e., the launcher that
+        started the helper process).
+
+    Returns
+    -------
+    dict or None
+        See :func:`upgrade_launcher`, or ``None`` if no staged upgrade was
+        installed.
+
+    .. versionadded:: 0.8
+    '''
+    from .sessions import other_sessions_running, registry_lock
+
+    prefix = ch.conda_prefix()
+    staged = staged_launcher_version(load_version_cache(), prefix)
+    if (not staged.get('version') or
+            staged.get('failures', 0) >= MAX_STAGED_FAILURES):
+        return None
+    installed = installed_package('microdrop-launcher')
+    if (installed and VERSION_CONTEXT.parse(staged['version']) <=
+            VERSION_CONTEXT.parse(installed['version'])):
+        # Already installed (e.g., by another launcher process).
+        with update_version_cache() as cache:
+            clear_staged_launcher(cache, prefix)
+        return None
+
+    try:
+        # Only one launcher process may install the staged upgrade, and no
+        # session may start while it is installed.
+        lock = registry_lock(timeout=0)
+        lock.acquire()
+    except IOError:
+        return None
+    try:
+        if other_sessions_running(ignore_pids=ignore_pids):
+            logger.info('Deferring `microdrop-launcher` %s upgrade while '
+                        'another session is running.', staged['version'])
+            return None
+        result = {'original_version':
+                  installed['version'] if installed else None,
+                  'new_version': None, 'unlinked': [], 'linked': [],
+                  'error': None, 'network_error': False,
+                  'staged_version': staged['version']}
+        logger.info('Installing staged `microdrop-launcher` %s.',
+                    staged['version'])
+        try:
+            # **N.B.**, never kill an install in progress.
+            install_response = \
+                stream_conda('install', '--json', '--offline', '--quiet',
+                             'microdrop-launcher =={}'
+                             .format(staged['version']),
+                             on_progress=on_progress, on_message=logger.debug,
+                             cancellable=False)
+        except CondaError, exception:
+            # E.g., package cache was cleaned.
+            result['error'] = str(exception)
+        except ValueError, exception:
+            # Install result could not be verified.
+            result['error'] = ('Could not decode install log:\n{}'
+                               .format(getattr(exception, 'text',
+                                               exception)))
+        else:
+            if (isinstance(install_response, dict) and
+                    install_response.get('success') is False):
+                result['error'] = (install_response.get('message') or
+                                   install_response.get('error') or
+                                   'Install failed.')
+            else:
+                result['unlinked'], result['linked'] = \
+                    ch.install_info(install_response)
+                result['new_version'] = staged['version']
+        with update_version_cache() as cache:
+            if result['error'] is None:
+                clear_staged_launcher(cache, prefix)
+            else:
+                # Retry at next start (see `MAX_STAGED_FAILURES`).
+                record_staged_launcher_failure(cache, prefix,
+                                               result['error'])
+        return result
+    finally:
+        lock.release()
 
 
 def main():
@@ -58,70 +370,124 @@ def main():
     .. versionchanged:: 0.7.7
         Strip progress messages from Conda install output log to prevent JSON
         decoding errors.
+
+    .. versionchanged:: 0.8
+        Read Conda output incrementally (see
+        :func:`microdrop_launcher.conda_stream.stream_conda`), printing
+        download progress while upgrade is installed.
+
+        Skip Conda install dry-run if cached Conda metadata shows no new
+        version is available (see :func:`cached_up_to_date`).
+
+        Print result of :func:`upgrade_launcher` and return it.
+
+        Skip Conda install dry-run if Conda channel hosts are not reachable
+        (see :func:`microdrop_launcher.network.channels_reachable`).
+
+    Returns
+    -------
+    dict
+        See :func:`upgrade_launcher`.
     '''
     # Upgrade `microdrop-launcher` package if there is a new version available.
     print 'Checking for `microdrop-launcher` updates',
-    try:
-        # Check if new version of `microdrop-launcher` would be installed.
-        dry_run_response = json.loads(ch.conda_exec('install', '--dry-run',
-                                                    '--json',
-                                                    'microdrop-launcher',
-                                                    verbose=False))
-    except RuntimeError, exception:
-        if 'CondaHTTPError' in str(exception):
-            print 'Error checking for updates - no network connection'
-            return
-        else:
-            print 'Error checking for updates.\n{}'.format(exception)
-            return
+    result = upgrade_launcher(on_progress=_print_progress)
+    print_upgrade_result(result)
+    return result
 
-    # Get the list of packages that would be **uninstalled** (i.e., unlinked)
-    # and the list of packages that would be **installed** (i.e., linked).
-    dry_run_unlinked, dry_run_linked = ch.install_info(dry_run_response,
-                                                       split_version=True)
 
-    # Try to find package specifier for new version of `midrodrop-launcher`.
-    # **N.B.**, `dry_run_linked` will be `None` if there is no new version.
-    launcher_packages = [package_i for package_i, version_i, channel_i in
-                         (dry_run_linked or [])
-                         if 'microdrop-launcher' == package_i]
-    if dry_run_linked and launcher_packages:
-        # A new version of the launcher is available for installation.
-        print 'Upgrading to:', launcher_packages[0]
-        try:
-            install_log_json = ch.conda_exec('install', '--json',
-                                             'microdrop-launcher', '--quiet',
-                                             verbose=False)
-        except RuntimeError, exception:
-            if 'CondaHTTPError' in str(exception):
-                print >> sys.stderr, ('Error upgrading `microdrop-launcher` - '
-                                      'no network connection.')
-                return
-        install_log_json = _strip_conda_menuinst_messages(install_log_json)
-        install_log_json = _strip_progress_messages(install_log_json)
-        try:
-            install_response = json.loads(install_log_json)
-        except ValueError:
-            # Error decoding JSON response.
-            # XXX Assume install succeeded.
-            print >> sys.stderr, ('Warning: could not decode '
-                                  '`microdrop-launcher` install log:')
-            print >> sys.stderr, install_log_json
-            return
-        unlinked, linked = ch.install_info(install_response)
+def apply_staged_main(parent_pid=None):
+    '''
+    Install staged ``microdrop-launcher`` upgrade (see
+    :func:`apply_staged_upgrade`) and print result.
+
+    Run by the launcher in a helper process at start, *before* launching
+    MicroDrop (see
+    :func:`microdrop_launcher.tasks.apply_staged_launcher_upgrade`), i.e.:
+
+        python -m microdrop_launcher.auto_upgrade --apply-staged --parent-pid <pid>
+
+    .. versionadded:: 0.8
+
+    Parameters
+    ----------
+    parent_pid : int, optional
+        Process ID of launcher session that started this process.
+
+    Returns
+    -------
+    int
+        Exit code: 0 if upgrade was installed, 1 if install failed, or 2 if
+        no staged upgrade was installed (e.g., none staged, or deferred while
+        another session is running).
+    '''
+    result = apply_staged_upgrade(on_progress=_print_progress,
+                                  ignore_pids=[parent_pid]
+                                  if parent_pid else None)
+    if result is None:
+        return 2
+    print_upgrade_result(result)
+    return 0 if result['new_version'] else 1
+
+
+def parse_args(args=None):
+    '''Parses arguments, returns (options, args).'''
+    from argparse import ArgumentParser
+
+    if args is None:
+        args = sys.argv
+
+    parser = ArgumentParser(description='Upgrade `microdrop-launcher` '
+                            'package.')
+    parser.add_argument('--apply-staged', action='store_true',
+                        help='Only install upgrade staged by a previous '
+                        'launcher session (see `apply_staged_main`).')
+    parser.add_argument('--parent-pid', type=int,
+                        help='Process ID of launcher session that started '
+                        'this process.')
+
+    return parser.parse_args()
+
+
+def print_upgrade_result(result):
+    '''
+    Print result of :func:`upgrade_launcher` (or
+    :func:`apply_staged_upgrade`).
+
+    .. versionadded:: 0.8
+    '''
+    if result['network_error']:
+        print 'Error checking for updates - no network connection'
+    elif result['error'] and result.get('staged_version'):
+        print ('Error installing staged upgrade to {}.\n{}'
+               .format(result['staged_version'], result['error']))
+    elif result['error']:
+        print 'Error checking for updates.\n{}'.format(result['error'])
+    elif result['new_version']:
+        print 'Upgraded to:', result['new_version']
         print 'Uninstall:'
         print '\n'.join(' - `{} (from {})`'.format(package_i, channel_i)
-                        for package_i, channel_i in unlinked)
+                        for package_i, channel_i in result['unlinked'])
         print ''
         print 'Install:'
         print '\n'.join(' - `{} (from {})`'.format(package_i, channel_i)
-                        for package_i, channel_i in linked)
+                        for package_i, channel_i in result['linked'])
+    elif result.get('staged_version'):
+        print ('Downloaded microdrop-launcher=={} (will be installed the next '
+               'time the launcher starts)'.format(result['staged_version']))
+    elif result['original_version']:
+        print ('Up to date: microdrop-launcher=={}'
+               .format(result['original_version']))
     else:
-        # No new version of the launcher is available for installation.
-        print ('Up to date: {}'.format(ch.package_version('microdrop-launcher',
-                                                          verbose=False)
-                                       .get('dist_name')))
+        print 'Up to date'
 
 
 if __name__ == '__main__':
-    main()
+    # Append trace events to trace file of parent launcher (if set).
+    tracing.enable_from_environment(process_name='auto_upgrade')
+    args = parse_args()
+    if args.apply_staged:
+        with tracing.span('apply_staged_upgrade'):
+            raise SystemExit(apply_staged_main(parent_pid=args.parent_pid))
+    with tracing.span('auto_upgrade'):
+        main()
@@ -0,0 +1,119 @@
+'''
+Compare import-only start latency of cold interpreter starts and zygote mode.
+
+Each sample measures the time to start a process that imports the specified
+modules (by default, the modules preloaded by the zygote server) and exits:
+
+ - **cold**: start a new Python interpreter (as after return code 5 without
+   zygote mode).
+ - **zygote**: fork a child from a zygote server that has already imported the
+   modules (see :mod:`microdrop_launcher.zygote`).
+
+**N.B.**, samples do not start MicroDrop, i.e., they do not include
+initializing the GUI or loading plugins.  The difference between modes is the
+import time saved per restart, **not** the MicroDrop restart latency.
+
+Example:
+
+    python -m microdrop_launcher.bin.benchmark_zygote -n 10
+
+.. versionadded:: 0.8
+'''
+import subprocess as sp
+import sys
+import time
+
+from ..zygote import DEFAULT_PRELOAD, Zygote, zygote_available
+
+
+def _summary(label, durations):
+    durations = sorted(durations)
+    return ('{:>8}: min={:.3f} s  median={:.3f} s  max={:.3f} s'
+            .format(label, durations[0], durations[len(durations) // 2],
+                    durations[-1]))
+
+
+def benchmark(modules, repeat=5):
+    '''
+    Parameters
+    ----------
+    modules : list
+        Modules to import in each process.
+    repeat : int, optional
+        Number of samples per mode.
+
+    Returns
+    -------
+    dict
+        Durations (in seconds) of each sample, keyed by mode (``cold``,
+        ``zygote``), zygote server preload duration (``zygote_startup``),
+        and GUI modules imported by zygote server (``gui_modules``; see
+        :data:`microdrop_launcher.zygote.GUI_MODULES`).
+    '''
+    code = 'import {}'.format(', '.join(modules)) if modules else 'pass'
+
+    cold = []
+    for i in xrange(repeat):
+        start = time.time()
+        return_code = sp.call([sys.executable, '-c', code])
+        cold.append(time.time() - start)
+        if return_code != 0:
+            raise RuntimeError('Error importing modules: {}'
+                               .format(', '.join(modules)))
+
+    warm = []
+    zygote = Zygote(preload=modules)
+    start = time.time()
+    ready = zygote.start()
+    zygote_startup = time.time() - start
+    try:
+        for i in xrange(repeat):
+            start = time.time()
+            zygote.run(code=code)
+            warm.append(time.time() - start)
+    finally:
+        zygote.stop()
+    return {'cold': cold, 'zygote': warm, 'zygote_startup': zygote_startup,
+            'gui_modules': ready.get('gui_modules', [])}
+
+
+def parse_args(args=None):
+    '''Parses arguments, returns (options, args).'''
+    from argparse import ArgumentParser
+
+    if args is None:
+        args = sys.argv
+
+    parser = ArgumentParser(description='Benchmark import-only start '
+                            'latency with and without zygote mode (does not '
+                            'start MicroDrop).')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='Number of samples per mode '
+                        '(default=%(default)s).')
+    parser.add_argument('modules', nargs='*', default=list(DEFAULT_PRELOAD),
+                        help='Modules to import (default=%(default)s).')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not zygote_available():
+        print >> sys.stderr, 'Zygote mode is not supported on this platform.'
+        return 1
+    results = benchmark(args.modules, repeat=args.repeat)
+    print 'Import-only start latency (MicroDrop not started).'
+    print 'Modules: {}'.format(', '.join(args.modules))
+    print _summary('cold', results['cold'])
+    print _summary('zygote', results['zygote'])
+    print 'Zygote startup (once per launch): {:.3f} s'.format(results
+                                                             ['zygote_startup'])
+    if results['gui_modules']:
+        print >> sys.stderr, ('Warning: zygote server imported GUI modules '
+                              '({}); launcher would not use zygote mode.'
+                              .format(', '.join(results['gui_modules'])))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
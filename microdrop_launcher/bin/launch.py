@@ -1,4 +1,5 @@
 import argparse
+import functools as ft
 import logging
 import subprocess as sp
 import sys
@@ -6,8 +7,12 @@ import sys
 import mpm
 import mpm.bin
 
-from ..auto_upgrade import main as auto_upgrade
+from .. import tracing
 from ..profile import launch_profile
+from ..priority import (POLICY_NAMES, PRIORITY_ENV_VAR, set_policy,
+                        wait_for_startup)
+from ..sessions import register_session
+from ..tasks import EXIT_GRACE, TASK_TIMEOUT
 
 
 logger = logging.getLogger(__name__)
@@ -28,20 +33,101 @@ def parse_args(args=None):
     parser.add_argument('--install-plugin-requirements', action='store_true')
     parser.add_argument('--no-upgrade', action='store_true',
                         help='Do not check for package upgrade.')
+    parser.add_argument('--check-timeout', type=float, default=TASK_TIMEOUT,
+                        help='Time (in seconds) after which Conda commands of '
+                        'each background update check are killed '
+                        '(default=%(default)s).')
+    parser.add_argument('--exit-grace', type=float, default=EXIT_GRACE,
+                        help='Time (in seconds) to wait for background update '
+                        'checks after MicroDrop exits before cancelling them '
+                        '(default=%(default)s).')
+    parser.add_argument('--background-priority', choices=POLICY_NAMES,
+                        help='Scheduling priority of background update '
+                        'checks (default: `{}` environment variable, or '
+                        '`low`).'.format(PRIORITY_ENV_VAR))
+    parser.add_argument('--defer-checks', action='store_true',
+                        help='Hold back background update checks until '
+                        'MicroDrop has finished starting.')
+    parser.add_argument('--zygote', action='store_true',
+                        help='Launch (and restart) MicroDrop by forking a '
+                        'pre-initialized interpreter (not supported on '
+                        'Windows).')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Append startup phase timings to FILE in Chrome '
+                        'trace-event format (also passed to MicroDrop using '
+                        'the `{}` environment variable).'
+                        .format(tracing.TRACE_ENV_VAR))
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Profile launcher using `cProfile` and write '
+                        '`.pstats` file to launcher log directory.')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='With `--profile-startup`, also trace memory '
+                        'allocations using `tracemalloc` (if available).')
 
     return parser.parse_args()
 
 
 def main(args=None):
+    # **N.B.**, the launcher may only restart itself (e.g., after installing
+    # an upgrade) if it was started from the command line.
+    restart_argv = None
     if args is None:
         args = parse_args()
+        restart_argv = sys.argv[1:]
     args = mpm.bin.validate_args(args)
     logger.debug('Arguments: %s', args)
+    # **N.B.**, `args` may be constructed by caller without launcher options.
+    if getattr(args, 'trace', None):
+        tracing.enable(args.trace, process_name='launch-microdrop')
+
+    if getattr(args, 'profile_startup', False):
+        from ..profiling import profile_call
+
+        return profile_call(lambda: _main(args, restart_argv=restart_argv),
+                            'launch',
+                            memory=getattr(args, 'profile_memory', False))
+    return _main(args, restart_argv=restart_argv)
+
+
+def _main(args, restart_argv=None):
+    '''
+    .. versionchanged:: 0.8
+        Run update checks in the background as soon as MicroDrop is started
+        (see :func:`microdrop_launcher.tasks.start_background_checks`),
+        rather than after MicroDrop exits, and wait at most ``--exit-grace``
+        seconds for them after MicroDrop exits.
+
+        Run background update checks at ``--background-priority`` (see
+        :mod:`microdrop_launcher.priority`) and, with ``--defer-checks``,
+        hold them back until MicroDrop has finished starting.
+
+        Install ``microdrop-launcher`` upgrade staged by a previous session
+        in a helper process, then restart the launcher (see
+        :func:`microdrop_launcher.tasks.restart_launcher`).  If called with
+        pre-parsed arguments (i.e., :data:`restart_argv` is ``None``), the
+        upgrade is deferred to the next command-line launch.
+    '''
+    if getattr(args, 'background_priority', None):
+        set_policy(args.background_priority)
+    # Mark this launcher session as running, such that other launcher
+    # processes do not upgrade `microdrop-launcher` underneath it.
+    register_session()
+    if not args.no_upgrade and restart_argv is not None:
+        from ..tasks import apply_staged_launcher_upgrade, restart_launcher
+
+        # Install `microdrop-launcher` upgrade downloaded by a previous
+        # session (fast, since packages are linked from the package cache).
+        #
+        # **N.B.**, the upgrade replaces the modules of this package, so
+        # restart without importing any further modules.
+        if apply_staged_launcher_upgrade():
+            restart_launcher('microdrop_launcher.bin.launch', restart_argv)
 
     if args.install_plugin_requirements:
         # Run plugin "on_install" hook.
-        sp.call([sys.executable, '-m', 'mpm', '-d', args.plugins_directory,
-                 'hook', 'on_install'])
+        with tracing.span('install_plugin_requirements'):
+            sp.call([sys.executable, '-m', 'mpm', '-d',
+                     args.plugins_directory, 'hook', 'on_install'])
 
     if args.config_file is None:
         # No configuration file specified, so construct configuration file path
@@ -49,18 +135,46 @@ def main(args=None):
         args.config_file = (args.plugins_directory.parent
                             .joinpath('microdrop.ini'))
 
-    return_code = launch_profile(args.config_file.parent)
-
-    if not args.no_upgrade:
-        # Upgrade `microdrop-launcher` package if there is a new version
-        # available.
-        print 'Checking for `microdrop-launcher` updates',
-        upgrade_info = auto_upgrade()
-        if upgrade_info['new_version']:
-            print 'Upgraded to:', upgrade_info['new_version']
-        else:
-            print ('Up to date: microdrop-launcher=={}'
-                   .format(upgrade_info['original_version']))
+    # Perform the following tasks in the background (within this process)
+    # while MicroDrop is running:
+    #
+    #  - Cache latest `microdrop` package version
+    #  - Download `microdrop-launcher` package upgrade (installed the next
+    #    time the launcher starts)
+    checks = {}
+
+    def _start_checks(pid):
+        from ..tasks import start_background_checks
+
+        if args.no_upgrade or 'future' in checks:
+            # Checks already started (e.g., MicroDrop was restarted).
+            return
+        gate = (ft.partial(wait_for_startup, pid)
+                if getattr(args, 'defer_checks', False) else None)
+        checks['future'] = \
+            start_background_checks(gate=gate,
+                                    timeout=getattr(args, 'check_timeout',
+                                                    TASK_TIMEOUT))
+
+    return_code = launch_profile(args.config_file.parent,
+                                 zygote=getattr(args, 'zygote', False),
+                                 on_spawn=_start_checks)
+
+    if 'future' in checks:
+        # Import here, since `conda_helpers` is only needed to upgrade.
+        from ..auto_upgrade import print_upgrade_result
+        from ..tasks import wait_background_checks
+
+        future = checks['future']
+        # Bound launcher exit time, even if a check is hung (e.g., behind a
+        # captive proxy).
+        if wait_background_checks(future, grace=getattr(args, 'exit_grace',
+                                                        EXIT_GRACE)):
+            try:
+                print 'Checking for `microdrop-launcher` updates',
+                print_upgrade_result(future.result()['launcher'])
+            except Exception:
+                logger.debug('Error checking for updates.', exc_info=True)
 
     return return_code
 
@@ -1,39 +1,47 @@
-import datetime as dt
 import functools as ft
-import concurrent.futures
 import logging
-import pkg_resources
-import re
-import subprocess as sp
 import sys
 
-import gtk
-import mpm
-import mpm.bin
 import path_helpers as ph
-import pygtkhelpers.ui.dialogs as gd
-import yaml
 
+from .. import SEARCH_CACHE_TTL, tracing
 from ..dirs import AppDirs
-from ..config import create_config_directory
-from ..profile import (ICON_PATH, SAVED_COLUMNS, drop_version_errors,
-                       environment_prompt, get_major_version, import_profile,
-                       installed_major_version, launch_profile,
-                       load_profiles_info, profile_major_version,
+from ..profile import (drop_version_errors, environment_prompt, icon_path,
+                       import_profile, installed_major_version,
+                       launch_profile, load_profiles_info,
                        verify_or_create_profile_version)
+from ..registry import (SqliteProfileStore, YamlProfileStore,
+                        format_timestamp)
+from ..scanner import STATUS_UNAVAILABLE
+from ..priority import (POLICY_NAMES, PRIORITY_ENV_VAR, set_policy,
+                        wait_for_startup)
+from ..sessions import register_session
+from ..tasks import (EXIT_GRACE, TASK_TIMEOUT, apply_staged_launcher_upgrade,
+                     restart_launcher, start_background_checks,
+                     wait_background_checks)
+from ..version_context import VERSION_CONTEXT
 
 logger = logging.getLogger(__name__)
 
+# **N.B.**, `gtk`, `pygtkhelpers`, `mpm` and `concurrent.futures` are
+# imported within the functions that use them, such that, e.g., launching the
+# most recently used profile using `--default` does not load GUI modules.
+
 
 class LaunchDialog(object):
-    def __init__(self, df_profiles):
-        self.df_profiles = df_profiles
+    def __init__(self, profiles, store=None, zygote=False, on_spawn=None):
+        self.profiles = profiles
+        self.store = store
+        self.zygote = zygote
+        self.on_spawn = on_spawn
         self.content_area = None
         self.frame = None
         self.profile_row = None
         self.return_code = None
 
     def import_profile(self, folder=None):
+        import pygtkhelpers.ui.dialogs as gd
+
         # Display GTK dialog to select output directory.
         folder = gd.select_folder(folder=folder, title='Select MicroDrop '
                                   'profile directory')
@@ -47,11 +55,17 @@ class LaunchDialog(object):
             # installed MicroDrop package **do not match**.
             gd.error(str(exception))
         else:
-            self.df_profiles = import_profile(self.df_profiles, folder,
-                                              parent=self.dialog)
+            self.profiles = import_profile(self.profiles, folder,
+                                           parent=self.dialog)
+            self.save_profiles()
             self.update_profiles_frame()
 
     def create_profile(self, folder=None):
+        import gtk
+        import pygtkhelpers.ui.dialogs as gd
+
+        from ..config import create_config_directory
+
         # Display GTK dialog to select output directory.
         folder = gd.select_folder(folder=folder, title='Select new MicroDrop '
                                   'profile directory')
@@ -62,7 +76,7 @@ class LaunchDialog(object):
 
         if folder.files() or folder.dirs():
             dialog = gtk.MessageDialog(type=gtk.MESSAGE_QUESTION)
-            dialog.set_icon_from_file(ICON_PATH)
+            dialog.set_icon_from_file(icon_path())
             dialog.set_title('Confirm overwrite')
             dialog.set_markup('Directory is not empty.\n\nOverwrite?')
             dialog.add_buttons(gtk.STOCK_YES, gtk.RESPONSE_YES,
@@ -80,27 +94,31 @@ class LaunchDialog(object):
             folder.joinpath('devices').makedirs_p()
             folder.joinpath('plugins').makedirs_p()
 
-        self.df_profiles = self.df_profiles.append({'path': folder,
-                                                    'major_version':
-                                                    installed_major_version()},
-                                                   ignore_index=True)
-        self.df_profiles.drop_duplicates(subset=['path'], inplace=True)
+        self.profiles.add(folder, major_version=installed_major_version())
+        self.save_profiles()
         self.update_profiles_frame()
 
+    @tracing.span('update_profiles_frame')
     def update_profiles_frame(self):
+        import gtk
+        import pygtkhelpers.ui.dialogs as gd
+
         def on_launch_clicked(profile_row_i):
             self.dialog.hide()
             self.profile_row = profile_row_i.copy()
-            self.return_code = launch_profile_row(profile_row_i)
+            self.return_code = launch_profile_row(profile_row_i,
+                                                  zygote=self.zygote,
+                                                  on_spawn=self.on_spawn)
             if self.return_code is None:
                 self.frame = None
                 self.run()
             elif self.return_code == 0:
-                profile_row_i.used_timestamp = str(dt.datetime.now())
+                self.profiles.touch(profile_row_i.path)
+                self.save_profiles()
 
         def on_remove_clicked(profile_row_i):
             dialog = gtk.MessageDialog(type=gtk.MESSAGE_QUESTION)
-            dialog.set_icon_from_file(ICON_PATH)
+            dialog.set_icon_from_file(icon_path())
             dialog.set_title('Remove profile')
             RESPONSE_REMOVE, RESPONSE_REMOVE_WITH_DATA, RESPONSE_CANCEL = \
                 range(3)
@@ -119,7 +137,7 @@ class LaunchDialog(object):
             try:
                 if response == RESPONSE_REMOVE_WITH_DATA:
                     dialog = gtk.MessageDialog(type=gtk.MESSAGE_QUESTION)
-                    dialog.set_icon_from_file(ICON_PATH)
+                    dialog.set_icon_from_file(icon_path())
                     dialog.set_title('Confirm profile delete')
                     dialog.set_markup('Remove profile data (cannot be '
                                       'undone)?')
@@ -134,16 +152,15 @@ class LaunchDialog(object):
             except Exception, exception:
                 gd.error(str(exception))
             finally:
-                self.df_profiles = (self.df_profiles
-                                    .loc[self.df_profiles.path !=
-                                         profile_row_i.path].copy())
+                self.profiles.discard(profile_row_i.path)
+                self.save_profiles()
             self.update_profiles_frame()
 
         if self.frame is not None:
             self.content_area.remove(self.frame)
-        drop_version_errors(self.df_profiles, missing=False, mismatch=True,
+        drop_version_errors(self.profiles, missing=False, mismatch=True,
                             inplace=True)
-        self.frame = get_profiles_table(self.df_profiles, on_launch_clicked,
+        self.frame = get_profiles_table(self.profiles, on_launch_clicked,
                                         on_remove_clicked)
         self.content_area.pack_start(self.frame, expand=True, fill=True, padding=10)
         self.content_area.reorder_child(self.frame, 0)
@@ -159,8 +176,10 @@ class LaunchDialog(object):
         gtk.idle_add(_resize_dialog)
 
     def run(self):
+        import gtk
+
         self.dialog = gtk.Dialog()
-        self.dialog.set_icon_from_file(ICON_PATH)
+        self.dialog.set_icon_from_file(icon_path())
         self.dialog.set_title('MicroDrop Profile Manager')
         self.content_area = self.dialog.get_content_area()
 
@@ -169,11 +188,9 @@ class LaunchDialog(object):
         button_import = gtk.Button('_Import...')
         button_create = gtk.Button('_Create...')
         button_import.connect('clicked', lambda *args:
-                              self.import_profile(self.df_profiles
-                                                  .path.get(0)))
+                              self.import_profile(self.recent_folder()))
         button_create.connect('clicked', lambda *args:
-                              self.create_profile(self.df_profiles.path
-                                                  .get(0)))
+                              self.create_profile(self.recent_folder()))
         for button_i in (button_import, button_create):
             buttons_box.pack_end(button_i, expand=False, fill=False)
         buttons_area.pack_end(buttons_box, expand=False, fill=False)
@@ -186,9 +203,37 @@ class LaunchDialog(object):
 
         return self.profile_row
 
+    def save_profiles(self):
+        '''
+        Save changes to profile list immediately (if a profile store is set),
+        such that changes are not lost if the launcher exits abnormally.
 
-def get_profiles_table(df_profiles, launch_callback, remove_callback,
+        .. versionadded:: 0.8
+        '''
+        if self.store is None:
+            return
+        try:
+            self.store.save(self.profiles)
+        except Exception:
+            logger.error('Error saving list of profiles.', exc_info=True)
+
+    def recent_folder(self):
+        '''
+        Returns
+        -------
+        str or None
+            Path of most recently used profile (or ``None`` if there are no
+            profiles).
+        '''
+        record = self.profiles.first()
+        return None if record is None else record.path
+
+
+@tracing.span('get_profiles_table')
+def get_profiles_table(profiles, launch_callback, remove_callback,
                        short_threshold=40):
+    import gtk
+
     def short_path(path_i):
         base_i, name_i = ph.path(path_i).splitpath()
 
@@ -201,7 +246,7 @@ def get_profiles_table(df_profiles, launch_callback, remove_callback,
     # One header row plus one row per profile
     # One column for each column in `grid_columns`, plus two columns for launch
     # and remove buttons, respectively.
-    table = gtk.Table(df_profiles.shape[0] + 1, len(grid_columns) + 2)
+    table = gtk.Table(len(profiles) + 1, len(grid_columns) + 2)
 
     for i, column_i in enumerate(grid_columns):
         label_i = gtk.Label()
@@ -210,21 +255,25 @@ def get_profiles_table(df_profiles, launch_callback, remove_callback,
                      bottom_attach=1, xpadding=5, ypadding=5,
                      xoptions=gtk.SHRINK, yoptions=gtk.SHRINK)
 
-    for i, (ix, row_i) in enumerate(df_profiles.iterrows()):
+    for i, row_i in enumerate(profiles):
         row_kwargs = dict(top_attach=i + 1, bottom_attach=i + 2,
                           xpadding=5, ypadding=5,
                           xoptions=gtk.SHRINK | gtk.FILL, yoptions=gtk.SHRINK)
+        unavailable_i = (row_i.status == STATUS_UNAVAILABLE)
         for j, column_ij in enumerate(grid_columns):
             if column_ij == 'path':
                 label_ij = gtk.Label(short_path(row_i.path))
-                timestamp_str_ij = re.sub(r'\.\d+$', '',
-                                          str(row_i.used_timestamp))
+                timestamp_str_ij = format_timestamp(row_i.used_timestamp)
                 label_ij.set_tooltip_text('{}\nLast used: {}'
                                           .format(row_i.path,
                                                   timestamp_str_ij))
                 label_ij.set_alignment(0, .5)
+            elif unavailable_i:
+                # Profile path could not be probed in time (e.g., network
+                # drive is unreachable).
+                label_ij = gtk.Label(STATUS_UNAVAILABLE)
             else:
-                label_ij = gtk.Label(row_i[column_ij])
+                label_ij = gtk.Label(getattr(row_i, column_ij))
             table.attach(label_ij, left_attach=j, right_attach=j + 1,
                          **row_kwargs)
 
@@ -256,6 +305,11 @@ def get_profiles_table(df_profiles, launch_callback, remove_callback,
         button_prompt_i.connect('clicked', on_prompt_clicked)
         button_remove_i.connect('clicked', on_remove_clicked)
         # button_remove_i.connect('clicked', lambda
+        if unavailable_i:
+            # Accessing an unavailable profile may block the GUI.
+            for button_ij in (button_launch_i, button_open_i,
+                              button_prompt_i):
+                button_ij.set_sensitive(False)
         for button_ij, j in zip((button_launch_i, button_open_i,
                                  button_prompt_i, button_remove_i),
                                 range(j + 1, j + 5)):
@@ -275,13 +329,16 @@ def get_profiles_table(df_profiles, launch_callback, remove_callback,
     return frame
 
 
-def launch_profile_row(profile_row_i):
+def launch_profile_row(profile_row_i, zygote=False, on_spawn=None):
     try:
-        return_code = launch_profile(profile_row_i.path)
+        return_code = launch_profile(profile_row_i.path, zygote=zygote,
+                                     on_spawn=on_spawn)
     except Exception, exception:
+        import gtk
+
         dialog = gtk.MessageDialog(type=gtk.MESSAGE_ERROR,
                                    message_format=str(exception))
-        dialog.set_icon_from_file(ICON_PATH)
+        dialog.set_icon_from_file(icon_path())
         dialog.set_title('Error launching profile')
         dialog.add_buttons(gtk.STOCK_OK, gtk.RESPONSE_OK)
         dialog.run()
@@ -294,11 +351,12 @@ def parse_args(args=None):
     '''Parses arguments, returns (options, args).'''
     from argparse import ArgumentParser
 
+    import mpm.bin
+
     if args is None:
         args = sys.argv
 
-    major_version = get_major_version(pkg_resources
-                                      .get_distribution('microdrop').version)
+    major_version = VERSION_CONTEXT.major_version_str
     # Look up MicroDrop application directories based on major version.
     microdrop_env_dirs = AppDirs('MicroDrop', version=major_version)
     # Construct path to list of profiles based on user configuration directory.
@@ -312,6 +370,17 @@ def parse_args(args=None):
     parser.add_argument('-f', '--profiles-path', type=ph.path,
                         help='Path to profiles list (default=%(default)s)',
                         default=default_profiles_path)
+    parser.add_argument('--profiles-backend', choices=('yaml', 'sqlite'),
+                        default='yaml', help='Profiles list storage backend.  '
+                        'The `sqlite` backend imports the profiles list '
+                        'file on first use and supports concurrent updates '
+                        'from multiple launcher processes '
+                        '(default=%(default)s).')
+    parser.add_argument('--profiles-db', type=ph.path,
+                        help='Path to profiles database used by `sqlite` '
+                        'backend (default=%(default)s)',
+                        default=microdrop_env_dirs.user_config_dir
+                        .joinpath('profiles.sqlite3'))
     parser.add_argument('--default', action='store_true',
                         help='Launch most recently used profile.')
     parser.add_argument('--no-auto', action='store_true',
@@ -319,62 +388,180 @@ def parse_args(args=None):
                         'MicroDrop is launched using the profile.')
     parser.add_argument('--no-upgrade', action='store_true',
                         help='Do not check for package upgrade.')
+    parser.add_argument('--zygote', action='store_true',
+                        help='Launch (and restart) MicroDrop by forking a '
+                        'pre-initialized interpreter (not supported on '
+                        'Windows).')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Ignore cached Conda package search results when '
+                        'checking for MicroDrop updates.')
+    parser.add_argument('--cache-ttl', type=float, default=SEARCH_CACHE_TTL,
+                        help='Maximum age (in seconds) of cached Conda package '
+                        'search results (default=%(default)s).')
+    parser.add_argument('--check-timeout', type=float, default=TASK_TIMEOUT,
+                        help='Time (in seconds) after which Conda commands of '
+                        'each background update check are killed '
+                        '(default=%(default)s).')
+    parser.add_argument('--exit-grace', type=float, default=EXIT_GRACE,
+                        help='Time (in seconds) to wait for background update '
+                        'checks after MicroDrop exits before cancelling them '
+                        '(default=%(default)s).')
+    parser.add_argument('--background-priority', choices=POLICY_NAMES,
+                        help='Scheduling priority of background update '
+                        'checks (default: `{}` environment variable, or '
+                        '`low`).'.format(PRIORITY_ENV_VAR))
+    parser.add_argument('--defer-checks', action='store_true',
+                        help='Hold back background update checks until '
+                        'MicroDrop has finished starting.')
+    parser.add_argument('--trace', type=ph.path, metavar='FILE',
+                        help='Append startup phase timings to FILE in Chrome '
+                        'trace-event format (also passed to MicroDrop using '
+                        'the `{}` environment variable).'
+                        .format(tracing.TRACE_ENV_VAR))
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Profile launcher using `cProfile` and write '
+                        '`.pstats` file to launcher log directory.')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='With `--profile-startup`, also trace memory '
+                        'allocations using `tracemalloc` (if available).')
 
     args = parser.parse_args()
 
     return args
 
 
+def open_profile_store(args):
+    '''
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed command-line arguments (see :func:`parse_args`).
+
+    Returns
+    -------
+    YamlProfileStore or SqliteProfileStore
+        Profile store for backend selected by ``--profiles-backend``.
+
+
+    .. versionadded:: 0.8
+    '''
+    if args.profiles_backend == 'sqlite':
+        return SqliteProfileStore(args.profiles_db,
+                                  yaml_path=args.profiles_path)
+    return YamlProfileStore(args.profiles_path)
+
+
 def main():
+    '''
+    .. versionchanged:: 0.8
+        Add ``--profile-startup`` option (see
+        :func:`microdrop_launcher.profiling.profile_call`).
+    '''
     args = parse_args()
     logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    if args.trace:
+        tracing.enable(args.trace, process_name='microdrop-profile-manager')
+
+    if args.profile_startup:
+        from ..profiling import profile_call
+
+        return profile_call(lambda: _main(args), 'profile_launcher',
+                            memory=args.profile_memory)
+    return _main(args)
+
+
+def _main(args):
+    '''
+    .. versionchanged:: 0.8
+        Run background update checks in a daemon thread with per-task
+        deadlines, and wait at most ``--exit-grace`` seconds for them after
+        MicroDrop exits (see
+        :func:`microdrop_launcher.tasks.wait_background_checks`).
+
+        Install ``microdrop-launcher`` upgrade staged by a previous session
+        in a helper process (see
+        :func:`microdrop_launcher.tasks.apply_staged_launcher_upgrade`)
+        before launching, then restart the launcher, rather than installing
+        upgrades at exit.
+
+        Run background update checks at ``--background-priority`` (see
+        :mod:`microdrop_launcher.priority`) and, with ``--defer-checks``,
+        start them once MicroDrop has finished starting.
+    '''
+    import concurrent.futures
+
+    if args.background_priority:
+        set_policy(args.background_priority)
+
+    # Mark this launcher session as running, such that other launcher
+    # processes do not upgrade `microdrop-launcher` underneath it.
+    register_session()
+    # **N.B.**, the staged upgrade is installed in a helper process and
+    # replaces the modules of this package, so restart without importing any
+    # further modules.
+    if not args.no_upgrade and apply_staged_launcher_upgrade():
+        restart_launcher('microdrop_launcher.bin.profile_launcher',
+                         sys.argv[1:])
 
     # Load list of profiles from file.
     #
     # If file does not exist or list is empty, the profile list is initialized
     # with the default profile directory path.
-    df_profiles = load_profiles_info(args.profiles_path)
-    drop_version_errors(df_profiles, missing=False, mismatch=True,
-                        inplace=True)
-
-    # Save most recent list of profiles to disk.
-    with args.profiles_path.open('w') as output:
-        profiles_str = yaml.dump(df_profiles[SAVED_COLUMNS].astype(str)
-                                 .to_dict('records'), default_flow_style=False)
-        output.write(profiles_str)
+    store = open_profile_store(args)
+    with tracing.span('load_profiles_info'):
+        profiles = load_profiles_info(args.profiles_path, store=store)
+    with tracing.span('drop_version_errors'):
+        drop_version_errors(profiles, missing=False, mismatch=True,
+                            inplace=True)
 
-    # Look up major version of each profile.
-    df_profiles['major_version'] = df_profiles.path.map(profile_major_version)
+    # Save most recent list of profiles to disk (including cached
+    # `RELEASE-VERSION` info of each profile).
+    #
+    # **N.B.**, only changes are written (YAML file is only written if
+    # contents have changed; only changed rows are written to database).
+    with tracing.span('save_profiles'):
+        store.save(profiles)
 
-    # Perform the following tasks in the background:
+    # Perform the following tasks in the background (within this process):
     #
-    #  - Upgrade `microdrop-launcher` package
     #  - Cache latest `microdrop` package version
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        def _auto_upgrade():
-            process = sp.Popen([sys.executable, '-m',
-                                'microdrop_launcher.auto_upgrade'])
-
-            return process.communicate()
-
-        def _cache_latest_microdrop_version():
-            process = sp.Popen([sys.executable, '-m',
-                                'microdrop_launcher.microdrop_version'])
+    #  - Download `microdrop-launcher` package upgrade (installed at next
+    #    start)
+    checks = {}
 
-            return process.communicate()
-
-        def _launch(args, df_profiles):
-            if args.default or (not args.no_auto and df_profiles.shape[0] == 1):
+    def _start_checks(pid=None):
+        if args.no_upgrade or 'future' in checks:
+            # Checks already started (e.g., MicroDrop was restarted).
+            return
+        # Hold back checks until MicroDrop has loaded its plugins.
+        gate = ft.partial(wait_for_startup, pid) if pid is not None else None
+        checks['future'] = start_background_checks(gate=gate,
+                                                   refresh=args.refresh,
+                                                   ttl=args.cache_ttl,
+                                                   timeout=args.check_timeout)
+
+    if not args.defer_checks:
+        _start_checks()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        @tracing.span('_launch')
+        def _launch(args, profiles):
+            if args.default or (not args.no_auto and len(profiles) == 1):
                 # Launch MicroDrop with most recently used (or only available) profile.
-                return_code = launch_profile_row(df_profiles.iloc[0])
+                profile_row = profiles.first()
+                return_code = launch_profile_row(profile_row,
+                                                 zygote=args.zygote,
+                                                 on_spawn=_start_checks)
                 if return_code == 0:
-                    df_profiles.used_timestamp[0] = str(dt.datetime.now())
+                    profiles.touch(profile_row.path)
             else:
                 # Display dialog to manage profiles or launch a profile.
-                launch_dialog = LaunchDialog(df_profiles)
+                launch_dialog = LaunchDialog(profiles, store=store,
+                                             zygote=args.zygote,
+                                             on_spawn=_start_checks)
                 launch_dialog.run()
                 return_code = launch_dialog.return_code
-                df_profiles = launch_dialog.df_profiles
+                profiles = launch_dialog.profiles
 
             # Save most recent list of profiles to disk (most recently used first).
             #
@@ -382,29 +569,16 @@ def main():
             #  - Creating a new profile.
             #  - Importing a profile.
             #  - Updating used timestamp by launching a profile.
-            df_profiles = df_profiles.astype(str)
-            df_profiles.loc[df_profiles.used_timestamp == 'nan',
-                            'used_timestamp'] = ''
-            df_profiles.sort_values('used_timestamp', ascending=False,
-                                    inplace=True)
-
-            with args.profiles_path.open('w') as output:
-                profiles_str = yaml.dump(df_profiles[SAVED_COLUMNS]
-                                        .to_dict('records'),
-                                         default_flow_style=False)
-                output.write(profiles_str)
+            store.save(profiles)
             return return_code
 
-        futures = []
-        if not args.no_upgrade:
-            upgrade_future = executor.submit(_auto_upgrade)
-            microdrop_version_future = \
-                executor.submit(_cache_latest_microdrop_version)
-            futures.extend([upgrade_future, microdrop_version_future])
-        launch_future = executor.submit(_launch, args, df_profiles)
-        futures.append(launch_future)
-        concurrent.futures.wait(futures)
-        return launch_future.result()
+        return_code = executor.submit(_launch, args, profiles).result()
+
+    if 'future' in checks:
+        # Bound launcher exit time, even if a check is hung (e.g., behind a
+        # captive proxy).
+        wait_background_checks(checks['future'], grace=args.exit_grace)
+    return return_code
 
 
 if __name__ == '__main__':
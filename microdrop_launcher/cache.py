@@ -0,0 +1,144 @@
+'''
+Persistent cache of JSON-serializable values stored in the launcher user cache
+directory.
+
+Each cached value is stored in its own file, along with the time the value was
+written, such that stale values may be detected using a time-to-live (TTL).
+
+.. versionadded:: 0.8
+'''
+import hashlib
+import json
+import logging
+import time
+
+from .dirs import AppDirs
+
+logger = logging.getLogger(__name__)
+
+
+def cache_directory():
+    '''
+    Returns
+    -------
+    path_helpers.path
+        Launcher user cache directory.
+    '''
+    return AppDirs('microdrop-launcher').user_cache_dir
+
+
+def cache_key(*parts):
+    '''
+    Parameters
+    ----------
+    *parts
+        JSON-serializable values identifying a cached item, e.g., a list of
+        Conda channels and a package name.
+
+    Returns
+    -------
+    str
+        Short digest suitable for use in a file name.
+    '''
+    return hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()[:16]
+
+
+def cache_path(namespace, key):
+    '''
+    Parameters
+    ----------
+    namespace : str
+        Cache namespace (used as file name prefix).
+    key : str
+        Key within namespace (see :func:`cache_key`).
+
+    Returns
+    -------
+    path_helpers.path
+        Path to file containing cached value.
+    '''
+    return cache_directory().joinpath('{}-{}.json'.format(namespace, key))
+
+
+def load_cached(namespace, key, ttl=None):
+    '''
+    Parameters
+    ----------
+    namespace : str
+        Cache namespace.
+    key : str
+        Key within namespace (see :func:`cache_key`).
+    ttl : float, optional
+        Maximum age of cached value (in seconds).
+
+        If ``None``, cached value never expires.
+
+    Returns
+    -------
+    object
+        Cached value, or ``None`` if no value is cached, the cached value has
+        expired, or the cache file could not be read.
+    '''
+    path = cache_path(namespace, key)
+    if not path.isfile():
+        return None
+    try:
+        with path.open('r') as input_:
+            cached = json.load(input_)
+        timestamp = cached['timestamp']
+        value = cached['value']
+    except Exception:
+        logger.debug('Error reading cache file `%s`.', path, exc_info=True)
+        return None
+    if ttl is not None and not (0 <= time.time() - timestamp <= ttl):
+        logger.debug('Cached value in `%s` has expired.', path)
+        return None
+    return value
+
+
+def save_cached(namespace, key, value):
+    '''
+    Parameters
+    ----------
+    namespace : str
+        Cache namespace.
+    key : str
+        Key within namespace (see :func:`cache_key`).
+    value : object
+        JSON-serializable value to cache.
+
+    Returns
+    -------
+    path_helpers.path
+        Path to file containing cached value.
+    '''
+    path = cache_path(namespace, key)
+    path.parent.makedirs_p()
+    with path.open('w') as output:
+        json.dump({'timestamp': time.time(), 'value': value}, output)
+    return path
+
+
+def invalidate(namespace, key=None):
+    '''
+    Remove cached value(s).
+
+    Parameters
+    ----------
+    namespace : str
+        Cache namespace.
+    key : str, optional
+        Key within namespace.  If ``None``, all values within namespace are
+        removed.
+    '''
+    if key is None:
+        paths = cache_directory().glob('{}-*.json'.format(namespace))
+    else:
+        paths = [cache_path(namespace, key)]
+    for path_i in paths:
+        try:
+            if path_i.isfile():
+                path_i.remove()
+        except Exception:
+            logger.debug('Error removing cache file `%s`.', path_i,
+                         exc_info=True)
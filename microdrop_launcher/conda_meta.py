@@ -0,0 +1,212 @@
+'''
+Read installed package versions directly from Conda environment metadata.
+
+Conda records each package installed in an environment as a
+``<prefix>/conda-meta/<name>-<version>-<build>.json`` file.  Listing the file
+names is much faster than running ``conda list`` (or resolving the
+distribution using the Conda solver).
+
+The resulting index is cached in memory and in the launcher cache directory,
+and is rebuilt whenever ``<prefix>/conda-meta/history`` is modified (i.e.,
+whenever packages are installed or removed).
+
+.. versionadded:: 0.8
+'''
+import logging
+import os
+import threading
+
+import path_helpers as ph
+
+from .cache import cache_key, load_cached, save_cached
+
+logger = logging.getLogger(__name__)
+
+# In-process index per ``conda-meta`` directory, i.e.,
+# `{<conda-meta path>: (<history mtime>, <index>)}`.
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def split_dist_name(dist_name):
+    '''
+    Parameters
+    ----------
+    dist_name : str
+        Conda distribution name, e.g., ``"microdrop-launcher-0.7.11-py27_0"``.
+
+    Returns
+    -------
+    tuple
+        ``(name, version, build)``, e.g., ``("microdrop-launcher", "0.7.11",
+        "py27_0")``.
+
+    Raises
+    ------
+    ValueError
+        If :data:`dist_name` is not of the form
+        ``<name>-<version>-<build>``.
+    '''
+    name, version, build = dist_name.rsplit('-', 2)
+    return name, version, build
+
+
+def conda_meta_dir(prefix=None):
+    '''
+    Parameters
+    ----------
+    prefix : str, optional
+        Conda environment prefix (default: active Conda environment).
+
+    Returns
+    -------
+    path_helpers.path or None
+        Path to ``conda-meta`` directory, or ``None`` if not running in a
+        Conda environment.
+    '''
+    if prefix is None:
+        import conda_helpers as ch
+
+        prefix = ch.conda_prefix()
+        if prefix is None:
+            return None
+    return ph.path(prefix).joinpath('conda-meta')
+
+
+def history_mtime(prefix=None):
+    '''
+    Parameters
+    ----------
+    prefix : str, optional
+        Conda environment prefix (default: active Conda environment).
+
+    Returns
+    -------
+    float or None
+        Modified time of ``<prefix>/conda-meta/history``, i.e., the last time
+        the packages in the Conda environment changed, or ``None`` if not
+        running in a Conda environment.
+    '''
+    meta_dir = conda_meta_dir(prefix)
+    if meta_dir is None:
+        return None
+    try:
+        return os.path.getmtime(meta_dir.joinpath('history'))
+    except OSError:
+        return None
+
+
+def _build_index(meta_dir):
+    index = {}
+    for file_name_i in os.listdir(meta_dir):
+        if not file_name_i.endswith('.json'):
+            continue
+        dist_name_i = file_name_i[:-len('.json')]
+        try:
+            name_i, version_i, build_i = split_dist_name(dist_name_i)
+        except ValueError:
+            continue
+        index[name_i] = {'name': name_i, 'version': version_i,
+                         'build': build_i, 'build_string': build_i,
+                         'dist_name': dist_name_i}
+    return index
+
+
+def conda_meta_index(prefix=None):
+    '''
+    Parameters
+    ----------
+    prefix : str, optional
+        Conda environment prefix (default: active Conda environment).
+
+    Returns
+    -------
+    dict
+        Mapping from package name to installed package info (see
+        :func:`installed_package`).  Empty if not running in a Conda
+        environment.
+    '''
+    meta_dir = conda_meta_dir(prefix)
+    if meta_dir is None:
+        return {}
+    mtime = history_mtime(meta_dir.parent)
+    key = str(meta_dir)
+
+    with _index_lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        disk_key = cache_key(key)
+        disk_cached = load_cached('conda-meta', disk_key)
+        if (disk_cached is not None and mtime is not None and
+                disk_cached.get('history_mtime') == mtime):
+            index = disk_cached['packages']
+        else:
+            try:
+                index = _build_index(meta_dir)
+            except OSError:
+                logger.debug('Error listing `%s`.', meta_dir, exc_info=True)
+                return {}
+            if mtime is not None:
+                try:
+                    save_cached('conda-meta', disk_key,
+                                {'history_mtime': mtime, 'packages': index})
+                except Exception:
+                    logger.debug('Error caching `%s` index.', meta_dir,
+                                 exc_info=True)
+        _indexes[key] = (mtime, index)
+        return index
+
+
+def installed_package(package_name, prefix=None):
+    '''
+    Parameters
+    ----------
+    package_name : str
+        Conda package name.
+    prefix : str, optional
+        Conda environment prefix (default: active Conda environment).
+
+    Returns
+    -------
+    dict or None
+        Installed package information with the keys ``name``, ``version``,
+        ``build`` (also available as ``build_string``) and ``dist_name`` (or
+        ``None`` if package is not installed).
+    '''
+    return conda_meta_index(prefix).get(package_name)
+
+
+def package_version(package_name, prefix=None):
+    '''
+    In-process equivalent of :func:`conda_helpers.package_version` (which runs
+    ``conda list``).
+
+    Parameters
+    ----------
+    package_name : str or list
+        Conda package name(s).
+    prefix : str, optional
+        Conda environment prefix (default: active Conda environment).
+
+    Returns
+    -------
+    dict or list
+        Installed package information (see :func:`installed_package`), or
+        list of package information if :data:`package_name` is a list.
+
+    Raises
+    ------
+    NameError
+        If package is not installed.
+    '''
+    single = isinstance(package_name, basestring)
+    package_names = [package_name] if single else package_name
+    index = conda_meta_index(prefix)
+    missing = [name_i for name_i in package_names if name_i not in index]
+    if missing:
+        raise NameError('Package(s) `{}` not installed.'
+                        .format(', '.join(missing)))
+    packages = [index[name_i] for name_i in package_names]
+    return packages[0] if single else packages
@@ -0,0 +1,468 @@
+'''
+Incremental reader for Conda ``--json`` command output.
+
+Conda writes download progress events (one JSON object per line, each
+terminated by a null character) and, on Windows, `menuinst` log messages to
+standard output *in addition to* the final JSON response document.
+
+:class:`CondaOutputReader` classifies each line as it arrives, such that
+progress may be reported while Conda is still running and the final document
+is decoded without re-scanning the whole output log.
+
+Each Conda command is started in its own process group, such that a hung
+command (e.g., behind a captive proxy) may be killed along with any processes
+it started, either when the :class:`deadline` of the calling task expires or
+when the launcher exits (see :func:`cancel_commands`).
+
+.. versionadded:: 0.8
+'''
+import json
+import logging
+import os
+import signal
+import subprocess as sp
+import threading
+import time
+
+from . import priority
+
+logger = logging.getLogger(__name__)
+
+
+class CondaError(RuntimeError):
+    '''
+    Conda command failed.
+
+    Message includes the Conda exception name (e.g., ``CondaHTTPError``), if
+    available.
+
+    Attributes
+    ----------
+    returncode : int
+        Conda process exit code.
+    document : dict or None
+        Decoded JSON response document (if any).
+    '''
+    def __init__(self, message, returncode=None, document=None):
+        super(CondaError, self).__init__(message)
+        self.returncode = returncode
+        self.document = document
+
+
+class CondaTimeout(CondaError):
+    '''
+    Conda command was cancelled, e.g., because the deadline of the calling
+    task expired (see :class:`deadline`).
+    '''
+    pass
+
+
+_local = threading.local()
+#: Running Conda processes, mapped to ``(args, cancellable)``.
+_active = {}
+_active_lock = threading.Lock()
+#: Set by :func:`cancel_commands`.
+_cancelled = threading.Event()
+
+
+class deadline(object):
+    '''
+    Cancel Conda commands run by the current thread (see :func:`stream_conda`)
+    once :data:`timeout` has elapsed.
+
+    Deadlines nest; an inner deadline never extends an enclosing deadline.
+
+    Example:
+
+        >>> with deadline(60) as deadline_:
+        ...     stream_conda('search', '--json', 'microdrop')
+        >>> deadline_.expired
+        False
+
+    Parameters
+    ----------
+    timeout : float or None
+        Time (in seconds) until deadline.  If ``None``, only the enclosing
+        deadline (if any) applies.
+
+    Attributes
+    ----------
+    expired : bool
+        ``True`` if a Conda command was cancelled within this deadline.
+    '''
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.end = None
+        self.expired = False
+        self._parent = None
+
+    def __enter__(self):
+        self._parent = getattr(_local, 'deadline', None)
+        if self.timeout is not None:
+            self.end = time.time() + self.timeout
+        if self._parent is not None and self._parent.end is not None:
+            self.end = (self._parent.end if self.end is None
+                        else min(self.end, self._parent.end))
+        _local.deadline = self
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        _local.deadline = self._parent
+        return False
+
+    def remaining(self):
+        '''
+        Returns
+        -------
+        float or None
+            Time (in seconds) until deadline (or ``None`` if no deadline).
+        '''
+        if self.end is None:
+            return None
+        return max(0, self.end - time.time())
+
+    def _expire(self):
+        deadline_ = self
+        while deadline_ is not None:
+            deadline_.expired = True
+            deadline_ = deadline_._parent
+
+
+def _process_group_kwargs(policy=None):
+    if os.name == 'nt':
+        flags = getattr(sp, 'CREATE_NEW_PROCESS_GROUP', 0x200)
+        if policy is not None:
+            flags |= policy.creationflags
+        return {'creationflags': flags}
+
+    def _preexec():
+        os.setsid()
+        if policy is not None:
+            policy.preexec()
+    return {'preexec_fn': _preexec}
+
+
+def kill_process_group(process):
+    '''
+    Kill process and any processes it started.
+
+    The ``cancelled`` attribute of :data:`process` is set only if the process
+    was still running and the kill was sent, such that a command that has
+    already finished is never reported as cancelled.
+
+    Parameters
+    ----------
+    process : subprocess.Popen
+        Process started in a new process group (see :func:`stream_conda`).
+
+    Returns
+    -------
+    bool
+        ``True`` if the kill was sent.
+    '''
+    if process.poll() is not None:
+        return False
+    try:
+        if os.name == 'nt':
+            with open(os.devnull, 'wb') as devnull:
+                if sp.call(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           stdout=devnull, stderr=devnull) != 0:
+                    return False
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        logger.debug('Error killing process %s.', process.pid, exc_info=True)
+        return False
+    process.cancelled = True
+    return True
+
+
+def active_commands():
+    '''
+    Returns
+    -------
+    list
+        ``(args, cancellable)`` of each running Conda command.
+    '''
+    with _active_lock:
+        return _active.values()
+
+
+def cancel_commands():
+    '''
+    Kill all running cancellable Conda commands (e.g., at launcher exit).
+
+    Cancellable Conda commands started afterwards fail immediately.
+
+    Returns
+    -------
+    int
+        Number of commands cancelled.
+    '''
+    with _active_lock:
+        _cancelled.set()
+        processes = [process_i for process_i, (args_i, cancellable_i)
+                     in _active.iteritems() if cancellable_i]
+    return sum(kill_process_group(process_i) for process_i in processes)
+
+
+def _progress_event(fragment):
+    '''
+    Returns
+    -------
+    dict or None
+        Decoded progress event, e.g.,
+        ``{"maxval": 133256, "finished": false, "fetch": "microdrop-laun",
+        "progress": 0}``, or ``None`` if :data:`fragment` is not a progress
+        event.
+    '''
+    if not (fragment.startswith('{') and fragment.endswith('}') and
+            '"maxval"' in fragment):
+        return None
+    try:
+        event = json.loads(fragment)
+    except ValueError:
+        return None
+    if isinstance(event, dict) and 'maxval' in event and 'progress' in event:
+        return event
+    return None
+
+
+class CondaOutputReader(object):
+    '''
+    Classify lines of Conda ``--json`` output in a single pass.
+
+    Parameters
+    ----------
+    on_progress : callable, optional
+        Called with each decoded progress event (see :func:`_progress_event`).
+    on_message : callable, optional
+        Called with each log message line (e.g., `menuinst` ``INFO``
+        messages; see `menuinst issue #49`__).
+
+    __ https://github.com/ContinuumIO/menuinst/issues/49
+    '''
+    def __init__(self, on_progress=None, on_message=None):
+        self.on_progress = on_progress
+        self.on_message = on_message
+        self._document_lines = []
+
+    def feed_line(self, line):
+        '''
+        Parameters
+        ----------
+        line : str
+            Line of Conda output.
+        '''
+        # Progress events are terminated by null characters, and more than
+        # one event may appear on a single line.
+        for fragment_i in line.split('\x00'):
+            stripped_i = fragment_i.strip()
+            if not stripped_i:
+                continue
+            if not self._document_lines:
+                if stripped_i.startswith('INFO'):
+                    if self.on_message is not None:
+                        self.on_message(stripped_i)
+                    continue
+                event_i = _progress_event(stripped_i)
+                if event_i is not None:
+                    if self.on_progress is not None:
+                        self.on_progress(event_i)
+                    continue
+            elif stripped_i.startswith('INFO'):
+                # `menuinst` messages may be written at any time.
+                if self.on_message is not None:
+                    self.on_message(stripped_i)
+                continue
+            self._document_lines.append(fragment_i)
+
+    def feed(self, lines):
+        '''
+        Parameters
+        ----------
+        lines : iterable
+            Lines of Conda output.
+
+        Returns
+        -------
+        CondaOutputReader
+            This reader.
+        '''
+        for line_i in lines:
+            self.feed_line(line_i)
+        return self
+
+    @property
+    def text(self):
+        '''
+        Output text remaining after removing progress events and messages.
+        '''
+        return '\n'.join(self._document_lines)
+
+    def document(self):
+        '''
+        Returns
+        -------
+        object
+            Decoded JSON response document.
+
+        Raises
+        ------
+        ValueError
+            If remaining output is not a valid JSON document.
+        '''
+        return json.loads(self.text)
+
+
+def stream_conda(*args, **kwargs):
+    '''
+    Run Conda command with ``--json`` output, reporting progress as output
+    arrives.
+
+    Parameters
+    ----------
+    *args
+        Conda command-line arguments, e.g., ``'install', '--json',
+        'microdrop-launcher'``.
+    on_progress : callable, optional
+        See :class:`CondaOutputReader`.
+    on_message : callable, optional
+        See :class:`CondaOutputReader`.
+    timeout : float, optional
+        Time (in seconds) after which the command is killed.  The
+        :class:`deadline` of the calling thread (if any) also applies.
+    cancellable : bool, optional
+        If ``False``, the command is never killed (e.g., ``conda install``,
+        which may leave the environment in an inconsistent state if
+        interrupted).
+    low_priority : bool, optional
+        If ``True``, run command at reduced CPU and I/O priority, according
+        to the background priority policy (see
+        :func:`microdrop_launcher.priority.get_policy`).  By default, only
+        commands run by background threads (see
+        :func:`microdrop_launcher.priority.enter_background`) run at reduced
+        priority.
+    on_start : callable, optional
+        Called with the :class:`subprocess.Popen` object once the process has
+        started, e.g., to cancel the command using
+        :func:`kill_process_group`.
+
+    Returns
+    -------
+    object
+        Decoded JSON response document.
+
+    Raises
+    ------
+    CondaTimeout
+        If the command was killed before it finished.
+    CondaError
+        If Conda exits with a non-zero return code.
+    ValueError
+        If output is not a valid JSON document (the remaining output text is
+        available as the ``text`` attribute of the exception).
+    '''
+    import conda_helpers as ch
+
+    reader = CondaOutputReader(on_progress=kwargs.pop('on_progress', None),
+                               on_message=kwargs.pop('on_message', None))
+    timeout = kwargs.pop('timeout', None)
+    cancellable = kwargs.pop('cancellable', True)
+    low_priority = kwargs.pop('low_priority', None)
+    on_start = kwargs.pop('on_start', None)
+    if kwargs:
+        raise TypeError('Unexpected keyword argument(s): {}'
+                        .format(', '.join(kwargs)))
+    if low_priority is None:
+        low_priority = priority.is_background()
+
+    if cancellable:
+        if _cancelled.is_set():
+            raise CondaTimeout('Cancelled `conda {}`.'
+                               .format(' '.join(args)))
+        deadline_ = getattr(_local, 'deadline', None)
+    else:
+        deadline_ = timeout = None
+    if deadline_ is not None and deadline_.remaining() is not None:
+        timeout = (deadline_.remaining() if timeout is None
+                   else min(timeout, deadline_.remaining()))
+    if timeout is not None and timeout <= 0:
+        if deadline_ is not None:
+            deadline_._expire()
+        raise CondaTimeout('Deadline expired before `conda {}`.'
+                           .format(' '.join(args)))
+
+    process = sp.Popen([ch.conda_executable()] + list(args), stdout=sp.PIPE,
+                       stderr=sp.PIPE, stdin=sp.PIPE,
+                       **_process_group_kwargs(priority.get_policy()
+                                               if low_priority
+                                               else None))
+    process.stdin.close()
+    with _active_lock:
+        _active[process] = (args, cancellable)
+        # Commands may have been cancelled while starting the process.
+        cancel = cancellable and _cancelled.is_set()
+    if cancel:
+        kill_process_group(process)
+
+    timer = None
+    try:
+        if on_start is not None:
+            on_start(process)
+        if timeout is not None:
+            timer = threading.Timer(timeout, kill_process_group, [process])
+            timer.daemon = True
+            timer.start()
+
+        # Drain standard error in the background to prevent the process from
+        # blocking on a full pipe.
+        stderr_chunks = []
+        stderr_thread = threading.Thread(target=lambda:
+                                         stderr_chunks.append(process.stderr
+                                                              .read()))
+        stderr_thread.daemon = True
+        stderr_thread.start()
+
+        # **N.B.**, use `readline` rather than iterating over the file, since
+        # file iteration uses a read-ahead buffer (which would delay progress
+        # events).
+        for line_i in iter(process.stdout.readline, ''):
+            reader.feed_line(line_i.rstrip('\r\n'))
+        returncode = process.wait()
+        stderr_thread.join()
+        stderr = ''.join(stderr_chunks)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        with _active_lock:
+            _active.pop(process, None)
+
+    # **N.B.**, the kill may race with the process exiting on its own, so a
+    # command that exited successfully is never treated as cancelled.
+    if getattr(process, 'cancelled', False) and returncode != 0:
+        if deadline_ is not None:
+            deadline_._expire()
+        raise CondaTimeout('Cancelled `conda {}`.'.format(' '.join(args)),
+                           returncode=returncode)
+
+    try:
+        document = reader.document()
+    except ValueError, exception:
+        if returncode != 0:
+            raise CondaError('Error executing `conda {}`:\n{}\n{}'
+                             .format(' '.join(args), reader.text, stderr),
+                             returncode=returncode)
+        exception.text = reader.text
+        raise
+    if returncode != 0:
+        if isinstance(document, dict):
+            detail = '{}: {}'.format(document.get('exception_name'),
+                                     document.get('message') or
+                                     document.get('error'))
+        else:
+            detail = reader.text
+        raise CondaError('Error executing `conda {}`: {}'
+                         .format(' '.join(args), detail),
+                         returncode=returncode, document=document)
+    return document
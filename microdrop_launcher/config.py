@@ -10,6 +10,8 @@ from configobj import ConfigObj
 import jinja2
 import path_helpers as ph
 
+from .version_context import VERSION_CONTEXT
+
 
 # Batch file template.
 launcher_template = '''
@@ -236,12 +238,12 @@ def create_config_directory(output_dir, overwrite=False):
     release_version_path = output_dir.joinpath('RELEASE-VERSION')
     with release_version_path.open('w') as output:
         try:
-            microdrop_dist = pkg_resources.get_distribution('microdrop')
+            microdrop_version = VERSION_CONTEXT.version
         except Exception:
             print >> sys.stderr, ('[warning] could not find microdrop '
                                   'distribution.')
         else:
-            output.write(microdrop_dist.version)
+            output.write(microdrop_version)
 
     return launcher_path
 
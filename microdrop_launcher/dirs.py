@@ -1,11 +1,13 @@
 import appdirs
 import path_helpers as ph
 
-from conda_helpers import conda_prefix
 
 class AppDirs(appdirs.AppDirs):
     """Convenience wrapper for getting application dirs."""
     def __init__(self, *args, **kwargs):
+        # Import here to avoid loading `conda_helpers` at module load.
+        from conda_helpers import conda_prefix
+
         self.conda_prefix = conda_prefix()
         super(AppDirs, self).__init__(*args, **kwargs)
 
@@ -0,0 +1,239 @@
+'''
+File helpers: atomic writes, inter-process file locks and (C-accelerated, if
+available) YAML serialization.
+
+.. versionadded:: 0.8
+'''
+import logging
+import os
+import platform
+import stat
+import tempfile
+import time
+
+import path_helpers as ph
+
+logger = logging.getLogger(__name__)
+
+
+def replace_file(source, destination):
+    '''
+    Rename :data:`source` to :data:`destination`, atomically replacing
+    :data:`destination` if it exists.
+
+    Equivalent to :func:`os.replace` (not available in Python 2).
+
+    Parameters
+    ----------
+    source : str
+        Path to source file.
+    destination : str
+        Path to destination file (must be on the same volume as
+        :data:`source`).
+    '''
+    if platform.system() == 'Windows':
+        import ctypes
+
+        MOVEFILE_REPLACE_EXISTING = 0x1
+        MOVEFILE_WRITE_THROUGH = 0x8
+        flags = MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(source),
+                                                  unicode(destination),
+                                                  flags):
+            raise ctypes.WinError()
+    else:
+        os.rename(source, destination)
+
+
+def _file_mode(path):
+    '''
+    Returns
+    -------
+    int
+        Permission bits of :data:`path` if it exists, otherwise default
+        permission bits of a new file (i.e., ``0666`` masked by the process
+        umask).
+    '''
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        # **N.B.**, the umask can only be read by setting it.
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0666 & ~umask
+
+
+def atomic_write(path, data):
+    '''
+    Write data to file such that readers (and the file after a crash) see
+    either the previous or the new contents, never a truncated file.
+
+    Data is written to a temporary file in the same directory, flushed to
+    disk, and then renamed over :data:`path` (see :func:`replace_file`).
+    On POSIX, the permissions of an existing file are preserved (new files
+    are created with the usual permissions, rather than the ``0600`` of
+    :func:`tempfile.mkstemp`).
+
+    Parameters
+    ----------
+    path : str
+        Output file path.
+    data : str
+        File contents.
+    '''
+    path = ph.path(path)
+    path.parent.makedirs_p()
+    fd, temp_path = tempfile.mkstemp(prefix='.{}-'.format(path.name),
+                                     suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            if platform.system() != 'Windows':
+                os.fchmod(output.fileno(), _file_mode(path))
+            output.write(data)
+            output.flush()
+            os.fsync(output.fileno())
+        replace_file(temp_path, path)
+    except:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class FileLock(object):
+    '''
+    Exclusive advisory lock on a file, shared by all processes that use the
+    same lock file path (e.g., concurrent launcher processes).
+
+    Uses :func:`fcntl.flock` on POSIX and :func:`msvcrt.locking` on Windows.
+    The lock is released if the holding process exits.
+
+    Example:
+
+        >>> with FileLock('version-cache.yml.lock'):
+        ...     ...
+
+    Parameters
+    ----------
+    path : str
+        Lock file path (created if necessary; never removed, since removing
+        a lock file while another process waits on it is racy).
+    timeout : float, optional
+        Time (in seconds) to wait for the lock.  If ``None``, wait
+        indefinitely.  If 0, fail immediately if the lock is held.
+    poll_interval : float, optional
+        Time (in seconds) between attempts to acquire the lock.
+    '''
+    def __init__(self, path, timeout=10., poll_interval=.05):
+        self.path = ph.path(path)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    @property
+    def locked(self):
+        '''
+        ``True`` if lock is held by this object.
+        '''
+        return self._file is not None
+
+    def _try_lock(self, file_):
+        if platform.system() == 'Windows':
+            import msvcrt
+
+            file_.seek(0)
+            try:
+                msvcrt.locking(file_.fileno(), msvcrt.LK_NBLCK, 1)
+            except IOError:
+                return False
+        else:
+            import errno
+            import fcntl
+
+            try:
+                fcntl.flock(file_.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError, exception:
+                if exception.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                return False
+        return True
+
+    def acquire(self):
+        '''
+        Raises
+        ------
+        IOError
+            If lock could not be acquired within :attr:`timeout`.
+        '''
+        if self._file is not None:
+            raise RuntimeError('Lock `{}` already held.'.format(self.path))
+        self.path.parent.makedirs_p()
+        file_ = open(self.path, 'a+b')
+        start = time.time()
+        try:
+            while not self._try_lock(file_):
+                if (self.timeout is not None and
+                        time.time() - start >= self.timeout):
+                    raise IOError('Timed out waiting for lock `{}`.'
+                                  .format(self.path))
+                time.sleep(self.poll_interval)
+        except:
+            file_.close()
+            raise
+        self._file = file_
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if platform.system() == 'Windows':
+                import msvcrt
+
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.release()
+        return False
+
+
+def yaml_load(data):
+    '''
+    Parse YAML document, using the C-accelerated loader if available.
+
+    Documents containing Python-specific tags (e.g., written by earlier
+    launcher versions using :func:`yaml.dump`) are loaded using the full
+    loader as a fallback.
+    '''
+    import yaml
+
+    SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    try:
+        return yaml.load(data, Loader=SafeLoader)
+    except yaml.constructor.ConstructorError:
+        Loader = getattr(yaml, 'CLoader', yaml.Loader)
+        return yaml.load(data, Loader=Loader)
+
+
+def yaml_dump(data, stream=None, **kwargs):
+    '''
+    Serialize data as YAML, using the C-accelerated dumper if available.
+
+    Keyword arguments are passed to :func:`yaml.dump`.
+    '''
+    import yaml
+
+    SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    return yaml.dump(data, stream=stream, Dumper=SafeDumper, **kwargs)
@@ -0,0 +1,317 @@
+'''
+Cheap reachability probe for Conda channel hosts.
+
+Without a network connection, each Conda command takes several seconds to
+fail with ``CondaHTTPError``.  :func:`channels_reachable` instead sends an
+HTTP ``HEAD`` request (with a short timeout) to each channel host, and
+remembers failures in a negative cache (see :mod:`microdrop_launcher.cache`)
+with exponential backoff, such that offline machines skip channel checks
+entirely for a while.
+
+As for Conda itself, channel URLs are constructed using the
+``CONDA_CHANNEL_ALIAS`` environment variable or the ``channel_alias`` setting
+in ``.condarc``, and probes are sent through the proxies configured by
+``proxy_servers`` in ``.condarc`` (or the ``HTTP_PROXY``/``HTTPS_PROXY``
+environment variables) (see :func:`conda_network_config`), e.g., to probe a
+local stand-in server:
+
+    >>> os.environ['CONDA_CHANNEL_ALIAS'] = 'http://127.0.0.1:8000'
+    >>> channels_reachable(['sci-bots'], refresh=True)
+    True
+
+.. versionadded:: 0.8
+'''
+import httplib
+import logging
+import os
+import socket
+import time
+import urllib
+import urllib2
+import urlparse
+
+import path_helpers as ph
+
+from .cache import cache_key, invalidate, load_cached, save_cached
+from .files import yaml_load
+
+logger = logging.getLogger(__name__)
+
+#: Default Conda channel alias.
+DEFAULT_CHANNEL_ALIAS = 'https://conda.anaconda.org'
+#: Timeout (in seconds) of each probe request.
+PROBE_TIMEOUT = 2.
+#: Time (in seconds) to skip channel checks after a failed probe.
+OFFLINE_BACKOFF = 2 * 60.
+#: Maximum time (in seconds) to skip channel checks after consecutive failed
+#: probes.
+MAX_OFFLINE_BACKOFF = 60 * 60.
+
+
+class OfflineError(IOError):
+    '''
+    Conda channel hosts are not reachable.
+    '''
+    pass
+
+
+class _HeadRequest(urllib2.Request):
+    def get_method(self):
+        return 'HEAD'
+
+
+_network_config = None
+
+
+def condarc_paths():
+    '''
+    Returns
+    -------
+    list
+        Conda configuration files that may exist, in order of increasing
+        precedence (as searched by Conda).
+    '''
+    paths = []
+    try:
+        import conda_helpers as ch
+
+        from .repodata import _root_prefix
+
+        prefix = ch.conda_prefix()
+    except Exception:
+        logger.debug('Error looking up Conda prefix.', exc_info=True)
+        prefix = None
+    if prefix is not None:
+        root_prefix = _root_prefix(prefix)
+        paths.extend([root_prefix.joinpath('.condarc'),
+                      root_prefix.joinpath('condarc')])
+    home = ph.path('~').expand()
+    paths.extend([home.joinpath('.config', 'conda', '.condarc'),
+                  home.joinpath('.conda', '.condarc'),
+                  home.joinpath('.condarc')])
+    if prefix is not None:
+        paths.append(ph.path(prefix).joinpath('.condarc'))
+    if os.environ.get('CONDARC'):
+        paths.append(ph.path(os.environ['CONDARC']))
+    return paths
+
+
+def conda_network_config(paths=None, refresh=False):
+    '''
+    Read Conda network settings from ``.condarc`` files *without* running
+    Conda.
+
+    Parameters
+    ----------
+    paths : list, optional
+        Conda configuration files, in order of increasing precedence
+        (default: :func:`condarc_paths`).
+    refresh : bool, optional
+        If ``True``, re-read configuration files (by default, configuration
+        is only read once per process).
+
+    Returns
+    -------
+    dict
+        Conda network settings:
+
+         - ``channel_alias``: Channel alias URL (or ``None`` if not set).
+         - ``proxy_servers``: Mapping from URL scheme (e.g., ``'https'``) to
+           proxy URL.
+    '''
+    global _network_config
+
+    if paths is None and _network_config is not None and not refresh:
+        return _network_config
+    config = {'channel_alias': None, 'proxy_servers': {}}
+    for path_i in (condarc_paths() if paths is None else paths):
+        path_i = ph.path(path_i)
+        if not path_i.isfile():
+            continue
+        try:
+            with path_i.open('r') as input_:
+                condarc_i = yaml_load(input_.read())
+        except Exception:
+            logger.debug('Error reading `%s`.', path_i, exc_info=True)
+            continue
+        if not isinstance(condarc_i, dict):
+            continue
+        if condarc_i.get('channel_alias'):
+            config['channel_alias'] = str(condarc_i['channel_alias'])
+        if isinstance(condarc_i.get('proxy_servers'), dict):
+            config['proxy_servers'].update((str(key_j), str(value_j))
+                                           for key_j, value_j in
+                                           condarc_i['proxy_servers']
+                                           .iteritems() if value_j)
+    if paths is None:
+        _network_config = config
+    return config
+
+
+def proxy_servers():
+    '''
+    Returns
+    -------
+    dict
+        Mapping from URL scheme to proxy URL, from ``HTTP_PROXY``-style
+        environment variables, overridden by ``proxy_servers`` in
+        ``.condarc`` (see :func:`conda_network_config`).
+    '''
+    proxies = urllib.getproxies()
+    # **N.B.**, `urllib2` only supports per-scheme proxies (not, e.g.,
+    # `http://host` keys, which Conda also accepts).
+    proxies.update((key_i, value_i) for key_i, value_i in
+                    conda_network_config()['proxy_servers'].iteritems()
+                    if '://' not in key_i)
+    return proxies
+
+
+def channel_urls(channels, channel_alias=None):
+    '''
+    .. versionchanged:: 0.8
+        Default to ``channel_alias`` setting in ``.condarc``.
+
+    Parameters
+    ----------
+    channels : list
+        Conda channel names (e.g., ``'sci-bots'``) or URLs.
+    channel_alias : str, optional
+        Base URL of channel names (default: ``CONDA_CHANNEL_ALIAS``
+        environment variable, ``channel_alias`` setting in ``.condarc``, or
+        :data:`DEFAULT_CHANNEL_ALIAS`).
+
+    Returns
+    -------
+    list
+        Channel URLs.
+    '''
+    if channel_alias is None:
+        channel_alias = (os.environ.get('CONDA_CHANNEL_ALIAS') or
+                         conda_network_config()['channel_alias'] or
+                         DEFAULT_CHANNEL_ALIAS)
+    urls = []
+    for channel_i in channels:
+        if '://' in channel_i:
+            url_i = channel_i
+        else:
+            url_i = '{}/{}'.format(channel_alias.rstrip('/'), channel_i)
+        urls.append(url_i.rstrip('/') + '/')
+    return urls
+
+
+def _hosts(urls):
+    hosts = []
+    for url_i in urls:
+        parts_i = urlparse.urlsplit(url_i)
+        host_i = '{}://{}/'.format(parts_i.scheme, parts_i.netloc)
+        if host_i not in hosts:
+            hosts.append(host_i)
+    return hosts
+
+
+def probe(url, timeout=PROBE_TIMEOUT, proxies=None):
+    '''
+    Parameters
+    ----------
+    url : str
+        URL to send HTTP ``HEAD`` request to.
+    timeout : float, optional
+        Time (in seconds) to wait for a response.
+    proxies : dict, optional
+        Mapping from URL scheme to proxy URL (default: see
+        :func:`proxy_servers`).  If empty, connect directly.
+
+    Returns
+    -------
+    bool
+        ``True`` if server responded (with any HTTP status).
+    '''
+    if proxies is None:
+        proxies = proxy_servers()
+    opener = urllib2.build_opener(urllib2.ProxyHandler(proxies))
+    try:
+        response = opener.open(_HeadRequest(url), timeout=timeout)
+        response.close()
+    except urllib2.HTTPError:
+        # Server responded, e.g., with `404 Not Found`.
+        return True
+    except (urllib2.URLError, httplib.HTTPException, socket.error), exception:
+        logger.debug('No response from `%s`: %s', url, exception)
+        return False
+    return True
+
+
+def _backoff(failures):
+    return min(OFFLINE_BACKOFF * 2 ** (failures - 1), MAX_OFFLINE_BACKOFF)
+
+
+def channels_reachable(channels=None, urls=None, timeout=PROBE_TIMEOUT,
+                       refresh=False, proxies=None):
+    '''
+    Check if at least one Conda channel host responds.
+
+    After a failed probe, ``False`` is returned without probing until the
+    backoff time has elapsed (starting at :data:`OFFLINE_BACKOFF`, doubling
+    with each consecutive failure up to :data:`MAX_OFFLINE_BACKOFF`).
+
+    Parameters
+    ----------
+    channels : list, optional
+        Conda channels (default:
+        :data:`microdrop_launcher.DEFAULT_CHANNELS`).
+    urls : list, optional
+        Channel URLs to probe (default: see :func:`channel_urls`).
+    timeout : float, optional
+        Time (in seconds) to wait for a response from each host.
+    refresh : bool, optional
+        If ``True``, probe even if a recent probe failed.
+    proxies : dict, optional
+        See :func:`probe`.
+
+    Returns
+    -------
+    bool
+        ``True`` if at least one channel host responded.
+    '''
+    if urls is None:
+        if channels is None:
+            from . import DEFAULT_CHANNELS
+
+            channels = DEFAULT_CHANNELS
+        urls = channel_urls(channels)
+    hosts = _hosts(urls)
+    if not hosts:
+        return True
+    if proxies is None:
+        proxies = proxy_servers()
+    # **N.B.**, failures are cached per proxy configuration, such that
+    # changing proxies takes effect immediately.
+    key = cache_key(hosts, sorted(proxies.items()))
+
+    offline = load_cached('network', key)
+    if offline is not None and not refresh:
+        try:
+            remaining = (offline['timestamp'] + _backoff(offline['failures'])
+                         - time.time())
+        except (KeyError, TypeError):
+            remaining = 0
+        if 0 < remaining <= MAX_OFFLINE_BACKOFF:
+            logger.debug('Skipping channel checks (offline; retry in %.0f s).',
+                         remaining)
+            return False
+
+    for host_i in hosts:
+        if probe(host_i, timeout=timeout, proxies=proxies):
+            if offline is not None:
+                invalidate('network', key)
+            return True
+
+    failures = (offline or {}).get('failures', 0) + 1
+    logger.info('Conda channel hosts not reachable (%s); skipping channel '
+                'checks for %.0f s.', ', '.join(hosts), _backoff(failures))
+    try:
+        save_cached('network', key, {'failures': failures,
+                                     'timestamp': time.time()})
+    except Exception:
+        logger.debug('Error caching network status.', exc_info=True)
+    return False
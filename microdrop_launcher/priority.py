@@ -0,0 +1,397 @@
+'''
+Scheduling priority of background work.
+
+Background update checks (see :mod:`microdrop_launcher.tasks`) start Conda
+processes and probe channel hosts while MicroDrop is starting, competing for
+CPU and disk with plugin loading.  A priority *policy* lowers the CPU and I/O
+priority of:
+
+ - each background thread (see :func:`enter_background`), and
+ - each Conda process started by a background thread (see
+   :func:`microdrop_launcher.conda_stream.stream_conda`).
+
+Policies are pluggable (see :func:`set_policy`); the default policy is
+selected by name (see :func:`create_policy`) using the
+``MICRODROP_LAUNCHER_PRIORITY`` environment variable, e.g.:
+
+    >>> set_policy(create_policy('idle'))
+
+Background work may also be held back until MicroDrop has finished starting
+(see :func:`wait_for_startup`).
+
+.. versionadded:: 0.8
+'''
+import logging
+import os
+import platform
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#: Environment variable selecting the default policy (see
+#: :func:`create_policy`).
+PRIORITY_ENV_VAR = 'MICRODROP_LAUNCHER_PRIORITY'
+#: Policy names (see :func:`create_policy`).
+POLICY_NAMES = ('low', 'idle', 'normal')
+
+#: `BELOW_NORMAL_PRIORITY_CLASS` process creation flag (Windows).
+BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+#: `IDLE_PRIORITY_CLASS` process creation flag (Windows).
+IDLE_PRIORITY_CLASS = 0x40
+#: `THREAD_MODE_BACKGROUND_BEGIN` thread priority (Windows; lowers CPU and
+#: I/O priority of calling thread).
+THREAD_MODE_BACKGROUND_BEGIN = 0x10000
+
+#: Best-effort I/O scheduling class (Linux).
+IOPRIO_CLASS_BE = 2
+#: Idle I/O scheduling class (Linux).
+IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+#: `ioprio_set` system call number, by machine architecture (Linux).
+_IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289,
+                        'aarch64': 30, 'armv7l': 314, 'armv6l': 314}
+
+#: Maximum time (in seconds) to wait for MicroDrop to finish starting.
+STARTUP_TIMEOUT = 60.
+#: CPU usage (fraction of one CPU) below which MicroDrop is considered to
+#: have finished starting.
+STARTUP_IDLE_CPU = .1
+#: Time (in seconds) between CPU usage samples of MicroDrop process.
+STARTUP_POLL_INTERVAL = 1.
+
+_local = threading.local()
+_policy = None
+
+
+class PriorityPolicy(object):
+    '''
+    Scheduling priority policy of background work.
+
+    This base class leaves priorities unchanged.  Subclasses override:
+
+     - :attr:`creationflags`: :class:`subprocess.Popen` creation flags
+       (Windows).
+     - :meth:`preexec`: called in each child process before it is executed
+       (POSIX).
+     - :meth:`lower_thread`: called once by each background thread.
+    '''
+    #: Policy name.
+    name = 'normal'
+    #: Process creation flags (Windows).
+    creationflags = 0
+
+    def preexec(self):
+        pass
+
+    def lower_thread(self):
+        pass
+
+    def __repr__(self):
+        return '<{} {!r}>'.format(type(self).__name__, self.name)
+
+
+class NullPolicy(PriorityPolicy):
+    '''
+    Run background work at normal priority.
+    '''
+    pass
+
+
+def _set_nice(nice):
+    # **N.B.**, `nice` is an absolute niceness (rather than an increment),
+    # such that processes started by an already lowered thread are not
+    # lowered twice.
+    current = os.nice(0)
+    if nice > current:
+        os.nice(nice - current)
+
+
+class PosixPolicy(PriorityPolicy):
+    '''
+    Lower niceness and, on Linux, I/O scheduling class of background work.
+
+    On Linux, niceness and I/O priority are per-thread, so background threads
+    are lowered as well.  On other POSIX platforms, niceness applies to the
+    whole launcher process, so only child processes are lowered.
+
+    Parameters
+    ----------
+    nice : int, optional
+        Niceness (0-19) of background work.
+    io_class : int, optional
+        I/O scheduling class (:data:`IOPRIO_CLASS_BE` or
+        :data:`IOPRIO_CLASS_IDLE`), or ``None`` to leave I/O priority
+        unchanged.
+    name : str, optional
+        Policy name.
+    '''
+    def __init__(self, nice=10, io_class=IOPRIO_CLASS_BE, name='low'):
+        self.nice = nice
+        self.io_class = io_class
+        self.name = name
+        self._syscall = None
+        if io_class is not None and platform.system() == 'Linux':
+            # **N.B.**, load C library in the parent, rather than in each
+            # forked child process.
+            number = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+            if number is not None:
+                try:
+                    import ctypes
+
+                    self._syscall = (ctypes.CDLL(None, use_errno=True).syscall,
+                                     number)
+                except (ImportError, OSError, AttributeError):
+                    logger.debug('Error loading C library.', exc_info=True)
+
+    def _set_io_priority(self):
+        if self._syscall is None:
+            return
+        syscall, number = self._syscall
+        # Lowest priority level (7) of best-effort class; the idle class has
+        # no levels.
+        level = 7 if self.io_class == IOPRIO_CLASS_BE else 0
+        # **N.B.**, process ID 0 refers to the calling thread.
+        syscall(number, _IOPRIO_WHO_PROCESS, 0,
+                (self.io_class << _IOPRIO_CLASS_SHIFT) | level)
+
+    def preexec(self):
+        _set_nice(self.nice)
+        self._set_io_priority()
+
+    def lower_thread(self):
+        if platform.system() != 'Linux':
+            return
+        _set_nice(self.nice)
+        self._set_io_priority()
+
+
+class WindowsPolicy(PriorityPolicy):
+    '''
+    Start background Conda processes with a lower priority class, and lower
+    background threads to background processing mode (i.e., lower CPU and I/O
+    priority).
+
+    Parameters
+    ----------
+    priority_class : int, optional
+        Process priority class creation flag, e.g.,
+        :data:`BELOW_NORMAL_PRIORITY_CLASS` or :data:`IDLE_PRIORITY_CLASS`.
+    name : str, optional
+        Policy name.
+    '''
+    def __init__(self, priority_class=BELOW_NORMAL_PRIORITY_CLASS,
+                 name='low'):
+        self.creationflags = priority_class
+        self.name = name
+
+    def lower_thread(self):
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(),
+                                          THREAD_MODE_BACKGROUND_BEGIN):
+            logger.debug('Error lowering thread priority: %s',
+                         ctypes.WinError())
+
+
+def create_policy(name='low'):
+    '''
+    Parameters
+    ----------
+    name : str, optional
+        One of:
+
+         - ``"low"``: below normal CPU priority (niceness 10 on POSIX) and
+           lowest best-effort I/O priority (Linux).
+         - ``"idle"``: only use otherwise idle CPU (niceness 19 on POSIX) and
+           disk time (Linux).
+         - ``"normal"``: leave priorities unchanged.
+
+    Returns
+    -------
+    PriorityPolicy
+        Policy for this platform.
+    '''
+    if name not in POLICY_NAMES:
+        raise ValueError('Unknown priority policy `{}` (choose from: {}).'
+                         .format(name, ', '.join(POLICY_NAMES)))
+    if name == 'normal':
+        return NullPolicy()
+    elif os.name == 'nt':
+        return WindowsPolicy(BELOW_NORMAL_PRIORITY_CLASS if name == 'low'
+                             else IDLE_PRIORITY_CLASS, name=name)
+    elif name == 'low':
+        return PosixPolicy(nice=10, io_class=IOPRIO_CLASS_BE, name=name)
+    else:
+        return PosixPolicy(nice=19, io_class=IOPRIO_CLASS_IDLE, name=name)
+
+
+def get_policy():
+    '''
+    Returns
+    -------
+    PriorityPolicy
+        Policy of background work (default: selected by
+        ``MICRODROP_LAUNCHER_PRIORITY`` environment variable, or ``"low"``).
+    '''
+    global _policy
+
+    if _policy is None:
+        name = os.environ.get(PRIORITY_ENV_VAR) or 'low'
+        try:
+            _policy = create_policy(name)
+        except ValueError:
+            logger.warning('Unknown `%s` value `%s`; using `low`.',
+                           PRIORITY_ENV_VAR, name)
+            _policy = create_policy('low')
+    return _policy
+
+
+def set_policy(policy):
+    '''
+    Parameters
+    ----------
+    policy : PriorityPolicy or str
+        Policy of background work started from now on, or policy name (see
+        :func:`create_policy`).
+    '''
+    global _policy
+
+    if isinstance(policy, basestring):
+        policy = create_policy(policy)
+    _policy = policy
+
+
+def enter_background():
+    '''
+    Mark calling thread as a background thread for the rest of its life.
+
+    The thread is lowered according to the current policy (see
+    :meth:`PriorityPolicy.lower_thread`), and Conda commands it runs are
+    started at low priority (see :func:`is_background`).
+
+    **N.B.**, only call from dedicated threads, since lowered priority may
+    not be raised again without privileges.
+    '''
+    if getattr(_local, 'background', False):
+        return
+    _local.background = True
+    try:
+        get_policy().lower_thread()
+    except Exception:
+        logger.debug('Error lowering thread priority.', exc_info=True)
+
+
+def is_background():
+    '''
+    Returns
+    -------
+    bool
+        ``True`` if calling thread is a background thread (see
+        :func:`enter_background`).
+    '''
+    return getattr(_local, 'background', False)
+
+
+def process_cpu_time(pid):
+    '''
+    Parameters
+    ----------
+    pid : int
+        Process ID.
+
+    Returns
+    -------
+    float or None
+        Total CPU time (in seconds) used by process, or ``None`` if not
+        available (e.g., process has exited, or platform is not supported).
+    '''
+    if platform.system() == 'Linux':
+        try:
+            with open('/proc/{}/stat'.format(pid), 'r') as input_:
+                # **N.B.**, process name (2nd field) may contain spaces.
+                fields = input_.read().rsplit(')', 1)[1].split()
+            # `utime` and `stime` are the 14th and 15th fields.
+            return ((int(fields[11]) + int(fields[12])) /
+                    float(os.sysconf('SC_CLK_TCK')))
+        except (IOError, OSError, IndexError, ValueError):
+            return None
+    elif os.name == 'nt':
+        import ctypes
+        import ctypes.wintypes
+
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION,
+                                      False, pid)
+        if not handle:
+            return None
+        try:
+            times = [ctypes.wintypes.FILETIME() for i in xrange(4)]
+            if not kernel32.GetProcessTimes(handle, *[ctypes.byref(time_i)
+                                                      for time_i in times]):
+                return None
+            # Kernel and user times, in 100 ns units.
+            return sum((time_i.dwHighDateTime << 32 | time_i.dwLowDateTime)
+                       for time_i in times[2:]) * 1e-7
+        finally:
+            kernel32.CloseHandle(handle)
+    return None
+
+
+def wait_for_startup(pid, timeout=STARTUP_TIMEOUT, idle_cpu=STARTUP_IDLE_CPU,
+                     poll_interval=STARTUP_POLL_INTERVAL):
+    '''
+    Wait until process has finished starting, i.e., its CPU usage has stayed
+    below :data:`idle_cpu` for two consecutive samples (e.g., MicroDrop has
+    loaded its plugins and is waiting for user input).
+
+    If CPU usage of the process is not available on this platform (e.g.,
+    macOS), return immediately, i.e., the gate is not supported.
+
+    Parameters
+    ----------
+    pid : int
+        Process ID.
+    timeout : float, optional
+        Maximum time (in seconds) to wait.
+    idle_cpu : float, optional
+        CPU usage (fraction of one CPU) below which process is considered
+        idle.
+    poll_interval : float, optional
+        Time (in seconds) between CPU usage samples.
+
+    Returns
+    -------
+    bool
+        ``True`` if process finished starting (or has exited), ``False`` if
+        :data:`timeout` elapsed first (or CPU usage is not available).
+    '''
+    start = time.time()
+    cpu_time = process_cpu_time(pid)
+    if cpu_time is None:
+        if platform.system() == 'Linux' or os.name == 'nt':
+            # Process has exited.
+            return True
+        # **N.B.**, do not wait for `timeout`, since background checks would
+        # then never run during short sessions.
+        logger.info('Process CPU time is not available on this platform; '
+                    'not waiting for process %s to finish starting.', pid)
+        return False
+    idle_samples = 0
+    while time.time() - start < timeout:
+        time.sleep(poll_interval)
+        previous, cpu_time = cpu_time, process_cpu_time(pid)
+        if cpu_time is None:
+            return True
+        if (cpu_time - previous) / poll_interval < idle_cpu:
+            idle_samples += 1
+            if idle_samples >= 2:
+                logger.debug('Process %s finished starting after %.1f s.',
+                             pid, time.time() - start)
+                return True
+        else:
+            idle_samples = 0
+    return False
@@ -1,85 +1,141 @@
-import json
 import logging
 import os
-import pkg_resources
 import platform
-import re
 import subprocess as sp
 import sys
 
-import conda_helpers as ch
-import mpm
-import mpm.commands
-import mpm.bin
-import pandas as pd
 import path_helpers as ph
-import yaml
-try:
-    import gtk
-except ImportError:
-    GUI_AVAILABLE = False
-else:
-    GUI_AVAILABLE = True
-
-from .config import create_config_directory
+
+from .conda_meta import package_version
 from .microdrop_version import load_cached_version
+from .registry import ProfileRegistry, YamlProfileStore
+from . import tracing
+from .scanner import (STATUS_MISMATCH, STATUS_MISSING, STATUS_NOT_FOUND,
+                      scan_profile, scan_profiles)
+from .version_cache import (clear_staged, ignore_version, load_version_cache,
+                            staged_version, update_version_cache)
+from .version_context import VERSION_CONTEXT
 
 logger = logging.getLogger(__name__)
-cre_version = re.compile(r'^(?P<major>\d+)\.')
 
-get_major_version = lambda version: '{}.0'.format(cre_version
-                                                  .match(version)
-                                                  .group('major'))
+get_major_version = lambda version: '{}.0'.format(VERSION_CONTEXT
+                                                  .major(version))
+
+# **N.B.**, heavy modules (e.g., `gtk`, `pkg_resources`, `mpm`,
+# `conda_helpers`) are imported within the functions that use them to keep
+# startup time low, e.g., for `microdrop-profile-manager --default`, which
+# does not display any dialogs.
+_GUI_AVAILABLE = None
+_ICON_PATH = None
+
+
+def gui_available():
+    '''
+    .. versionadded:: 0.8
+
+    Returns
+    -------
+    bool
+        ``True`` if :mod:`gtk` can be imported.
+
+        The :mod:`gtk` module is only imported on the first call.
+    '''
+    global _GUI_AVAILABLE
+
+    if _GUI_AVAILABLE is None:
+        try:
+            import gtk
+        except ImportError:
+            _GUI_AVAILABLE = False
+        else:
+            _GUI_AVAILABLE = True
+    return _GUI_AVAILABLE
+
+
+def icon_path():
+    '''
+    .. versionadded:: 0.8
+
+    Returns
+    -------
+    str
+        Path to MicroDrop icon (replaces ``ICON_PATH`` constant to avoid
+        importing :mod:`pkg_resources` at module load).
+    '''
+    global _ICON_PATH
+
+    if _ICON_PATH is None:
+        import pkg_resources
 
-ICON_PATH = pkg_resources.resource_filename('microdrop', 'microdrop.ico')
-SAVED_COLUMNS = ['used_timestamp', 'path']
+        _ICON_PATH = pkg_resources.resource_filename('microdrop',
+                                                     'microdrop.ico')
+    return _ICON_PATH
 
 
 class VersionError(RuntimeError):
     pass
 
 
+@tracing.span('check_version_cache_for_upgrade')
 def check_version_cache_for_upgrade():
     '''
     Prompt user to offer to upgrade if cached latest MicroDrop version is newer
     than currently installed version.
 
     .. versionadded:: 0.7.8
-    '''
-    # Get currently installed `microdrop` package information.
-    #
-    # Example `installed_info`:
-    #
-    #     {u'base_url': None,
-    #      u'build_number': 0,
-    #      u'build_string': u'0',
-    #      u'channel': u'sci-bots',
-    #      u'dist_name': u'microdrop-2.10.2-0',
-    #      u'name': u'microdrop',
-    #      u'platform': None,
-    #      u'version': u'2.10.2',
-    #      u'with_features_depends': None}
-    try:
-        installed_info = ch.package_version('microdrop', verbose=False)
-    except NameError:
-        # Installed MicroDrop Conda package not found (perhaps this is a
-        # development environment?)
-        return
 
+    .. versionchanged:: 0.8
+        Only query the installed ``microdrop`` Conda package if a newer
+        version is cached and not ignored.
+
+        Read installed version from ``conda-meta`` index (see
+        :func:`microdrop_launcher.conda_meta.package_version`) rather than
+        running ``conda list``.
+
+        Read (and write ignored version to) version cache shared by all
+        MicroDrop major versions (see
+        :mod:`microdrop_launcher.version_cache`).
+
+        Link packages downloaded in the background, if available (see
+        :func:`microdrop_launcher.tasks.stage_microdrop_upgrade`).
+
+        Install upgrade in a background thread while showing progress (see
+        :func:`microdrop_launcher.upgrade.upgrade_with_progress`), such that
+        the GUI stays responsive and downloads may be cancelled.
+    '''
     cached_path, cached_info = load_cached_version()
     latest_version = cached_info.get('version')
-    installed_version = installed_info.get('version')
 
     # If cached latest MicroDrop version is more recent than the currently
     # installed version, prompt user to offer to upgrade.
-    if all([GUI_AVAILABLE, not cached_info.get('ignore'),
-            latest_version is not None]):
-        if (pkg_resources.parse_version(latest_version) <=
-            pkg_resources.parse_version(installed_version)):
+    if all([latest_version is not None, not cached_info.get('ignore'),
+            gui_available()]):
+        import conda_helpers as ch
+        import gtk
+
+        # Get currently installed `microdrop` package information.
+        #
+        # Example `installed_info`:
+        #
+        #     {'build': '0',
+        #      'build_string': '0',
+        #      'dist_name': 'microdrop-2.10.2-0',
+        #      'name': 'microdrop',
+        #      'version': '2.10.2'}
+        try:
+            installed_info = package_version('microdrop')
+        except NameError:
+            # Installed MicroDrop Conda package not found (perhaps this is a
+            # development environment?)
+            return
+        installed_version = installed_info.get('version')
+
+        if (VERSION_CONTEXT.parse(latest_version) <=
+            VERSION_CONTEXT.parse(installed_version)):
             return
         # Display dialog.
         dialog = gtk.MessageDialog(type=gtk.MESSAGE_QUESTION)
-        dialog.set_icon_from_file(ICON_PATH)
+        dialog.set_icon_from_file(icon_path())
         dialog.set_title('Upgrade to MicroDrop v{}'.format(latest_version))
         dialog.add_buttons(gtk.STOCK_YES, gtk.RESPONSE_YES,
                            "Not now", gtk.RESPONSE_NO,
@@ -94,9 +150,8 @@ def check_version_cache_for_upgrade():
         if response == gtk.RESPONSE_CANCEL:
             # Ignore this specific version from now on.
             try:
-                with cached_path.open('w') as output:
-                    cached_info = {'version': latest_version, 'ignore': True}
-                    yaml.dump(cached_info, stream=output)
+                with update_version_cache() as cache:
+                    ignore_version(cache, latest_version)
                 print ('new version available: MicroDrop v{} (not installing '
                        'now)'.format(latest_version))
             except:
@@ -104,26 +159,45 @@ def check_version_cache_for_upgrade():
         elif response == gtk.RESPONSE_YES:
             # User selected `Yes`, so upgrade MicroDrop, but restrict upgrade
             # to within the same major version.
+            from .upgrade import upgrade_with_progress
+
             try:
-                major_version = int(cre_version.match(installed_version)
-                                    .group('major'))
-                install_log_json = ch.conda_exec('install', '--json',
-                                                 'microdrop >={}, <{}'
-                                                 .format(major_version,
-                                                         major_version + 1))
-                install_response = json.loads(install_log_json)
-                unlinked, linked = ch.install_info(install_response)
-                print ch.format_install_info(unlinked, linked)
+                major_version = VERSION_CONTEXT.major(installed_version)
+                if (staged_version(load_version_cache(), major_version)
+                        .get('version') == latest_version):
+                    # Packages were downloaded in the background (see
+                    # `tasks.stage_microdrop_upgrade`), so only link them.
+                    specs, staged = ['microdrop =={}'
+                                     .format(latest_version)], True
+                else:
+                    specs, staged = ['microdrop >={}, <{}'
+                                     .format(major_version,
+                                             major_version + 1)], False
+                result = upgrade_with_progress(specs, title='Upgrade to '
+                                               'MicroDrop v{}'
+                                               .format(latest_version),
+                                               staged=staged)
+                if result['cancelled']:
+                    print 'Upgrade cancelled.'
+                    return
+                elif result['error']:
+                    logger.error('Error upgrading MicroDrop: %s',
+                                 result['error'])
+                    return
+                print ch.format_install_info(result['unlinked'],
+                                             result['linked'])
+                # Installed MicroDrop version has changed.
+                VERSION_CONTEXT.invalidate()
                 try:
-                    # Remove stale cached MicroDrop version data.
-                    cached_path.remove()
+                    with update_version_cache() as cache:
+                        clear_staged(cache, major_version)
                 except:
                     pass
             except:
                 logger.error('Error upgrading MicroDrop.', exc_info=True)
 
 
-def load_profiles_info(profiles_path):
+def load_profiles_info(profiles_path, store=None):
     '''
     Load list of profiles from file.
 
@@ -137,34 +211,49 @@ def load_profiles_info(profiles_path):
         used that is specific to MicroDrop major version of the form
         ``MicroDrop-v<major_version>``.
 
+    .. versionchanged:: 0.8
+        Return :class:`ProfileRegistry` instead of :class:`pandas.DataFrame`.
+
+        Scan each profile once (see :func:`scan_profiles`) and drop profiles
+        whose directory does not exist.  Profiles that could not be probed in
+        time are kept and marked as unavailable.
+
+        Add :data:`store` parameter.
+
     Parameters
     ----------
     profiles_path : str
         Path to file containing list of profiles.
+    store : YamlProfileStore or SqliteProfileStore, optional
+        Profile store to load profiles from (default: YAML profiles list
+        file at :data:`profiles_path`).
 
     Returns
     -------
-    df_profiles : pandas.DataFrame
-        Table of MicroDrop profile descriptions including the columns:
+    profiles : ProfileRegistry
+        MicroDrop profile records (most recently used first), each including:
 
          - ``path`` File system path to profile directory.
          - ``used_timestamp`` Most recent time that profile was launched.
     '''
+    import mpm.bin
+
     profiles_path = ph.path(profiles_path)
 
     profiles_path.parent.makedirs_p()
-    if profiles_path.exists():
-        with profiles_path.open('r') as input_:
-            profiles_str = input_.read()
-            try:
-                profiles = [profile_i for profile_i in yaml.load(profiles_str)
-                            if ph.path(profile_i['path']).isdir()]
-            except:
-                logger.error('Error reading list of profiles from `%s`.',
-                             profiles_path, exc_info=True)
-                profiles = []
-    else:
-        profiles = []
+    if store is None:
+        store = YamlProfileStore(profiles_path)
+    try:
+        profiles = store.load()
+        scan_profiles(profiles)
+        # **N.B.**, keep unavailable profiles (e.g., on unreachable network
+        # drives), since they may become available later.
+        profiles.drop([record_i.path for record_i in profiles
+                       if record_i.status == STATUS_NOT_FOUND])
+    except:
+        logger.error('Error reading list of profiles from `%s`.', store.path,
+                     exc_info=True)
+        profiles = ProfileRegistry()
 
     default_profile_path = mpm.bin.get_plugins_directory().parent
 
@@ -177,9 +266,7 @@ def load_profiles_info(profiles_path):
             # MicroDrop major version.
 
             # Query the currently installed version of the MicroDrop Python package.
-            installed_version_str = (pkg_resources
-                                     .get_distribution('microdrop').version)
-            major_version = get_major_version(installed_version_str)
+            major_version = VERSION_CONTEXT.major_version_str
 
             # Use default profile path specific to MicroDrop major version.
             default_profile_path = (default_profile_path.parent
@@ -188,6 +275,8 @@ def load_profiles_info(profiles_path):
 
     if not profiles and not default_profile_path.isdir():
         # No existing profiles.  Create default profile.
+        from .config import create_config_directory
+
         print ('No existing profiles.  Create default profile at {}.'
                .format(default_profile_path))
         create_config_directory(output_dir=default_profile_path)
@@ -199,11 +288,13 @@ def load_profiles_info(profiles_path):
         # MicroDrop package version.
         release_version_path = default_profile_path.joinpath('RELEASE-VERSION')
         with release_version_path.open('w') as output:
-            output.write(pkg_resources.get_distribution('microdrop').version)
-        if GUI_AVAILABLE:
+            output.write(VERSION_CONTEXT.version)
+        if gui_available():
+            import gtk
+
             major_version = installed_major_version()
             dialog = gtk.MessageDialog(type=gtk.MESSAGE_INFO)
-            dialog.set_icon_from_file(ICON_PATH)
+            dialog.set_icon_from_file(icon_path())
             dialog.set_title('New MicroDrop {} profile created'
                              .format(major_version))
             dialog.add_buttons(gtk.STOCK_OK, gtk.RESPONSE_OK)
@@ -217,30 +308,26 @@ def load_profiles_info(profiles_path):
         # No profiles list found or empty profiles list.
         #
         # Use default profile path.
-        profiles = [{'path': str(default_profile_path),
-                     'used_timestamp': None}]
-        df_profiles = pd.DataFrame(None, columns=SAVED_COLUMNS)
-        df_profiles = import_profile(df_profiles, default_profile_path, parent=None)
-    else:
-        df_profiles = pd.DataFrame(profiles, columns=SAVED_COLUMNS)
-    df_profiles.loc[df_profiles.used_timestamp == 'nan', 'used_timestamp'] = ''
-    df_profiles.sort_values('used_timestamp', ascending=False, inplace=True)
-    df_profiles.drop_duplicates(subset=['path'], inplace=True)
-    return df_profiles
+        profiles = import_profile(profiles, default_profile_path, parent=None)
+    return profiles
 
 
-def drop_version_errors(df_profiles, missing=False, mismatch=False,
+def drop_version_errors(profiles, missing=False, mismatch=False,
                         inplace=False):
     '''
     Drop rows for profiles with version errors.
 
+    .. versionchanged:: 0.8
+        Operate on :class:`ProfileRegistry` instead of
+        :class:`pandas.DataFrame`.
+
+        Use profile status from :func:`scan_profiles` instead of reading the
+        ``RELEASE-VERSION`` file of each profile.
+
     Parameters
     ----------
-    df_profiles : pandas.DataFrame
-        Table of MicroDrop profile descriptions.
-
-        Must include *at least* the column ``path`` containing the file system
-        path to each profile directory.
+    profiles : ProfileRegistry
+        MicroDrop profile records.
     missing : bool, optional
         If ``True``, drop rows for profiles where no ``RELEASE-VERSION`` file
         is found in the profile directory.
@@ -251,25 +338,23 @@ def drop_version_errors(df_profiles, missing=False, mismatch=False,
     inplace : bool, optional
         If ``True``, do operation inplace and return None.
     '''
-    def version_error(profile_path):
-        try:
-            verify_profile_version(profile_path)
-        except VersionError:
+    def version_error(record):
+        if record.status == STATUS_MISMATCH:
             # Major version in `RELEASE-VERSION` file and major version of
             # installed MicroDrop package **do not match**.
             return mismatch
-        except IOError:
+        elif record.status in (STATUS_MISSING, STATUS_NOT_FOUND):
             # No `RELEASE-VERSION` file found in the profile directory.
             return missing
         else:
             return False
 
-    error_mask = df_profiles.path.map(version_error)
-    result = df_profiles.drop(error_mask[error_mask].index, inplace=inplace)
-    if inplace:
-        return df_profiles
-    else:
-        return result
+    if not inplace:
+        profiles = profiles.copy()
+    scan_profiles(profiles)
+    profiles.drop([record_i.path for record_i in profiles
+                   if version_error(record_i)])
+    return profiles
 
 
 def verify_profile_version(profile_path):
@@ -285,14 +370,18 @@ def verify_profile_version(profile_path):
         If no version file found in profile directory.
     VersionError
         If profile version does not match installed MicroDrop version.
+
+    .. versionchanged:: 0.8
+        Use memoized installed MicroDrop version (see
+        :data:`VERSION_CONTEXT`).
     '''
     profile_path = ph.path(profile_path)
 
     release_version_path = profile_path.joinpath('RELEASE-VERSION')
 
     # Query the currently installed version of the MicroDrop Python package.
-    installed_version_str = pkg_resources.get_distribution('microdrop').version
-    installed_version = pkg_resources.parse_version(installed_version_str)
+    installed_version_str = VERSION_CONTEXT.version
+    installed_version = VERSION_CONTEXT.parsed_version
 
     if release_version_path.isfile():
         # A `RELEASE-VERSION` file exists in the same directory as the
@@ -300,7 +389,7 @@ def verify_profile_version(profile_path):
         #
         # Parse the version from the `RELEASE-VERSION` file.
         release_version_str = release_version_path.lines()[0]
-        release_version = pkg_resources.parse_version(release_version_str)
+        release_version = VERSION_CONTEXT.parse(release_version_str)
     else:
         # No `RELEASE-VERSION` file found in the profile directory.
         raise IOError('No version file found in profile directory.')
@@ -324,11 +413,13 @@ def verify_or_create_profile_version(profile_path):
     except IOError:
         # No `RELEASE-VERSION` file found in the profile directory.
 
-        if GUI_AVAILABLE:
+        if gui_available():
+            import gtk
+
             # Prompt user to confirm profile version matches installed
             # MicroDrop version.
             dialog = gtk.MessageDialog(type=gtk.MESSAGE_QUESTION)
-            dialog.set_icon_from_file(ICON_PATH)
+            dialog.set_icon_from_file(icon_path())
             dialog.set_title('Confirm MicroDrop {} profile'
                             .format(installed_major_version()))
             dialog.add_buttons(gtk.STOCK_YES, gtk.RESPONSE_YES,
@@ -353,7 +444,7 @@ def verify_or_create_profile_version(profile_path):
         # MicroDrop package version.
         release_version_path = profile_path.joinpath('RELEASE-VERSION')
         with release_version_path.open('w') as output:
-            output.write(pkg_resources.get_distribution('microdrop').version)
+            output.write(VERSION_CONTEXT.version)
 
 
 def environment_prompt(profile_path):
@@ -363,6 +454,8 @@ def environment_prompt(profile_path):
 
     .. versionadded:: 0.1.post64
     '''
+    import conda_helpers as ch
+
     profile_path = ph.path(profile_path)
     config_file = profile_path.joinpath('microdrop.ini')
 
@@ -385,7 +478,8 @@ def environment_prompt(profile_path):
                            .format(platform.system()))
 
 
-def launch_profile(profile_path):
+@tracing.span('launch_profile')
+def launch_profile(profile_path, zygote=False, on_spawn=None):
     '''
      1. If cached latest MicroDrop version is newer than currently installed
         version, prompt user to offer to upgrade.
@@ -394,16 +488,37 @@ def launch_profile(profile_path):
     .. versionchanged:: 0.7.2
        Launch MicroDrop in an **activated** Conda environment.
 
+    .. versionchanged:: 0.8
+       Launch MicroDrop directly (i.e., without a shell) using cached
+       activated Conda environment (see
+       :func:`microdrop_launcher.activation.activated_environment`), falling
+       back to activating the environment in a shell.
+
+       Add :data:`zygote` parameter.
+
+       Add :data:`on_spawn` parameter.
+
     Parameters
     ----------
     profile_path : str
         File-system path to MicroDrop profile directory.
+    zygote : bool, optional
+        If ``True`` (and supported on this platform), launch and restart
+        MicroDrop by forking a pre-initialized interpreter (see
+        :mod:`microdrop_launcher.zygote`).
+    on_spawn : callable, optional
+        Called with process ID of MicroDrop process each time it is started
+        (e.g., to run update checks while MicroDrop is running).
 
     Returns
     -------
     int
         Exit code from MicroDrop program.
     '''
+    import conda_helpers as ch
+
+    from .activation import activated_environment
+
     # Prompt user to upgrade MicroDrop if a newer version is available.
     check_version_cache_for_upgrade()
 
@@ -415,6 +530,7 @@ def launch_profile(profile_path):
     # Major version in `RELEASE-VERSION` file and major version of
     # installed MicroDrop package **match**.
     original_directory = ph.path(os.getcwd())
+    zygote_ = None
     try:
         # Change directory into the parent directory of the configuration file.
         os.chdir(config_file.parent)
@@ -422,37 +538,99 @@ def launch_profile(profile_path):
         env = os.environ.copy()
         env['MICRODROP_PROFILE'] = str(profile_path)
         env['MICRODROP_CONFIG'] = str(config_file)
+        # Apply cached changes made by activating Conda environment (if
+        # available).
+        with tracing.span('activated_environment'):
+            activated_env = activated_environment(env)
+        if zygote:
+            with tracing.span('start_zygote'):
+                zygote_ = _start_zygote(activated_env or env)
+        restarts = 0
+
+        def _on_spawn(pid):
+            if on_spawn is None:
+                return
+            try:
+                on_spawn(pid)
+            except Exception:
+                logger.warning('Error in `on_spawn` callback.',
+                               exc_info=True)
+
         # Return code of `5` indicates program should be restarted.
         while return_code is None or return_code == 5:
             # Launch MicroDrop and save return code.
             #
-            # XXX Use `conda_activate_command` to launch MicroDrop in an
-            # **activated** Conda environment.  See [issue #10][i10].
+            # XXX Launch MicroDrop in an **activated** Conda environment.  See
+            # [issue #10][i10].
             #
             # [i10]: https://github.com/wheeler-microfluidics/microdrop-launcher/issues/10
-            command = (ch.conda_activate_command() + ['&', sys.executable,
-                                                      '-m',
-                                                      'microdrop.microdrop',
-                                                      '-c', config_file])
-            return_code = sp.call(command, env=env, shell=True)
+            with tracing.span('microdrop', restart=restarts,
+                              zygote=zygote_ is not None,
+                              shell=activated_env is None) as span:
+                if zygote_ is not None:
+                    return_code = zygote_.run(module='microdrop.microdrop',
+                                              args=['-c', config_file],
+                                              env=activated_env or env,
+                                              on_spawn=_on_spawn)
+                else:
+                    if activated_env is not None:
+                        command = [sys.executable, '-m',
+                                   'microdrop.microdrop', '-c', config_file]
+                        process = sp.Popen(command, env=activated_env)
+                    else:
+                        command = (ch.conda_activate_command() +
+                                   ['&', sys.executable, '-m',
+                                    'microdrop.microdrop', '-c',
+                                    config_file])
+                        process = sp.Popen(command, env=env, shell=True)
+                    _on_spawn(process.pid)
+                    return_code = process.wait()
+                span.args['return_code'] = return_code
+            restarts += 1
     finally:
+        if zygote_ is not None:
+            zygote_.stop()
         # Restore original working directory.
         os.chdir(original_directory)
     return return_code
 
 
-def profile_major_version(profile):
-    release_version_path = ph.path(profile).joinpath('RELEASE-VERSION')
-    if release_version_path.isfile():
-        return get_major_version(release_version_path.lines()[0])
+def _start_zygote(env):
+    '''
+    Returns
+    -------
+    microdrop_launcher.zygote.Zygote or None
+        Started zygote, or ``None`` if zygote mode is not available (or if
+        GUI modules were imported while preloading, i.e., forked children
+        would not be safe).
+    '''
+    from .zygote import Zygote, zygote_available
+
+    if not zygote_available():
+        logger.warning('Zygote mode is not supported on this platform.')
+        return None
+    try:
+        zygote = Zygote(env=env)
+        ready = zygote.start()
+    except Exception:
+        logger.warning('Error starting zygote.', exc_info=True)
+        return None
+    if ready.get('gui_modules'):
+        logger.warning('Zygote imported GUI modules (%s); starting new '
+                       'interpreter for each launch instead.',
+                       ', '.join(ready['gui_modules']))
+        zygote.stop()
+        return None
+    logger.info('Zygote preloaded %s in %.2f s.',
+                ', '.join(ready['preloaded']), ready['duration'])
+    return zygote
 
 
 def installed_major_version():
-    installed_version_str = pkg_resources.get_distribution('microdrop').version
-    return get_major_version(installed_version_str)
+    return VERSION_CONTEXT.major_version_str
 
 
-def import_profile(df_profiles, profile_path, parent=None):
+def import_profile(profiles, profile_path, parent=None):
     '''
     Run post-installation hook for each plugin in profile and append imported
     profile to profiles table.
@@ -462,26 +640,22 @@ def import_profile(df_profiles, profile_path, parent=None):
 
         All plugin dependencies are assumed to be installed a priori.
 
+    .. versionchanged:: 0.8
+        Operate on :class:`ProfileRegistry` instead of
+        :class:`pandas.DataFrame`.
+
     Parameters
     ----------
-    df_profiles : pandas.DataFrame
-        Table of MicroDrop profile descriptions.
-
-        Must include *at least* the column ``path`` containing the file system
-        path to each profile directory.
+    profiles : ProfileRegistry
+        MicroDrop profile records.
     profile_path : str
         Path to profile directory.
 
     Returns
     -------
-    pandas.DataFrame
-        Table of MicroDrop profile descriptions with row appended for imported
-        profile.
+    ProfileRegistry
+        MicroDrop profile records, including imported profile.
     '''
     verify_or_create_profile_version(profile_path)
-    major_version = profile_major_version(profile_path)
-    df_profiles = df_profiles.append({'path': profile_path,
-                                      'major_version': major_version},
-                                     ignore_index=True)
-    df_profiles.drop_duplicates(subset=['path'], inplace=True)
-    return df_profiles
+    scan_profile(profiles.add(profile_path))
+    return profiles
@@ -0,0 +1,154 @@
+'''
+Profile launcher startup using :mod:`cProfile` (and :mod:`tracemalloc`, if
+available).
+
+Profile data files are written to the launcher user log directory (see
+:func:`profile_directory`), such that they may be attached to bug reports.
+Only the :data:`PROFILE_RETENTION` most recent files of each kind are kept.
+
+.. versionadded:: 0.8
+'''
+import cProfile
+import datetime as dt
+import logging
+import os
+import pstats
+import sys
+import threading
+
+from .dirs import AppDirs
+
+logger = logging.getLogger(__name__)
+
+#: Number of most recent profile files (of each kind) to keep.
+PROFILE_RETENTION = 10
+#: Number of functions listed in summary.
+SUMMARY_TOP_N = 20
+
+
+def profile_directory():
+    '''
+    Returns
+    -------
+    path_helpers.path
+        Launcher user log directory.
+    '''
+    return AppDirs('microdrop-launcher').user_log_dir
+
+
+def _prune(directory, pattern, keep):
+    paths = sorted(directory.files(pattern), key=lambda p: p.getmtime(),
+                   reverse=True)
+    for path_i in paths[keep:]:
+        try:
+            path_i.remove()
+        except OSError:
+            logger.debug('Error removing `%s`.', path_i, exc_info=True)
+
+
+def profile_call(function, name, memory=False, directory=None,
+                 top=SUMMARY_TOP_N, keep=PROFILE_RETENTION, stream=None):
+    '''
+    Call function under :mod:`cProfile`, write profile data files and print a
+    summary of the functions with the highest cumulative time.
+
+    Threads started while :data:`function` is running (e.g., background
+    upgrade checks) are profiled as well, and merged into the same
+    statistics.
+
+    Parameters
+    ----------
+    function : callable
+        Function to profile (called without arguments).
+    name : str
+        Profile file name prefix, e.g., ``"profile_launcher"``.
+    memory : bool, optional
+        If ``True``, also trace memory allocations using :mod:`tracemalloc`
+        (if available) and write a snapshot file.
+    directory : str, optional
+        Output directory (default: :func:`profile_directory`).
+    top : int, optional
+        Number of functions listed in summary.
+    keep : int, optional
+        Number of most recent profile files (of each kind) to keep.
+    stream : file-like, optional
+        Summary output stream (default: :data:`sys.stderr`).
+
+    Returns
+    -------
+    object
+        Return value of :data:`function`.
+    '''
+    if directory is None:
+        directory = profile_directory()
+    if stream is None:
+        stream = sys.stderr
+
+    tracemalloc = None
+    if memory:
+        try:
+            import tracemalloc
+        except ImportError:
+            logger.warning('`tracemalloc` is not available; memory '
+                           'allocations are not traced.')
+        else:
+            tracemalloc.start()
+
+    profilers = [cProfile.Profile()]
+    profilers_lock = threading.Lock()
+
+    def _thread_profile_hook(*args):
+        # Called on first profile event in each new thread; replace hook with
+        # a profiler for the thread.
+        profiler = cProfile.Profile()
+        with profilers_lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    threading.setprofile(_thread_profile_hook)
+    profilers[0].enable()
+    try:
+        return function()
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+        try:
+            _write_profile(name, profilers, tracemalloc, directory, top, keep,
+                           stream)
+        except Exception:
+            logger.error('Error writing startup profile.', exc_info=True)
+
+
+def _write_profile(name, profilers, tracemalloc, directory, top, keep,
+                   stream):
+    directory.makedirs_p()
+    stem = '{}-{}-{}'.format(name, dt.datetime.now()
+                             .strftime('%Y%m%d-%H%M%S'), os.getpid())
+
+    stats = pstats.Stats(profilers[0], stream=stream)
+    for profiler_i in profilers[1:]:
+        # **N.B.**, statistics of threads that are still running (e.g.,
+        # daemon threads) are included up to this point.
+        try:
+            stats.add(profiler_i)
+        except TypeError:
+            # No statistics recorded by profiler.
+            pass
+    stats_path = directory.joinpath(stem + '.pstats')
+    stats.dump_stats(stats_path)
+    _prune(directory, name + '-*.pstats', keep)
+
+    print >> stream, ''
+    print >> stream, 'Startup profile written to: {}'.format(stats_path)
+    stats.sort_stats('cumulative').print_stats(top)
+
+    if tracemalloc is not None:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        snapshot_path = directory.joinpath(stem + '.tracemalloc')
+        snapshot.dump(snapshot_path)
+        _prune(directory, name + '-*.tracemalloc', keep)
+        print >> stream, ('Memory snapshot written to: {}'
+                          .format(snapshot_path))
+        for stat_i in snapshot.statistics('lineno')[:top]:
+            print >> stream, '    {}'.format(stat_i)
@@ -0,0 +1,594 @@
+'''
+Compact registry of MicroDrop profiles.
+
+Replaces the :class:`pandas.DataFrame` previously used to hold the list of
+profiles, such that :mod:`pandas` is not loaded by the launcher.
+
+.. versionadded:: 0.8
+'''
+import datetime as dt
+import hashlib
+import logging
+import time
+
+import path_helpers as ph
+
+from .files import atomic_write, yaml_dump, yaml_load
+
+logger = logging.getLogger(__name__)
+
+#: Profile record attributes saved to the profiles list file.
+#:
+#: The ``release_*`` fields cache the contents of the ``RELEASE-VERSION`` file
+#: of each profile, keyed by the modified time and size of the file (see
+#: :func:`microdrop_launcher.scanner.scan_profile`).
+SAVED_FIELDS = ('used_timestamp', 'path', 'release_version', 'release_mtime',
+                'release_size')
+
+
+def parse_timestamp(value):
+    '''
+    Parameters
+    ----------
+    value : int, float, str or None
+        Epoch time, or date and time string as written by earlier launcher
+        versions (e.g., ``"2017-05-01 13:37:00.123456"``).
+
+    Returns
+    -------
+    int or None
+        Epoch time (in seconds), or ``None`` if no time is specified.
+    '''
+    if value is None:
+        return None
+    elif isinstance(value, (int, long, float)):
+        return int(value)
+    value = str(value).strip()
+    if value in ('', 'nan', 'None', 'NaT'):
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    for format_i in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            timestamp = dt.datetime.strptime(value, format_i)
+        except ValueError:
+            continue
+        return int(time.mktime(timestamp.timetuple()))
+    raise ValueError('Unrecognized timestamp: `{}`'.format(value))
+
+
+def format_timestamp(timestamp):
+    '''
+    Parameters
+    ----------
+    timestamp : int or None
+        Epoch time (in seconds).
+
+    Returns
+    -------
+    str
+        Local date and time, or empty string if :data:`timestamp` is ``None``.
+    '''
+    if not timestamp:
+        return ''
+    return (dt.datetime.fromtimestamp(timestamp)
+            .strftime('%Y-%m-%d %H:%M:%S'))
+
+
+class ProfileRecord(object):
+    '''
+    Description of a single MicroDrop profile.
+
+    Attributes
+    ----------
+    path : str
+        File system path to profile directory.
+    used_timestamp : int or None
+        Most recent time (epoch seconds) that profile was launched.
+    major_version : str or None
+        MicroDrop major version of profile, e.g., ``"2.0"``.
+    release_version : str or None
+        Contents of ``RELEASE-VERSION`` file in profile directory.
+    release_mtime, release_size : float or None, int or None
+        Modified time and size of ``RELEASE-VERSION`` file when
+        :attr:`release_version` was read.
+    exists : bool or None
+        ``True`` if profile directory exists (``None`` if not scanned yet).
+    status : str or None
+        Profile validation status (see :mod:`microdrop_launcher.scanner`), or
+        ``None`` if profile has not been scanned in this process.
+    '''
+    __slots__ = ('path', 'used_timestamp', 'major_version', 'sequence',
+                 'release_version', 'release_mtime', 'release_size', 'exists',
+                 'status')
+
+    def __init__(self, path, used_timestamp=None, major_version=None,
+                 sequence=0, release_version=None, release_mtime=None,
+                 release_size=None):
+        self.path = str(path)
+        self.used_timestamp = parse_timestamp(used_timestamp)
+        self.major_version = major_version
+        # Insertion order (used to break ties between equal timestamps).
+        self.sequence = sequence
+        self.release_version = release_version
+        self.release_mtime = release_mtime
+        self.release_size = release_size
+        self.exists = None
+        self.status = None
+
+    def copy(self):
+        record = ProfileRecord(self.path, self.used_timestamp,
+                               self.major_version, self.sequence,
+                               self.release_version, self.release_mtime,
+                               self.release_size)
+        record.exists = self.exists
+        record.status = self.status
+        return record
+
+    def to_dict(self):
+        '''
+        Returns
+        -------
+        dict
+            Saved fields of record (see :data:`SAVED_FIELDS`).
+        '''
+        return dict((field_i, getattr(self, field_i))
+                    for field_i in SAVED_FIELDS)
+
+    def __repr__(self):
+        return ('<ProfileRecord path={!r} used_timestamp={!r} '
+                'major_version={!r}>'.format(self.path, self.used_timestamp,
+                                             self.major_version))
+
+
+class ProfileRegistry(object):
+    '''
+    MicroDrop profiles indexed by path.
+
+    Iteration yields records in most recently used order (records that were
+    never launched are yielded last, in insertion order).
+
+    Adding, removing, and updating the used time of a profile are constant
+    time operations; the most recently used ordering is computed on demand
+    and cached until the registry changes.
+
+    Attributes
+    ----------
+    saved_digest : str or None
+        SHA1 digest of profiles list file contents when last loaded or saved
+        (used to skip writes when nothing has changed).
+    saved_values : dict or None
+        Saved field values of each record when last loaded from or saved to a
+        :class:`SqliteProfileStore` (used to only write changed records).
+    '''
+    def __init__(self, records=None):
+        self._records = {}
+        self._sequence = 0
+        self._ordered = None
+        self.saved_digest = None
+        self.saved_values = None
+        for record_i in (records or []):
+            self._insert(record_i.copy())
+
+    @classmethod
+    def from_records(cls, records):
+        '''
+        Parameters
+        ----------
+        records : list
+            List of dictionaries, each containing *at least* a ``path`` key,
+            as loaded from a profiles list file.
+
+            Malformed entries are skipped.  If a path occurs more than once,
+            the most recently used entry is kept.
+
+        Returns
+        -------
+        ProfileRegistry
+        '''
+        registry = cls()
+        for record_i in (records or []):
+            try:
+                new_i = ProfileRecord(record_i['path'],
+                                      record_i.get('used_timestamp'),
+                                      release_version=record_i
+                                      .get('release_version'),
+                                      release_mtime=record_i
+                                      .get('release_mtime'),
+                                      release_size=record_i
+                                      .get('release_size'))
+            except Exception:
+                logger.debug('Skipping malformed profile entry: %r', record_i,
+                             exc_info=True)
+                continue
+            existing_i = registry.get(new_i.path)
+            if existing_i is None or ((new_i.used_timestamp or 0) >
+                                      (existing_i.used_timestamp or 0)):
+                registry.discard(new_i.path)
+                registry._insert(new_i)
+        return registry
+
+    @classmethod
+    def load(cls, profiles_path):
+        '''
+        Load registry from profiles list file.
+
+        Parameters
+        ----------
+        profiles_path : str
+            Path to YAML profiles list file.
+
+        Returns
+        -------
+        ProfileRegistry
+            Profile registry (empty if file does not exist).
+        '''
+        profiles_path = ph.path(profiles_path)
+        if not profiles_path.isfile():
+            return cls()
+        with profiles_path.open('rb') as input_:
+            data = input_.read()
+        registry = cls.from_records(yaml_load(data))
+        registry.saved_digest = hashlib.sha1(data).hexdigest()
+        return registry
+
+    def dumps(self):
+        '''
+        Returns
+        -------
+        str
+            YAML profiles list (see :meth:`to_records`).
+        '''
+        return yaml_dump(self.to_records(), default_flow_style=False)
+
+    def save(self, profiles_path, force=False):
+        '''
+        Atomically write registry to profiles list file, unless the contents
+        are unchanged since the file was last loaded or saved.
+
+        Parameters
+        ----------
+        profiles_path : str
+            Path to YAML profiles list file.
+        force : bool, optional
+            Write file even if contents are unchanged.
+
+        Returns
+        -------
+        bool
+            ``True`` if file was written.
+        '''
+        profiles_path = ph.path(profiles_path)
+        data = self.dumps()
+        digest = hashlib.sha1(data).hexdigest()
+        if not force and digest == self.saved_digest and \
+                profiles_path.isfile():
+            logger.debug('Profiles unchanged; not writing `%s`.',
+                         profiles_path)
+            return False
+        atomic_write(profiles_path, data)
+        self.saved_digest = digest
+        return True
+
+    def to_records(self):
+        '''
+        Returns
+        -------
+        list
+            List of dictionaries (one per profile, most recently used first)
+            containing the fields in :data:`SAVED_FIELDS`.
+        '''
+        return [record_i.to_dict() for record_i in self]
+
+    def add(self, path, used_timestamp=None, major_version=None):
+        '''
+        Add profile to registry.
+
+        If a profile with the same path is already registered, the existing
+        record is left unchanged.
+
+        Returns
+        -------
+        ProfileRecord
+            Record for profile path.
+        '''
+        record = self._records.get(str(path))
+        if record is None:
+            record = self._insert(ProfileRecord(path, used_timestamp,
+                                                major_version))
+        return record
+
+    def _insert(self, record):
+        record.sequence = self._sequence
+        self._sequence += 1
+        self._records[record.path] = record
+        self._ordered = None
+        return record
+
+    def remove(self, path):
+        '''
+        Raises
+        ------
+        KeyError
+            If profile path is not registered.
+        '''
+        del self._records[str(path)]
+        self._ordered = None
+
+    def discard(self, path):
+        '''
+        Remove profile from registry, if present.
+        '''
+        if self._records.pop(str(path), None) is not None:
+            self._ordered = None
+
+    def drop(self, paths):
+        '''
+        Remove each of the specified profiles from the registry, if present.
+        '''
+        for path_i in paths:
+            self.discard(path_i)
+
+    def touch(self, path, timestamp=None):
+        '''
+        Set the most recent time that profile was launched.
+
+        Parameters
+        ----------
+        path : str
+            Profile path.
+        timestamp : int, optional
+            Epoch time (default: current time).
+        '''
+        record = self._records[str(path)]
+        record.used_timestamp = (int(time.time()) if timestamp is None
+                                 else parse_timestamp(timestamp))
+        self._ordered = None
+
+    def get(self, path, default=None):
+        return self._records.get(str(path), default)
+
+    def first(self):
+        '''
+        Returns
+        -------
+        ProfileRecord or None
+            Most recently used profile, or ``None`` if registry is empty.
+        '''
+        ordered = self.ordered()
+        return ordered[0] if ordered else None
+
+    def ordered(self):
+        '''
+        Returns
+        -------
+        list
+            Profile records, most recently used first.
+        '''
+        if self._ordered is None:
+            self._ordered = sorted(self._records.itervalues(),
+                                   key=lambda r: (-(r.used_timestamp or 0),
+                                                  r.sequence))
+        return self._ordered
+
+    def paths(self):
+        return [record_i.path for record_i in self.ordered()]
+
+    def copy(self):
+        registry = ProfileRegistry()
+        for record_i in self.ordered():
+            registry._records[record_i.path] = record_i.copy()
+        registry._sequence = self._sequence
+        registry.saved_digest = self.saved_digest
+        registry.saved_values = self.saved_values
+        return registry
+
+    def __getitem__(self, path):
+        return self._records[str(path)]
+
+    def __contains__(self, path):
+        return str(path) in self._records
+
+    def __iter__(self):
+        return iter(self.ordered())
+
+    def __len__(self):
+        return len(self._records)
+
+    def __repr__(self):
+        return '<ProfileRegistry {!r}>'.format(self.ordered())
+
+
+class YamlProfileStore(object):
+    '''
+    Profile registry backed by a YAML profiles list file (default).
+
+    Parameters
+    ----------
+    profiles_path : str
+        Path to YAML profiles list file.
+    '''
+    def __init__(self, profiles_path):
+        self.path = ph.path(profiles_path)
+
+    def load(self):
+        return ProfileRegistry.load(self.path)
+
+    def save(self, registry):
+        '''
+        Returns
+        -------
+        bool
+            ``True`` if file was written.
+        '''
+        return registry.save(self.path)
+
+
+class SqliteProfileStore(object):
+    '''
+    Profile registry backed by a SQLite database.
+
+    Unlike :class:`YamlProfileStore`, only records that changed since the
+    registry was loaded are written, each save within a single transaction.
+    Concurrent launcher instances therefore do not discard each other's
+    changes (e.g., new profiles or used timestamps).
+
+    On first use, profiles are imported from the YAML profiles list file (if
+    specified).
+
+    Parameters
+    ----------
+    db_path : str
+        Path to SQLite database file.
+    yaml_path : str, optional
+        Path to YAML profiles list file to import profiles from once.
+    timeout : float, optional
+        Maximum time (in seconds) to wait for a lock held by another process.
+    '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS profiles (path TEXT PRIMARY KEY,
+                                             used_timestamp INTEGER,
+                                             release_version TEXT,
+                                             release_mtime REAL,
+                                             release_size INTEGER);
+        CREATE INDEX IF NOT EXISTS profiles_used_timestamp
+            ON profiles (used_timestamp DESC);
+        CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY,
+                                             value TEXT);
+    '''
+
+    def __init__(self, db_path, yaml_path=None, timeout=10.):
+        self.path = ph.path(db_path)
+        self.yaml_path = None if yaml_path is None else ph.path(yaml_path)
+        self.timeout = timeout
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            import sqlite3
+
+            self.path.parent.makedirs_p()
+            # Use `isolation_level=None` to manage transactions explicitly.
+            #
+            # **N.B.**, store may be loaded and saved from different threads
+            # (but never concurrently).
+            self._connection = sqlite3.connect(self.path,
+                                               timeout=self.timeout,
+                                               isolation_level=None,
+                                               check_same_thread=False)
+            # Use byte strings for paths, consistent with YAML store.
+            self._connection.text_factory = str
+            self._connection.executescript(self.SCHEMA)
+            self._import_yaml()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _transaction(self):
+        return _SqliteTransaction(self.connection)
+
+    def _import_yaml(self):
+        connection = self._connection
+        with _SqliteTransaction(connection):
+            imported = connection.execute('SELECT value FROM metadata WHERE '
+                                          'key = ?', ('yaml_imported',))
+            if imported.fetchone() is not None:
+                return
+            if self.yaml_path is not None and self.yaml_path.isfile():
+                try:
+                    registry = ProfileRegistry.load(self.yaml_path)
+                except Exception:
+                    logger.error('Error importing profiles from `%s`.',
+                                 self.yaml_path, exc_info=True)
+                else:
+                    connection.executemany('INSERT OR IGNORE INTO profiles '
+                                           '(%s) VALUES (?, ?, ?, ?, ?)' %
+                                           ', '.join(SAVED_FIELDS),
+                                           [_saved_values(record_i)
+                                            for record_i in registry])
+                    logger.info('Imported %d profile(s) from `%s`.',
+                                len(registry), self.yaml_path)
+            connection.execute('INSERT INTO metadata (key, value) VALUES '
+                               '(?, ?)', ('yaml_imported',
+                                          str(self.yaml_path)))
+
+    def load(self, limit=None):
+        '''
+        Parameters
+        ----------
+        limit : int, optional
+            Maximum number of (most recently used) profiles to load.
+
+        Returns
+        -------
+        ProfileRegistry
+        '''
+        query = ('SELECT %s FROM profiles ORDER BY used_timestamp DESC' %
+                 ', '.join(SAVED_FIELDS))
+        if limit is not None:
+            query += ' LIMIT %d' % limit
+        registry = ProfileRegistry()
+        for row_i in self.connection.execute(query):
+            values_i = dict(zip(SAVED_FIELDS, row_i))
+            registry._insert(ProfileRecord(**values_i))
+        registry.saved_values = dict((record_i.path, _saved_values(record_i))
+                                     for record_i in registry)
+        return registry
+
+    def save(self, registry):
+        '''
+        Write records added, changed or removed since registry was loaded (or
+        last saved) in a single transaction.
+
+        Returns
+        -------
+        bool
+            ``True`` if any records were written.
+        '''
+        saved_values = getattr(registry, 'saved_values', None) or {}
+        current_values = dict((record_i.path, _saved_values(record_i))
+                              for record_i in registry)
+        changed = [values_i for path_i, values_i in current_values.iteritems()
+                   if saved_values.get(path_i) != values_i]
+        removed = [(path_i, ) for path_i in saved_values
+                   if path_i not in current_values]
+        if not (changed or removed):
+            return False
+        with self._transaction():
+            self.connection.executemany('INSERT OR REPLACE INTO profiles (%s) '
+                                        'VALUES (?, ?, ?, ?, ?)' %
+                                        ', '.join(SAVED_FIELDS), changed)
+            self.connection.executemany('DELETE FROM profiles WHERE path = ?',
+                                        removed)
+        registry.saved_values = current_values
+        return True
+
+
+def _saved_values(record):
+    return tuple(getattr(record, field_i) for field_i in SAVED_FIELDS)
+
+
+class _SqliteTransaction(object):
+    '''
+    Context manager: ``BEGIN IMMEDIATE`` (i.e., take write lock) on enter;
+    commit on success or roll back on error.
+    '''
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, type_, value, traceback):
+        if type_ is None:
+            self.connection.execute('COMMIT')
+        else:
+            self.connection.execute('ROLLBACK')
+        return False
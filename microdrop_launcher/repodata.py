@@ -0,0 +1,189 @@
+'''
+Look up available package versions in Conda's cached channel repodata.
+
+Conda caches the package index (``repodata.json``) of each channel it queries
+in the ``cache`` directory of each package directory (e.g.,
+``<root prefix>/pkgs/cache/<hash>.json``).  These files are several megabytes
+each, so rather than decoding them, each file is memory-mapped and scanned for
+package file names of the form ``"<name>-<version>-<build>.tar.bz2"``.
+
+**N.B.**, cached repodata is only as recent as the last Conda command that
+updated the channel index.
+
+.. versionadded:: 0.8
+'''
+import logging
+import mmap
+import os
+import re
+
+import path_helpers as ph
+
+from .conda_meta import split_dist_name
+from .version_context import VERSION_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+CRE_URL = re.compile(r'"_url"\s*:\s*"([^"]+)"')
+
+
+def _root_prefix(prefix):
+    prefix = ph.path(prefix)
+    if prefix.parent.name == 'envs':
+        # Named environment, i.e., `<root prefix>/envs/<name>`.
+        return prefix.parent.parent
+    return prefix
+
+
+def repodata_cache_dirs(prefix=None):
+    '''
+    Parameters
+    ----------
+    prefix : str, optional
+        Conda environment prefix (default: active Conda environment).
+
+    Returns
+    -------
+    list
+        Existing Conda repodata cache directories, in order of precedence
+        (i.e., ``CONDA_PKGS_DIRS``, ``<root prefix>/pkgs``,
+        ``~/.conda/pkgs``).
+    '''
+    if prefix is None:
+        import conda_helpers as ch
+
+        prefix = ch.conda_prefix()
+
+    pkgs_dirs = []
+    if os.environ.get('CONDA_PKGS_DIRS'):
+        pkgs_dirs.extend(dir_i.strip() for dir_i in
+                         re.split(r'[,%s]' % re.escape(os.pathsep),
+                                  os.environ['CONDA_PKGS_DIRS'])
+                         if dir_i.strip())
+    if prefix is not None:
+        pkgs_dirs.append(_root_prefix(prefix).joinpath('pkgs'))
+    pkgs_dirs.append(ph.path('~/.conda/pkgs').expand())
+
+    cache_dirs = []
+    for pkgs_dir_i in pkgs_dirs:
+        cache_dir_i = ph.path(pkgs_dir_i).joinpath('cache')
+        if cache_dir_i.isdir() and cache_dir_i not in cache_dirs:
+            cache_dirs.append(cache_dir_i)
+    return cache_dirs
+
+
+def _scan_repodata(path, cre_package):
+    '''
+    Returns
+    -------
+    tuple
+        ``(channel url, matched distribution names)``.
+    '''
+    with open(path, 'rb') as input_:
+        if os.fstat(input_.fileno()).st_size == 0:
+            return None, []
+        data = mmap.mmap(input_.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            url_match = CRE_URL.search(data)
+            dist_names = [match_i.group(1)
+                          for match_i in cre_package.finditer(data)]
+        finally:
+            data.close()
+    return (url_match.group(1) if url_match else None), dist_names
+
+
+def cached_package_versions(package_names, channels=None, cache_dirs=None):
+    '''
+    Look up versions of several packages in a single pass over the cached
+    repodata.
+
+    Parameters
+    ----------
+    package_names : list
+        Conda package names.
+    channels : list, optional
+        If specified, only consider cached repodata of these channels (e.g.,
+        ``['sci-bots']``).
+    cache_dirs : list, optional
+        Repodata cache directories (default: see
+        :func:`repodata_cache_dirs`).
+
+    Returns
+    -------
+    dict
+        Mapping from each package name to set of versions found in cached
+        repodata.
+    '''
+    if cache_dirs is None:
+        cache_dirs = repodata_cache_dirs()
+    versions = dict((name_i, set()) for name_i in package_names)
+    if not versions:
+        return versions
+    cre_package = re.compile(r'"((?:%s)-[^"/\\]+)\.tar\.bz2"' %
+                             '|'.join(re.escape(name_i)
+                                      for name_i in package_names))
+    for cache_dir_i in cache_dirs:
+        for path_j in ph.path(cache_dir_i).files('*.json'):
+            try:
+                url_j, dist_names_j = _scan_repodata(path_j, cre_package)
+            except (IOError, OSError, ValueError):
+                logger.debug('Error reading `%s`.', path_j, exc_info=True)
+                continue
+            if channels and not (url_j and
+                                 any('/{}/'.format(channel_k) in url_j
+                                     for channel_k in channels)):
+                continue
+            for dist_name_k in dist_names_j:
+                try:
+                    name_k, version_k, build_k = split_dist_name(dist_name_k)
+                except ValueError:
+                    continue
+                # **N.B.**, e.g., `microdrop-launcher-...` also matches
+                # `microdrop-...`, so check for exact package name.
+                if name_k in versions:
+                    versions[name_k].add(version_k)
+    return versions
+
+
+def cached_versions(package_name, channels=None, cache_dirs=None):
+    '''
+    Parameters
+    ----------
+    package_name : str
+        Conda package name.
+    channels : list, optional
+        See :func:`cached_package_versions`.
+    cache_dirs : list, optional
+        See :func:`cached_package_versions`.
+
+    Returns
+    -------
+    set
+        Versions of package found in cached repodata.
+    '''
+    return cached_package_versions([package_name], channels=channels,
+                                   cache_dirs=cache_dirs)[package_name]
+
+
+def latest_cached_version(package_name, channels=None, cache_dirs=None):
+    '''
+    Parameters
+    ----------
+    package_name : str
+        Conda package name.
+    channels : list, optional
+        See :func:`cached_versions`.
+    cache_dirs : list, optional
+        See :func:`cached_versions`.
+
+    Returns
+    -------
+    str or None
+        Latest version of package found in cached repodata (or ``None`` if
+        package was not found).
+    '''
+    versions = cached_versions(package_name, channels=channels,
+                               cache_dirs=cache_dirs)
+    if not versions:
+        return None
+    return max(versions, key=VERSION_CONTEXT.parse)
@@ -0,0 +1,300 @@
+'''
+Single-pass validation of MicroDrop profiles.
+
+Each profile is visited once per process: the ``RELEASE-VERSION`` file is
+stat'ed, and only read if its modified time or size differ from the values
+cached in the profile record (which are persisted in the profiles list file).
+
+Profiles are probed concurrently on a bounded pool of daemon threads, each
+with a deadline, such that profiles on unreachable network drives do not
+stall the launcher.  Paths that time out are marked as unavailable and are not
+probed again for :data:`UNAVAILABLE_TTL` seconds.
+
+.. versionadded:: 0.8
+'''
+import Queue
+import logging
+import os
+import threading
+import time
+
+from .cache import load_cached, save_cached
+from .version_context import VERSION_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+#: Maximum time (in seconds) to wait for file system probes of a profile.
+PROBE_TIMEOUT = 2.
+#: Maximum number of concurrent profile probes.
+MAX_PROBE_WORKERS = 8
+#: Time (in seconds) to skip probing profile paths that timed out.
+UNAVAILABLE_TTL = 60.
+
+#: Profile version matches installed MicroDrop major version.
+STATUS_OK = 'ok'
+#: No (valid) ``RELEASE-VERSION`` file found in profile directory.
+STATUS_MISSING = 'missing'
+#: Profile major version differs from installed MicroDrop major version.
+STATUS_MISMATCH = 'mismatch'
+#: Profile directory does not exist.
+STATUS_NOT_FOUND = 'not found'
+#: Probing profile directory timed out (e.g., unreachable network drive).
+STATUS_UNAVAILABLE = 'unavailable'
+
+# Negative cache of unavailable profile paths, i.e., `{<path>: <expiry time>}`
+# (shared between threads and persisted in the launcher cache directory).
+_unavailable = None
+_unavailable_lock = threading.Lock()
+
+
+def _read_release_version(release_version_path):
+    with open(release_version_path, 'r') as input_:
+        return input_.readline().strip() or None
+
+
+def scan_profile(record, installed_major=None):
+    '''
+    Update path existence, release version, major version and validation
+    status of profile record.
+
+    Parameters
+    ----------
+    record : microdrop_launcher.registry.ProfileRecord
+        Profile record (updated in place).
+    installed_major : int, optional
+        Installed MicroDrop major version (default: look up using
+        :data:`VERSION_CONTEXT`).
+
+    Returns
+    -------
+    microdrop_launcher.registry.ProfileRecord
+        Input profile record.
+    '''
+    if installed_major is None:
+        installed_major = VERSION_CONTEXT.major_version
+
+    release_version_path = os.path.join(record.path, 'RELEASE-VERSION')
+    try:
+        stat = os.stat(release_version_path)
+    except OSError:
+        # No `RELEASE-VERSION` file (or no profile directory).
+        record.exists = os.path.isdir(record.path)
+        record.release_version = None
+        record.release_mtime = None
+        record.release_size = None
+    else:
+        record.exists = True
+        if (record.release_version is None or
+                record.release_mtime != stat.st_mtime or
+                record.release_size != stat.st_size):
+            # `RELEASE-VERSION` file has changed since it was last read.
+            try:
+                record.release_version = \
+                    _read_release_version(release_version_path)
+            except IOError:
+                logger.debug('Error reading `%s`.', release_version_path,
+                             exc_info=True)
+                record.release_version = None
+            record.release_mtime = stat.st_mtime
+            record.release_size = stat.st_size
+
+    if not record.exists:
+        record.major_version = None
+        record.status = STATUS_NOT_FOUND
+        return record
+
+    try:
+        major = VERSION_CONTEXT.major(record.release_version)
+    except (AttributeError, ValueError):
+        # No `RELEASE-VERSION` file, or file does not contain a version.
+        record.major_version = None
+        record.status = STATUS_MISSING
+    else:
+        record.major_version = '{}.0'.format(major)
+        record.status = (STATUS_OK if major == installed_major
+                         else STATUS_MISMATCH)
+    return record
+
+
+def _unavailable_paths():
+    '''
+    Returns
+    -------
+    dict
+        Mapping from unavailable profile path to expiry time of entry in
+        negative cache (loaded from disk on first call).
+    '''
+    global _unavailable
+
+    with _unavailable_lock:
+        if _unavailable is None:
+            try:
+                _unavailable = load_cached('scanner', 'unavailable',
+                                           ttl=UNAVAILABLE_TTL) or {}
+            except Exception:
+                logger.debug('Error loading unavailable profile paths.',
+                             exc_info=True)
+                _unavailable = {}
+        now = time.time()
+        for path_i, expiry_i in _unavailable.items():
+            if expiry_i <= now:
+                del _unavailable[path_i]
+        return dict(_unavailable)
+
+
+def _mark_unavailable(paths):
+    # Ensure negative cache is loaded.
+    _unavailable_paths()
+    with _unavailable_lock:
+        expiry = time.time() + UNAVAILABLE_TTL
+        for path_i in paths:
+            _unavailable[path_i] = expiry
+        try:
+            save_cached('scanner', 'unavailable', _unavailable)
+        except Exception:
+            logger.debug('Error saving unavailable profile paths.',
+                         exc_info=True)
+
+
+def probe_profiles(records, installed_major=None, timeout=PROBE_TIMEOUT,
+                   max_workers=MAX_PROBE_WORKERS):
+    '''
+    Scan profile records concurrently (see :func:`scan_profile`), giving up on
+    each profile :data:`timeout` seconds after its probe starts.
+
+    Probes run on daemon threads, so a probe blocked on an unreachable path
+    never prevents the launcher from exiting.  A replacement thread is started
+    for each probe that times out, such that at most :data:`max_workers`
+    probes are *active* at any time.
+
+    Parameters
+    ----------
+    records : list
+        Profile records (updated in place).
+    installed_major : int, optional
+        Installed MicroDrop major version.
+    timeout : float, optional
+        Maximum time (in seconds) to wait for the probe of a single profile.
+    max_workers : int, optional
+        Maximum number of concurrent probes.
+
+    Returns
+    -------
+    list
+        Paths of profiles that timed out (status set to
+        :data:`STATUS_UNAVAILABLE`).
+    '''
+    if installed_major is None:
+        installed_major = VERSION_CONTEXT.major_version
+
+    queue = Queue.Queue()
+    for record_i in records:
+        queue.put(record_i)
+    condition = threading.Condition()
+    started = {}
+    results = {}
+
+    def _worker():
+        while True:
+            try:
+                record = queue.get_nowait()
+            except Queue.Empty:
+                return
+            with condition:
+                started[record.path] = time.time()
+            # Probe a copy, so an abandoned probe cannot modify the record.
+            result = scan_profile(record.copy(),
+                                  installed_major=installed_major)
+            with condition:
+                results[record.path] = result
+                condition.notify()
+
+    def _start_worker():
+        thread = threading.Thread(target=_worker)
+        thread.daemon = True
+        thread.start()
+
+    for i in xrange(min(max_workers, len(records))):
+        _start_worker()
+
+    pending = set(record_i.path for record_i in records)
+    timed_out = []
+    with condition:
+        while pending:
+            now = time.time()
+            wait_time = timeout
+            for path_i in list(pending):
+                if path_i in results:
+                    pending.remove(path_i)
+                elif path_i in started:
+                    remaining_i = started[path_i] + timeout - now
+                    if remaining_i <= 0:
+                        # Abandon probe and replace blocked worker thread.
+                        pending.remove(path_i)
+                        timed_out.append(path_i)
+                        if not queue.empty():
+                            _start_worker()
+                    else:
+                        wait_time = min(wait_time, remaining_i)
+            if pending:
+                condition.wait(wait_time)
+
+    for record_i in records:
+        if record_i.path in results:
+            result_i = results[record_i.path]
+            for attr_i in ('exists', 'release_version', 'release_mtime',
+                           'release_size', 'major_version', 'status'):
+                setattr(record_i, attr_i, getattr(result_i, attr_i))
+        else:
+            record_i.exists = None
+            record_i.status = STATUS_UNAVAILABLE
+    if timed_out:
+        logger.warning('Timed out probing profile(s): %s',
+                       ', '.join(timed_out))
+        _mark_unavailable(timed_out)
+    return timed_out
+
+
+def scan_profiles(profiles, rescan=False, timeout=PROBE_TIMEOUT,
+                  max_workers=MAX_PROBE_WORKERS):
+    '''
+    Scan each profile in registry (see :func:`probe_profiles`).
+
+    Profiles that timed out within the last :data:`UNAVAILABLE_TTL` seconds
+    are marked as unavailable without being probed.
+
+    Parameters
+    ----------
+    profiles : microdrop_launcher.registry.ProfileRegistry
+        MicroDrop profile records (updated in place).
+    rescan : bool, optional
+        If ``False``, only scan records that have not been scanned yet in
+        this process (or that were unavailable when last scanned).
+    timeout : float, optional
+        Maximum time (in seconds) to wait for the probe of a single profile.
+    max_workers : int, optional
+        Maximum number of concurrent probes.
+
+    Returns
+    -------
+    microdrop_launcher.registry.ProfileRegistry
+        Input profile registry.
+    '''
+    records = [record_i for record_i in profiles
+               if rescan or record_i.status in (None, STATUS_UNAVAILABLE)]
+    if not records:
+        return profiles
+
+    unavailable = _unavailable_paths()
+    probe_records = []
+    for record_i in records:
+        if record_i.path in unavailable:
+            record_i.exists = None
+            record_i.status = STATUS_UNAVAILABLE
+        else:
+            probe_records.append(record_i)
+    if probe_records:
+        probe_profiles(probe_records,
+                       installed_major=VERSION_CONTEXT.major_version,
+                       timeout=timeout, max_workers=max_workers)
+    return profiles
@@ -0,0 +1,150 @@
+'''
+Track running launcher sessions.
+
+Each launcher process holds an exclusive lock (see
+:class:`microdrop_launcher.files.FileLock`) on its own session lock file,
+``<MicroDrop user config dir>/sessions/<pid>.lock``, for as long as it runs.
+The operating system releases the lock when the process exits, so any
+launcher process can tell whether another session is still running by trying
+each lock without waiting (see :func:`other_sessions_running`).
+
+Session lock files are created and locked while holding the registry lock
+(see :func:`registry_lock`), such that a session that has created its file
+but not yet locked it is never mistaken for a stale session.
+
+.. versionadded:: 0.8
+'''
+import atexit
+import logging
+import os
+
+from .dirs import AppDirs
+from .files import FileLock
+
+logger = logging.getLogger(__name__)
+
+#: Time (in seconds) to wait for the registry lock when registering a
+#: session (e.g., while another launcher installs a staged upgrade).
+REGISTER_TIMEOUT = 5 * 60.
+
+_session_lock = None
+
+
+def sessions_dir():
+    '''
+    Returns
+    -------
+    path_helpers.path
+        Directory containing session lock files.
+    '''
+    return AppDirs('MicroDrop').user_config_dir.joinpath('sessions')
+
+
+def registry_lock(timeout=REGISTER_TIMEOUT):
+    '''
+    Parameters
+    ----------
+    timeout : float, optional
+        Time (in seconds) to wait for the lock (see
+        :class:`microdrop_launcher.files.FileLock`).
+
+    Returns
+    -------
+    microdrop_launcher.files.FileLock
+        Lock held while registering a session, and while checking for (and
+        removing) stale sessions (see :func:`other_sessions_running`).
+    '''
+    return FileLock(sessions_dir().joinpath('registry.lock'),
+                    timeout=timeout)
+
+
+def register_session():
+    '''
+    Hold session lock of this process until it exits (or until
+    :func:`release_session` is called).
+
+    Calling more than once has no further effect.
+
+    Returns
+    -------
+    microdrop_launcher.files.FileLock
+        Session lock of this process.
+    '''
+    global _session_lock
+
+    if _session_lock is None:
+        lock = FileLock(sessions_dir().joinpath('{}.lock'
+                                                .format(os.getpid())),
+                        timeout=0)
+        try:
+            with registry_lock():
+                lock.acquire()
+        except IOError:
+            # E.g., another launcher is stuck installing an upgrade.
+            logger.warning('Timed out waiting for session registry lock.',
+                           exc_info=True)
+            lock.acquire()
+        _session_lock = lock
+        atexit.register(release_session)
+    return _session_lock
+
+
+def release_session():
+    '''
+    Release session lock of this process (if held) and remove its lock file,
+    e.g., before replacing the process image using :func:`os.execv`.
+    '''
+    global _session_lock
+
+    lock, _session_lock = _session_lock, None
+    if lock is None:
+        return
+    lock.release()
+    try:
+        lock.path.remove()
+    except OSError:
+        logger.debug('Error removing `%s`.', lock.path, exc_info=True)
+
+
+def other_sessions_running(ignore_pids=None):
+    '''
+    Check for running sessions of other launcher processes, removing lock
+    files of sessions that have exited.
+
+    **N.B.**, must be called while holding :func:`registry_lock`.
+
+    Parameters
+    ----------
+    ignore_pids : list, optional
+        Process IDs of sessions to ignore (e.g., the launcher that started
+        this process).
+
+    Returns
+    -------
+    bool
+        ``True`` if another launcher process holds its session lock (see
+        :func:`register_session`).
+    '''
+    own_path = _session_lock.path if _session_lock is not None else None
+    ignore_names = set('{}.lock'.format(pid_i)
+                       for pid_i in (ignore_pids or []))
+    sessions_dir_ = sessions_dir()
+    if not sessions_dir_.isdir():
+        return False
+    for path_i in sessions_dir_.files('*.lock'):
+        if (path_i == own_path or path_i.name in ignore_names or
+                path_i.name == 'registry.lock'):
+            continue
+        lock_i = FileLock(path_i, timeout=0)
+        try:
+            lock_i.acquire()
+        except IOError:
+            return True
+        lock_i.release()
+        # Process has exited.  **N.B.**, the registry lock is held, so no
+        # session is between creating and locking its file.
+        try:
+            path_i.remove()
+        except OSError:
+            logger.debug('Error removing `%s`.', path_i, exc_info=True)
+    return False
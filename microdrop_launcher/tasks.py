@@ -0,0 +1,490 @@
+'''
+Background update checks run within the launcher process.
+
+Previously, the launcher started separate ``auto_upgrade`` and
+``microdrop_version`` Python processes, each paying the interpreter and
+:mod:`conda_helpers` import cost and each running its own Conda commands.
+Running the checks in-process shares the memoized installed version (see
+:data:`microdrop_launcher.version_context.VERSION_CONTEXT`), the
+``conda-meta`` index (see :mod:`microdrop_launcher.conda_meta`) and the
+channel repodata refreshed by ``conda search``.
+
+Checks run at reduced CPU and I/O priority (see
+:mod:`microdrop_launcher.priority`), optionally held back until MicroDrop has
+finished starting.
+
+Each task has a deadline, after which its Conda commands are killed (see
+:class:`microdrop_launcher.conda_stream.deadline`).  Timeouts are recorded in
+the cached version info, such that subsequent launches back off (see
+:func:`microdrop_launcher.version_cache.task_backoff`).
+
+.. versionadded:: 0.8
+'''
+import functools as ft
+import logging
+import os
+import subprocess as sp
+import sys
+import threading
+import time
+
+from . import SEARCH_CACHE_TTL, tracing
+
+logger = logging.getLogger(__name__)
+
+#: Default deadline (in seconds) of each background task.
+TASK_TIMEOUT = 60.
+#: Default time (in seconds) to wait for background tasks at launcher exit
+#: before cancelling them.
+EXIT_GRACE = 10.
+#: Time (in seconds) to wait for background tasks to finish once cancelled.
+CANCEL_WAIT = 5.
+#: Deadline (in seconds) of background download of MicroDrop upgrade.
+DOWNLOAD_TIMEOUT = 30 * 60.
+#: Environment variable set when the launcher restarts itself after
+#: installing a staged upgrade (see :func:`restart_launcher`).
+RESTART_ENV_VAR = 'MICRODROP_LAUNCHER_RESTARTED'
+
+
+def _run_task(task_name, timeout, function):
+    '''
+    Call :data:`function` within a deadline and record whether it timed out
+    (see :func:`microdrop_launcher.version_cache.record_task_timeout`).
+    '''
+    from .conda_stream import deadline
+    from .version_cache import record_task_timeout
+
+    with deadline(timeout) as deadline_:
+        try:
+            return function()
+        finally:
+            if deadline_.expired:
+                logger.info('Background task `%s` timed out.', task_name)
+            try:
+                record_task_timeout(task_name, deadline_.expired)
+            except Exception:
+                logger.debug('Error recording `%s` timeout.', task_name,
+                             exc_info=True)
+
+
+def check_microdrop_version(refresh=False, ttl=SEARCH_CACHE_TTL,
+                            version_info=None, timeout=TASK_TIMEOUT):
+    '''
+    Cache latest available MicroDrop version (see
+    :func:`microdrop_launcher.microdrop_version.cache_microdrop_version`).
+
+    .. versionchanged:: 0.8
+        Add :data:`version_info` and :data:`timeout` parameters.
+
+    Returns
+    -------
+    dict
+        See :func:`microdrop_launcher.microdrop_version.cache_microdrop_version`.
+    '''
+    from .microdrop_version import cache_microdrop_version
+
+    with tracing.span('_cache_latest_microdrop_version'):
+        try:
+            if version_info is not None:
+                # No Conda commands needed.
+                return cache_microdrop_version(refresh=refresh, ttl=ttl,
+                                               version_info=version_info)
+            return _run_task('conda-search', timeout,
+                             ft.partial(cache_microdrop_version,
+                                        refresh=refresh, ttl=ttl))
+        except Exception, exception:
+            logger.debug('Error looking up latest MicroDrop version.',
+                         exc_info=True)
+            return {'installed': None, 'latest': None,
+                    'error': str(exception)}
+
+
+def check_launcher_upgrade(version_info=None, timeout=TASK_TIMEOUT,
+                           refresh=False, download_only=True):
+    '''
+    Stage ``microdrop-launcher`` upgrade if a new version is available (see
+    :func:`microdrop_launcher.auto_upgrade.upgrade_launcher`), to be
+    installed at the next launcher start (see
+    :func:`apply_staged_launcher_upgrade`).
+
+    The check is skipped while backing off after a timeout, unless
+    :data:`refresh` is ``True``.
+
+    .. versionchanged:: 0.8
+        Add :data:`version_info`, :data:`timeout` and :data:`refresh`
+        parameters.
+
+        Only download upgrade, unless :data:`download_only` is ``False``.
+
+    Returns
+    -------
+    dict
+        See :func:`microdrop_launcher.auto_upgrade.upgrade_launcher`.
+    '''
+    from .auto_upgrade import upgrade_launcher
+    from .version_cache import task_backoff
+
+    with tracing.span('_auto_upgrade'):
+        try:
+            backoff = 0 if refresh else task_backoff('launcher-upgrade')
+            if backoff > 0:
+                raise RuntimeError('Skipped (timed out recently; retry in '
+                                   '{:.0f} s).'.format(backoff))
+            # **N.B.**, an install in progress is never killed (see
+            # :func:`microdrop_launcher.auto_upgrade.upgrade_launcher`).
+            return _run_task('launcher-upgrade', timeout,
+                             ft.partial(upgrade_launcher,
+                                        version_info=version_info,
+                                        download_only=download_only))
+        except Exception, exception:
+            logger.debug('Error upgrading `microdrop-launcher`.',
+                         exc_info=True)
+            return {'original_version': None, 'new_version': None,
+                    'unlinked': [], 'linked': [], 'error': str(exception),
+                    'network_error': False, 'staged_version': None}
+
+
+def apply_staged_launcher_upgrade():
+    '''
+    Install ``microdrop-launcher`` upgrade staged by a previous session, if
+    any, in a helper process (see
+    :func:`microdrop_launcher.auto_upgrade.apply_staged_main`).
+
+    Intended to be called at launcher start, before MicroDrop is launched.
+    The upgrade replaces the modules of this package, so if it is installed,
+    the caller must restart the launcher (see :func:`restart_launcher`)
+    *without importing any further modules*; the helper process is only
+    started if the staging manifest is not empty.
+
+    Returns
+    -------
+    bool
+        ``True`` if upgrade was installed.
+    '''
+    from .version_cache import load_version_cache
+
+    if os.environ.pop(RESTART_ENV_VAR, None):
+        # Already restarted after installing an upgrade; do not loop.
+        return False
+    if not load_version_cache()['launcher_staged']:
+        return False
+    with tracing.span('apply_staged_launcher_upgrade'):
+        try:
+            return_code = sp.call([sys.executable, '-m',
+                                   'microdrop_launcher.auto_upgrade',
+                                   '--apply-staged', '--parent-pid',
+                                   str(os.getpid())])
+        except OSError:
+            logger.debug('Error installing staged `microdrop-launcher` '
+                         'upgrade.', exc_info=True)
+            return False
+    return return_code == 0
+
+
+def restart_launcher(module, argv):
+    '''
+    Replace launcher process with a fresh interpreter running the (upgraded)
+    launcher, i.e., ``python -m <module> <argv>``.
+
+    On Windows, where :func:`os.execv` starts a new process rather than
+    replacing the current one, the new launcher is run as a child process
+    and the current process exits with its exit code.
+
+    Parameters
+    ----------
+    module : str
+        Launcher module, e.g., ``"microdrop_launcher.bin.launch"``.
+    argv : list
+        Command-line arguments.
+    '''
+    from .sessions import release_session
+
+    # Release session lock, since the lock file descriptor would otherwise be
+    # inherited by the new process image.
+    release_session()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.environ[RESTART_ENV_VAR] = '1'
+    args = [sys.executable, '-m', module] + list(argv)
+    if os.name == 'nt':
+        raise SystemExit(sp.call(args))
+    os.execv(sys.executable, args)
+
+
+def stage_microdrop_upgrade(version_result, timeout=DOWNLOAD_TIMEOUT,
+                            refresh=False):
+    '''
+    Download packages to upgrade to the latest MicroDrop version into the
+    Conda package cache (i.e., ``conda install --download-only``) at low
+    priority, and record the staged upgrade in the version cache (see
+    :func:`microdrop_launcher.version_cache.record_staged`).
+
+    Accepting the upgrade (see
+    :func:`microdrop_launcher.profile.check_version_cache_for_upgrade`) then
+    only needs to link the downloaded packages.
+
+    Parameters
+    ----------
+    version_result : dict
+        Result of :func:`check_microdrop_version`.
+    timeout : float, optional
+        Deadline (in seconds) of download.
+    refresh : bool, optional
+        If ``True``, download even while backing off after a timeout.
+
+    Returns
+    -------
+    str or None
+        Staged MicroDrop version, or ``None`` if no upgrade was staged.
+    '''
+    import conda_helpers as ch
+
+    from .conda_stream import CondaError, stream_conda
+    from .network import channels_reachable
+    from .version_cache import (latest_version, load_version_cache,
+                                record_staged, staged_version, task_backoff,
+                                update_version_cache)
+    from .version_context import VERSION_CONTEXT
+
+    installed, latest = version_result['installed'], version_result['latest']
+    if not (installed and latest and VERSION_CONTEXT.parse(latest) >
+            VERSION_CONTEXT.parse(installed)):
+        # No upgrade available.
+        return None
+    major_version = VERSION_CONTEXT.major(latest)
+    cache = load_version_cache()
+    latest_info = latest_version(cache, major_version)
+    if latest_info.get('version') == latest and latest_info.get('ignore'):
+        # User chose to ignore this version.
+        return None
+    if staged_version(cache, major_version).get('version') == latest:
+        return latest
+    if not refresh and task_backoff('stage-upgrade', cache) > 0:
+        return None
+    if not channels_reachable():
+        return None
+
+    with tracing.span('stage_microdrop_upgrade', version=latest):
+        logger.info('Downloading MicroDrop v%s packages.', latest)
+
+        def _download():
+            return stream_conda('install', '--download-only', '--json',
+                                '--quiet', 'microdrop =={}'.format(latest),
+                                on_message=logger.debug, low_priority=True)
+
+        try:
+            response = _run_task('stage-upgrade', timeout, _download)
+        except CondaError, exception:
+            logger.info('Error downloading MicroDrop v%s: %s', latest,
+                        exception)
+            return None
+        except ValueError, exception:
+            # Download could not be verified, so do not offer to link it.
+            logger.info('Could not decode MicroDrop v%s download log:\n%s',
+                        latest, getattr(exception, 'text', exception))
+            return None
+        if isinstance(response, dict) and response.get('success') is False:
+            logger.info('Error downloading MicroDrop v%s: %s', latest,
+                        response.get('message') or response.get('error'))
+            return None
+        with update_version_cache() as cache:
+            record_staged(cache, latest, prefix=ch.conda_prefix())
+        logger.info('Staged MicroDrop v%s upgrade.', latest)
+        return latest
+
+
+def run_background_checks(refresh=False, ttl=SEARCH_CACHE_TTL,
+                          extra_packages=None, timeout=TASK_TIMEOUT):
+    '''
+    Run update checks sequentially in the calling thread.
+
+    Available versions of ``microdrop``, ``microdrop-launcher`` (and any
+    :data:`extra_packages`) are looked up using a single combined query (see
+    :func:`microdrop_launcher.conda_versions_info`), the result of which is
+    passed to both checks.
+
+    If Conda channels were checked within :data:`ttl`, or while backing off
+    after a failed or timed out check, cached search results or repodata are
+    used instead (see
+    :func:`microdrop_launcher.version_cache.network_check_needed`), unless
+    :data:`refresh` is ``True``.
+
+    If a MicroDrop upgrade is available, its packages are then downloaded in
+    the background (see :func:`stage_microdrop_upgrade`).
+
+    .. versionchanged:: 0.8
+        Use a single combined Conda query for all packages.
+
+        Add :data:`timeout` parameter.
+
+        Stage MicroDrop upgrade.
+
+    Parameters
+    ----------
+    refresh : bool, optional
+        If ``True``, ignore cached Conda package search results.
+    ttl : float, optional
+        Maximum age (in seconds) of cached Conda package search results.
+    extra_packages : list, optional
+        Additional Conda packages to look up, e.g., plugin packages.
+    timeout : float, optional
+        Deadline (in seconds) of each task.
+
+    Returns
+    -------
+    dict
+        Results keyed by check, i.e., ``microdrop`` (see
+        :func:`check_microdrop_version`), ``launcher`` (see
+        :func:`check_launcher_upgrade`) and ``staged`` (see
+        :func:`stage_microdrop_upgrade`), and available/installed versions of
+        all packages looked up (``packages``; ``None`` if the combined query
+        failed).
+    '''
+    from . import conda_versions_info
+    from .version_cache import load_version_cache, network_check_needed
+
+    package_names = ['microdrop', 'microdrop-launcher'] + list(extra_packages
+                                                               or [])
+    try:
+        # Decide from a single read of the shared version cache whether
+        # Conda channels need to be checked.
+        offline = not (refresh or
+                       network_check_needed(load_version_cache(), ttl=ttl))
+        with tracing.span('conda_versions_info', offline=offline):
+            versions_info = _run_task('conda-search', timeout,
+                                      ft.partial(conda_versions_info,
+                                                 package_names,
+                                                 refresh=refresh, ttl=ttl,
+                                                 offline=offline))
+    except Exception:
+        # Each check falls back to its own query.
+        logger.debug('Error looking up package versions.', exc_info=True)
+        versions_info = None
+    if versions_info is None:
+        microdrop_info = launcher_info = None
+    else:
+        microdrop_info = versions_info['microdrop']
+        launcher_info = versions_info['microdrop-launcher']
+
+    results = {'microdrop':
+               check_microdrop_version(refresh=refresh, ttl=ttl,
+                                       version_info=microdrop_info),
+               'launcher': check_launcher_upgrade(version_info=launcher_info,
+                                                  timeout=timeout,
+                                                  refresh=refresh),
+               'packages': versions_info}
+    microdrop_result = results['microdrop']
+    if microdrop_result['error']:
+        logger.info('MicroDrop version check failed: %s',
+                    microdrop_result['error'])
+    launcher_result = results['launcher']
+    if launcher_result['error']:
+        logger.info('`microdrop-launcher` upgrade check failed: %s',
+                    launcher_result['error'])
+    elif launcher_result['new_version']:
+        logger.info('Upgraded `microdrop-launcher` to: %s',
+                    launcher_result['new_version'])
+    elif launcher_result.get('staged_version'):
+        logger.info('Staged `microdrop-launcher` %s upgrade.',
+                    launcher_result['staged_version'])
+
+    # Download MicroDrop upgrade last, since it may take a while.
+    try:
+        results['staged'] = stage_microdrop_upgrade(microdrop_result,
+                                                    refresh=refresh)
+    except Exception:
+        logger.debug('Error staging MicroDrop upgrade.', exc_info=True)
+        results['staged'] = None
+    return results
+
+
+def start_background_checks(gate=None, **kwargs):
+    '''
+    Run :func:`run_background_checks` in a daemon thread, such that the
+    launcher process may exit without waiting for hung checks.
+
+    The thread (and any Conda commands it runs) runs at background priority
+    (see :func:`microdrop_launcher.priority.enter_background`).
+
+    Parameters
+    ----------
+    gate : callable, optional
+        Called in the background thread before running checks, e.g., to wait
+        until MicroDrop has finished starting (see
+        :func:`microdrop_launcher.priority.wait_for_startup`).
+    **kwargs
+        Keyword arguments passed to :func:`run_background_checks`.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        Result of :func:`run_background_checks`.
+    '''
+    import concurrent.futures
+
+    future = concurrent.futures.Future()
+
+    def _run():
+        from .priority import enter_background
+
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            enter_background()
+            if gate is not None:
+                with tracing.span('startup_gate'):
+                    gate()
+            future.set_result(run_background_checks(**kwargs))
+        except BaseException, exception:
+            future.set_exception(exception)
+
+    thread = threading.Thread(target=_run, name='background-checks')
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def wait_background_checks(future, grace=EXIT_GRACE):
+    '''
+    Wait for background checks at launcher exit.
+
+    If checks are still running after :data:`grace` seconds, running Conda
+    commands are killed (see
+    :func:`microdrop_launcher.conda_stream.cancel_commands`), except for
+    installs in progress, which are waited for.
+
+    Parameters
+    ----------
+    future : concurrent.futures.Future
+        See :func:`start_background_checks`.
+    grace : float, optional
+        Time (in seconds) to wait before cancelling checks.
+
+    Returns
+    -------
+    bool
+        ``True`` if background checks finished.
+    '''
+    import concurrent.futures
+
+    from .conda_stream import active_commands, cancel_commands
+
+    with tracing.span('wait_background_checks', grace=grace):
+        concurrent.futures.wait([future], timeout=grace)
+        if future.done():
+            return True
+        cancelled = cancel_commands()
+        logger.info('Background checks still running after %s s; cancelled '
+                    '%d Conda command(s).', grace, cancelled)
+        start = time.time()
+        while not future.done():
+            if any(not cancellable_i
+                   for args_i, cancellable_i in active_commands()):
+                # Install in progress.
+                start = time.time()
+            elif time.time() - start > CANCEL_WAIT:
+                logger.warning('Background checks did not finish; exiting '
+                               'anyway.')
+                return False
+            concurrent.futures.wait([future], timeout=.1)
+        return True
@@ -0,0 +1,162 @@
+'''
+Test classification of Conda ``--json`` output, using output recorded from
+``conda install --json``.
+'''
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import conda_helpers as ch
+import path_helpers as ph
+import pytest
+
+from microdrop_launcher.conda_stream import (CondaError, CondaOutputReader,
+                                             stream_conda)
+
+PROGRESS_EVENTS = [{'maxval': 133256, 'finished': False,
+                    'fetch': 'microdrop-laun', 'progress': 0},
+                   {'maxval': 133256, 'finished': False,
+                    'fetch': 'microdrop-laun', 'progress': 65536},
+                   {'maxval': 133256, 'finished': True,
+                    'fetch': 'microdrop-laun', 'progress': 133256}]
+
+MENUINST_MESSAGE = ("INFO menuinst_win32:__init__(182): Menu: name: "
+                    "'MicroDrop', prefix: 'C:\\MicroDrop', env_name: "
+                    "'None', mode: 'None', used_mode: 'user'")
+
+DOCUMENT = {'actions': {'LINK': ['microdrop-launcher-0.8-py27_0 2'],
+                        'UNLINK': ['microdrop-launcher-0.7.11-py27_0'],
+                        'PREFIX': 'C:\\MicroDrop'},
+            'success': True}
+
+
+def _event_line(event):
+    return json.dumps(event, sort_keys=True) + '\x00'
+
+
+def _recorded_output():
+    # Each event is terminated by a null character; the last two events were
+    # written on the same line.
+    return ([_event_line(PROGRESS_EVENTS[0]),
+             _event_line(PROGRESS_EVENTS[1]) +
+             _event_line(PROGRESS_EVENTS[2]),
+             MENUINST_MESSAGE] +
+            json.dumps(DOCUMENT, indent=2, sort_keys=True).splitlines())
+
+
+def _reader():
+    progress = []
+    messages = []
+    reader = CondaOutputReader(on_progress=progress.append,
+                               on_message=messages.append)
+    return reader, progress, messages
+
+
+def test_reader_classifies_output():
+    reader, progress, messages = _reader()
+    assert reader.feed(_recorded_output()) is reader
+    assert progress == PROGRESS_EVENTS
+    assert messages == [MENUINST_MESSAGE]
+    assert reader.document() == DOCUMENT
+
+
+def test_reader_message_within_document():
+    # `menuinst` messages may be written after the document has started.
+    lines = json.dumps(DOCUMENT, indent=2, sort_keys=True).splitlines()
+    lines.insert(2, MENUINST_MESSAGE)
+    reader, progress, messages = _reader()
+    reader.feed(lines)
+    assert progress == []
+    assert messages == [MENUINST_MESSAGE]
+    assert reader.document() == DOCUMENT
+
+
+def test_reader_without_callbacks():
+    reader = CondaOutputReader().feed(_recorded_output())
+    assert reader.document() == DOCUMENT
+
+
+def test_reader_undecodable_output():
+    reader, progress, messages = _reader()
+    reader.feed([_event_line(PROGRESS_EVENTS[0]), 'Fetching package metadata',
+                 '{"success": true'])
+    assert progress == PROGRESS_EVENTS[:1]
+    assert reader.text == 'Fetching package metadata\n{"success": true'
+    with pytest.raises(ValueError):
+        reader.document()
+
+
+@contextlib.contextmanager
+def _fake_conda(lines, returncode=0):
+    '''
+    Replace Conda executable with a script that writes :data:`lines` to
+    standard output and exits with :data:`returncode`.
+    '''
+    directory = ph.path(tempfile.mkdtemp(prefix='microdrop-launcher-test-'))
+    script = directory.joinpath('conda')
+    script.write_bytes('#!{}\n'
+                       'import sys\n'
+                       'sys.stdout.write({!r})\n'
+                       'sys.exit({})\n'.format(sys.executable,
+                                               ''.join(line_i + '\n'
+                                                       for line_i in lines),
+                                               returncode))
+    script.chmod(0755)
+    original = ch.conda_executable
+    ch.conda_executable = lambda *args, **kwargs: script
+    try:
+        yield script
+    finally:
+        ch.conda_executable = original
+        shutil.rmtree(directory)
+
+
+#: Fake Conda executable is a script with a `#!` line.
+_skip_on_windows = pytest.mark.skipif(os.name == 'nt',
+                                      reason='Requires `#!` script support.')
+
+
+@_skip_on_windows
+def test_stream_conda():
+    progress = []
+    with _fake_conda(_recorded_output()):
+        document = stream_conda('install', '--json', 'microdrop-launcher',
+                                on_progress=progress.append)
+    assert progress == PROGRESS_EVENTS
+    assert document == DOCUMENT
+
+
+@_skip_on_windows
+def test_stream_conda_undecodable_output():
+    with _fake_conda(['Fetching package metadata', '{"success": true']):
+        with pytest.raises(ValueError) as exception:
+            stream_conda('install', '--json', 'microdrop-launcher')
+    assert exception.value.text == ('Fetching package metadata\n'
+                                    '{"success": true')
+
+
+@_skip_on_windows
+def test_stream_conda_error():
+    document = {'error': 'CondaHTTPError: HTTP 000 CONNECTION FAILED',
+                'exception_name': 'CondaHTTPError',
+                'message': 'HTTP 000 CONNECTION FAILED', 'success': False}
+    with _fake_conda([_event_line(PROGRESS_EVENTS[0]),
+                      json.dumps(document)], returncode=1):
+        with pytest.raises(CondaError) as exception:
+            stream_conda('install', '--json', 'microdrop-launcher')
+    assert exception.value.returncode == 1
+    assert exception.value.document == document
+    assert 'CondaHTTPError' in str(exception.value)
+
+
+@_skip_on_windows
+def test_stream_conda_error_undecodable_output():
+    with _fake_conda(['Segmentation fault'], returncode=139):
+        with pytest.raises(CondaError) as exception:
+            stream_conda('install', '--json', 'microdrop-launcher')
+    assert exception.value.returncode == 139
+    assert exception.value.document is None
+    assert 'Segmentation fault' in str(exception.value)
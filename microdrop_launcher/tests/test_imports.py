@@ -0,0 +1,26 @@
+'''
+Test that importing the launcher does not load heavy modules, which are only
+imported on the code paths that use them.
+'''
+import subprocess as sp
+import sys
+
+#: Modules that must not be loaded by importing launcher modules.
+HEAVY_MODULES = ('gtk', 'pandas', 'conda_helpers')
+
+
+def _loaded_modules(module):
+    code = ('import sys\n'
+            'import {}\n'
+            'print "\\n".join(name for name in {!r} if name in sys.modules)'
+            .format(module, HEAVY_MODULES))
+    output = sp.check_output([sys.executable, '-c', code])
+    return [line_i for line_i in output.splitlines() if line_i.strip()]
+
+
+def test_profile_imports():
+    assert _loaded_modules('microdrop_launcher.profile') == []
+
+
+def test_profile_launcher_imports():
+    assert _loaded_modules('microdrop_launcher.bin.profile_launcher') == []
@@ -0,0 +1,141 @@
+'''
+Test Conda channel reachability probe against a local stand-in HTTP server.
+'''
+import BaseHTTPServer
+import contextlib
+import shutil
+import socket
+import tempfile
+import threading
+
+import path_helpers as ph
+
+from microdrop_launcher import cache, network
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.send_response(404)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def _http_server(port=0):
+    BaseHTTPServer.HTTPServer.allow_reuse_address = True
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', port), _Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@contextlib.contextmanager
+def _cache_directory():
+    # Keep negative cache entries out of the user cache directory.
+    directory = ph.path(tempfile.mkdtemp(prefix='microdrop-launcher-test-'))
+    original = cache.cache_directory
+    cache.cache_directory = lambda: directory
+    try:
+        yield directory
+    finally:
+        cache.cache_directory = original
+        shutil.rmtree(directory)
+
+
+def _offline_state(url):
+    return cache.load_cached('network', cache.cache_key(network
+                                                        ._hosts([url]), []))
+
+
+def test_probe_reachable():
+    with _http_server() as url:
+        # Any HTTP response (e.g., `404 Not Found`) counts as reachable.
+        assert network.probe(url, timeout=1., proxies={})
+
+
+def test_probe_unreachable():
+    url = 'http://127.0.0.1:{}/'.format(_unused_port())
+    assert not network.probe(url, timeout=1., proxies={})
+
+
+def test_channels_reachable():
+    with _cache_directory():
+        with _http_server() as url:
+            assert network.channels_reachable(urls=[url + 'sci-bots/'],
+                                              timeout=1., proxies={})
+            assert _offline_state(url) is None
+
+
+def test_channels_unreachable_backoff_and_reset():
+    port = _unused_port()
+    url = 'http://127.0.0.1:{}/'.format(port)
+    with _cache_directory():
+        assert not network.channels_reachable(urls=[url], timeout=1.,
+                                              proxies={})
+        offline = _offline_state(url)
+        assert offline['failures'] == 1
+
+        with _http_server(port):
+            # Backing off, so host is not probed.
+            assert not network.channels_reachable(urls=[url], timeout=1.,
+                                                  proxies={})
+            assert _offline_state(url)['failures'] == 1
+
+            # Probe despite back off; success resets offline state.
+            assert network.channels_reachable(urls=[url], timeout=1.,
+                                              proxies={}, refresh=True)
+            assert _offline_state(url) is None
+
+
+def test_channels_unreachable_backoff_doubles():
+    url = 'http://127.0.0.1:{}/'.format(_unused_port())
+    with _cache_directory():
+        assert not network.channels_reachable(urls=[url], timeout=1.,
+                                              proxies={})
+        # Expire back off.
+        offline = _offline_state(url)
+        offline['timestamp'] -= network._backoff(offline['failures']) + 1
+        cache.save_cached('network', cache.cache_key(network._hosts([url]),
+                                                     []), offline)
+        assert not network.channels_reachable(urls=[url], timeout=1.,
+                                              proxies={})
+        assert _offline_state(url)['failures'] == 2
+        assert network._backoff(2) == 2 * network.OFFLINE_BACKOFF
+
+
+def test_conda_network_config():
+    directory = ph.path(tempfile.mkdtemp(prefix='microdrop-launcher-test-'))
+    try:
+        base = directory.joinpath('base.condarc')
+        base.write_text('channel_alias: http://127.0.0.1:1/base\n'
+                        'proxy_servers:\n'
+                        '  http: http://proxy:8080\n')
+        user = directory.joinpath('user.condarc')
+        user.write_text('channel_alias: http://127.0.0.1:1/user\n'
+                        'proxy_servers:\n'
+                        '  https: http://proxy:8443\n')
+        config = network.conda_network_config(paths=[base, user])
+        # Later files take precedence; proxies are merged.
+        assert config['channel_alias'] == 'http://127.0.0.1:1/user'
+        assert config['proxy_servers'] == {'http': 'http://proxy:8080',
+                                           'https': 'http://proxy:8443'}
+        assert (network.channel_urls(['sci-bots'],
+                                     channel_alias=config['channel_alias'])
+                == ['http://127.0.0.1:1/user/sci-bots/'])
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,157 @@
+'''
+Test SQLite profile store, including concurrent launcher instances sharing
+one database.
+'''
+import path_helpers as ph
+
+from microdrop_launcher.files import yaml_dump
+from microdrop_launcher.registry import ProfileRegistry, SqliteProfileStore
+
+
+def _paths(tmpdir):
+    directory = ph.path(str(tmpdir))
+    return directory.joinpath('profiles.db'), directory.joinpath('profiles.yml')
+
+
+def _saved_profiles(db_path):
+    # Read using a new store, i.e., as another launcher instance would.
+    store = SqliteProfileStore(db_path)
+    try:
+        return dict((record_i.path, record_i.used_timestamp)
+                    for record_i in store.load())
+    finally:
+        store.close()
+
+
+def _create_store(db_path, profiles):
+    store = SqliteProfileStore(db_path)
+    registry = ProfileRegistry()
+    for path_i, timestamp_i in profiles.iteritems():
+        registry.add(path_i, used_timestamp=timestamp_i)
+    store.save(registry)
+    store.close()
+
+
+def test_concurrent_stores(tmpdir):
+    db_path, _ = _paths(tmpdir)
+    _create_store(db_path, {'/profiles/a': 100, '/profiles/b': 200})
+
+    store_a = SqliteProfileStore(db_path)
+    store_b = SqliteProfileStore(db_path)
+    try:
+        registry_a = store_a.load()
+        registry_b = store_b.load()
+
+        # First instance launches a profile, while second instance adds a new
+        # profile (neither sees the change of the other).
+        registry_a.touch('/profiles/a', 300)
+        registry_b.add('/profiles/c', used_timestamp=250)
+        assert store_a.save(registry_a)
+        assert store_b.save(registry_b)
+    finally:
+        store_a.close()
+        store_b.close()
+
+    # Both changes survive.
+    assert _saved_profiles(db_path) == {'/profiles/a': 300,
+                                        '/profiles/b': 200,
+                                        '/profiles/c': 250}
+
+
+def test_save_removals(tmpdir):
+    db_path, _ = _paths(tmpdir)
+    _create_store(db_path, {'/profiles/a': 100, '/profiles/b': 200})
+
+    store = SqliteProfileStore(db_path)
+    try:
+        registry = store.load()
+        registry.remove('/profiles/a')
+        assert store.save(registry)
+        # Nothing changed since last save, so nothing is written.
+        assert not store.save(registry)
+    finally:
+        store.close()
+    assert _saved_profiles(db_path) == {'/profiles/b': 200}
+
+
+def test_removal_keeps_concurrent_changes(tmpdir):
+    db_path, _ = _paths(tmpdir)
+    _create_store(db_path, {'/profiles/a': 100, '/profiles/b': 200})
+
+    store_a = SqliteProfileStore(db_path)
+    store_b = SqliteProfileStore(db_path)
+    try:
+        registry_a = store_a.load()
+        registry_b = store_b.load()
+        registry_a.remove('/profiles/a')
+        registry_b.touch('/profiles/b', 300)
+        assert store_b.save(registry_b)
+        assert store_a.save(registry_a)
+    finally:
+        store_a.close()
+        store_b.close()
+    assert _saved_profiles(db_path) == {'/profiles/b': 300}
+
+
+def test_load_limit(tmpdir):
+    db_path, _ = _paths(tmpdir)
+    _create_store(db_path, {'/profiles/a': 100, '/profiles/b': 300,
+                            '/profiles/c': 200})
+    store = SqliteProfileStore(db_path)
+    try:
+        assert store.load(limit=2).paths() == ['/profiles/b', '/profiles/c']
+    finally:
+        store.close()
+
+
+def test_yaml_imported_once(tmpdir):
+    db_path, yaml_path = _paths(tmpdir)
+    yaml_path.write_text(yaml_dump([{'path': '/profiles/a',
+                                     'used_timestamp': 100},
+                                    {'path': '/profiles/b',
+                                     'used_timestamp':
+                                     '2017-05-01 13:37:00'}],
+                                   default_flow_style=False))
+
+    store = SqliteProfileStore(db_path, yaml_path=yaml_path)
+    try:
+        registry = store.load()
+        assert sorted(registry.paths()) == ['/profiles/a', '/profiles/b']
+        imported = (store.connection
+                    .execute('SELECT value FROM metadata WHERE key = ?',
+                             ('yaml_imported', )).fetchone())
+        assert imported == (str(yaml_path), )
+
+        registry.remove('/profiles/a')
+        store.save(registry)
+    finally:
+        store.close()
+
+    # Profiles list file is not imported again (e.g., removed profile is not
+    # restored), even if it has changed.
+    yaml_path.write_text(yaml_dump([{'path': '/profiles/c',
+                                     'used_timestamp': 100}],
+                                   default_flow_style=False))
+    store = SqliteProfileStore(db_path, yaml_path=yaml_path)
+    try:
+        assert store.load().paths() == ['/profiles/b']
+    finally:
+        store.close()
+
+
+def test_yaml_missing(tmpdir):
+    db_path, yaml_path = _paths(tmpdir)
+    store = SqliteProfileStore(db_path, yaml_path=yaml_path)
+    try:
+        assert len(store.load()) == 0
+    finally:
+        store.close()
+
+    # Import is only attempted on first use.
+    yaml_path.write_text(yaml_dump([{'path': '/profiles/a'}],
+                                   default_flow_style=False))
+    store = SqliteProfileStore(db_path, yaml_path=yaml_path)
+    try:
+        assert len(store.load()) == 0
+    finally:
+        store.close()
@@ -0,0 +1,190 @@
+'''
+Test version cache file handling and back off calculations, using a temporary
+version cache path.
+'''
+import time
+
+import path_helpers as ph
+
+from microdrop_launcher import version_cache as vc
+from microdrop_launcher.files import yaml_dump, yaml_load
+from microdrop_launcher.version_context import VERSION_CONTEXT
+
+
+def _cache_path(tmpdir):
+    return ph.path(str(tmpdir)).joinpath('version-cache.yml')
+
+
+def _installed_version(monkeypatch, version):
+    # Installed MicroDrop version determines which legacy file is imported.
+    monkeypatch.setattr(VERSION_CONTEXT, '_version', version)
+
+
+def _legacy_path(monkeypatch, tmpdir):
+    legacy_path = ph.path(str(tmpdir)).joinpath('latest-version.yml')
+    monkeypatch.setattr(vc, 'legacy_version_cache_path',
+                        lambda major_version: legacy_path)
+    return legacy_path
+
+
+def test_update_writes_cache(tmpdir, monkeypatch):
+    _installed_version(monkeypatch, '2.10.2')
+    _legacy_path(monkeypatch, tmpdir)
+    path = _cache_path(tmpdir)
+    with vc.update_version_cache(path) as cache:
+        vc.record_check(cache, {'microdrop':
+                                [{'version': '2.11.0',
+                                  'channel': 'https://conda.anaconda.org/'
+                                  'sci-bots/win-32'}]})
+    cache = vc.load_version_cache(path)
+    assert cache['schema'] == vc.SCHEMA_VERSION
+    assert vc.latest_version(cache) == {'version': '2.11.0', 'ignore': False}
+    assert cache['channels'] == {'https://conda.anaconda.org/sci-bots/win-32':
+                                 {'microdrop': '2.11.0'}}
+
+
+def test_import_legacy(tmpdir, monkeypatch):
+    _installed_version(monkeypatch, '2.10.2')
+    legacy_path = _legacy_path(monkeypatch, tmpdir)
+    legacy_path.write_text(yaml_dump({'version': '2.10.3', 'ignore': True}))
+    path = _cache_path(tmpdir)
+
+    # Reading imports legacy file without writing cache.
+    assert (vc.latest_version(vc.load_version_cache(path)) ==
+            {'version': '2.10.3', 'ignore': True})
+    assert not path.isfile()
+
+    with vc.update_version_cache(path):
+        pass
+    assert (vc.latest_version(vc.load_version_cache(path)) ==
+            {'version': '2.10.3', 'ignore': True})
+    # Legacy file is left in place, but no longer read.
+    assert legacy_path.isfile()
+    legacy_path.write_text(yaml_dump({'version': '2.10.4'}))
+    assert (vc.latest_version(vc.load_version_cache(path))['version'] ==
+            '2.10.3')
+
+
+def test_corrupt_cache(tmpdir, monkeypatch):
+    _installed_version(monkeypatch, '2.10.2')
+    _legacy_path(monkeypatch, tmpdir)
+    path = _cache_path(tmpdir)
+    path.write_text('- not a version cache\n')
+
+    # Readers fall back to an empty cache, leaving the file in place.
+    assert vc.load_version_cache(path)['latest'] == {}
+    assert path.isfile()
+
+    with vc.update_version_cache(path) as cache:
+        assert cache['latest'] == {}
+        vc.record_error(cache, 'Conda channels are not reachable.')
+    corrupt_path = ph.path(path + '.corrupt')
+    with corrupt_path.open('r') as input_:
+        assert input_.read() == '- not a version cache\n'
+    assert vc.load_version_cache(path)['last_error']['failures'] == 1
+
+
+def test_unknown_keys_preserved(tmpdir):
+    path = _cache_path(tmpdir)
+    path.write_text(yaml_dump({'schema': vc.SCHEMA_VERSION + 1,
+                               'future': {'key': 'value'}}))
+    with vc.update_version_cache(path) as cache:
+        vc.record_error(cache, 'Error')
+    with path.open('r') as input_:
+        cache = yaml_load(input_.read())
+    assert cache['future'] == {'key': 'value'}
+    assert cache['last_error']['failures'] == 1
+
+
+def _assert_remaining(remaining, expected):
+    # Allow for time elapsed since timestamp was recorded.
+    assert expected - 60 < remaining <= expected
+
+
+def test_error_backoff():
+    cache = vc._empty_cache()
+    assert vc.error_backoff(cache) == 0
+
+    expected = vc.ERROR_BACKOFF
+    for i in xrange(12):
+        vc.record_error(cache, 'Error')
+        assert cache['last_error']['failures'] == i + 1
+        _assert_remaining(vc.error_backoff(cache), expected)
+        # Back off doubles with each consecutive failure, up to maximum.
+        expected = min(2 * expected, vc.MAX_ERROR_BACKOFF)
+    assert expected == vc.MAX_ERROR_BACKOFF
+    _assert_remaining(vc.error_backoff(cache), vc.MAX_ERROR_BACKOFF)
+
+    # Back off expires.
+    cache['last_error']['timestamp'] -= vc.MAX_ERROR_BACKOFF + 1
+    assert vc.error_backoff(cache) == 0
+
+    # Successful check resets failures.
+    vc.record_check(cache, {})
+    assert cache['last_error'] is None
+    assert vc.error_backoff(cache) == 0
+    vc.record_error(cache, 'Error')
+    _assert_remaining(vc.error_backoff(cache), vc.ERROR_BACKOFF)
+
+
+def test_backoff_ignores_future_timestamp():
+    # E.g., system clock was set back after error was recorded.
+    cache = vc._empty_cache()
+    vc.record_error(cache, 'Error')
+    cache['last_error']['timestamp'] += 24 * 60 * 60
+    assert vc.error_backoff(cache) == 0
+
+
+def test_task_backoff(tmpdir, monkeypatch):
+    _legacy_path(monkeypatch, tmpdir)
+    path = _cache_path(tmpdir)
+    # Nothing to clear, so cache is not written.
+    vc.record_task_timeout('conda-search', False, path=path)
+    assert not path.isfile()
+
+    expected = vc.TIMEOUT_BACKOFF
+    for i in xrange(10):
+        vc.record_task_timeout('conda-search', True, path=path)
+        cache = vc.load_version_cache(path)
+        assert cache['backoff']['conda-search']['count'] == i + 1
+        _assert_remaining(vc.task_backoff('conda-search', cache), expected)
+        expected = min(2 * expected, vc.MAX_TIMEOUT_BACKOFF)
+    assert expected == vc.MAX_TIMEOUT_BACKOFF
+    assert vc.task_backoff('other-task', cache) == 0
+
+    # Task completed, so stop backing off.
+    vc.record_task_timeout('conda-search', False, path=path)
+    cache = vc.load_version_cache(path)
+    assert 'conda-search' not in cache['backoff']
+    assert vc.task_backoff('conda-search', cache) == 0
+
+
+def test_network_check_needed():
+    ttl = 60 * 60
+    cache = vc._empty_cache()
+    # Never checked.
+    assert vc.network_check_needed(cache, ttl=ttl)
+
+    vc.record_check(cache, {})
+    assert not vc.network_check_needed(cache, ttl=ttl)
+
+    # Last check expired.
+    cache['checked'] = time.time() - ttl - 1
+    assert vc.network_check_needed(cache, ttl=ttl)
+
+    # Last check is in the future (e.g., system clock was set back).
+    cache['checked'] = time.time() + ttl
+    assert vc.network_check_needed(cache, ttl=ttl)
+    cache['checked'] = time.time() - ttl - 1
+
+    # Backing off after failed check.
+    vc.record_error(cache, 'Error')
+    assert not vc.network_check_needed(cache, ttl=ttl)
+    cache['last_error']['timestamp'] -= vc.ERROR_BACKOFF + 1
+    assert vc.network_check_needed(cache, ttl=ttl)
+
+    # Backing off after `conda search` timed out.
+    cache['backoff']['conda-search'] = {'count': 1, 'timestamp': time.time()}
+    assert not vc.network_check_needed(cache, ttl=ttl)
+    cache['backoff']['conda-search']['timestamp'] -= vc.TIMEOUT_BACKOFF + 1
+    assert vc.network_check_needed(cache, ttl=ttl)
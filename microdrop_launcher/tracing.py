@@ -0,0 +1,180 @@
+'''
+Startup tracing in `Chrome trace-event format`__ (view using, e.g.,
+``chrome://tracing`` or https://ui.perfetto.dev).
+
+__ https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+
+Trace events are appended to a JSON array file, one event per line, such that
+multiple processes (e.g., launcher, background upgrade checks and MicroDrop
+itself) may write to the same trace file.  The trace file path is exported to
+child processes using the :data:`TRACE_ENV_VAR` environment variable.
+
+**N.B.**, the closing ``]`` of the array is omitted, which is allowed by the
+trace-event format.
+
+Example:
+
+    >>> from microdrop_launcher import tracing
+    >>> tracing.enable('launch-trace.json')
+    >>> with tracing.span('load_profiles_info'):
+    ...     ...
+
+.. versionadded:: 0.8
+'''
+import functools as ft
+import json
+import os
+import threading
+import time
+
+#: Environment variable containing path of trace file for child processes.
+TRACE_ENV_VAR = 'MICRODROP_TRACE_FILE'
+
+_lock = threading.Lock()
+_trace_fd = None
+_named_threads = set()
+
+
+def enabled():
+    '''
+    Returns
+    -------
+    bool
+        ``True`` if trace events are being recorded.
+    '''
+    return _trace_fd is not None
+
+
+def _timestamp():
+    # Trace-event timestamps are in microseconds.  Use wall clock time so
+    # events from different processes line up.
+    return time.time() * 1e6
+
+
+def _write_event(event):
+    data = json.dumps(event) + ',\n'
+    # **N.B.**, each event is written using a single `write` to a file opened
+    # in append mode, so events from concurrent processes are not interleaved.
+    os.write(_trace_fd, data)
+
+
+def _thread_metadata():
+    thread = threading.current_thread()
+    key = (os.getpid(), thread.ident)
+    if key not in _named_threads:
+        _named_threads.add(key)
+        _write_event({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                      'tid': thread.ident, 'args': {'name': thread.name}})
+
+
+def enable(path, export=True, process_name=None):
+    '''
+    Start recording trace events.
+
+    Parameters
+    ----------
+    path : str
+        Trace file path (events are appended if file exists).
+    export : bool, optional
+        If ``True``, set :data:`TRACE_ENV_VAR` such that child processes
+        append their events to the same file.
+    process_name : str, optional
+        Process name shown in trace viewer.
+    '''
+    global _trace_fd
+
+    path = os.path.abspath(path)
+    with _lock:
+        if _trace_fd is not None:
+            os.close(_trace_fd)
+        _trace_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                            0644)
+        if os.fstat(_trace_fd).st_size == 0:
+            os.write(_trace_fd, '[\n')
+        _named_threads.clear()
+        if process_name is not None:
+            _write_event({'name': 'process_name', 'ph': 'M',
+                          'pid': os.getpid(), 'tid': 0,
+                          'args': {'name': process_name}})
+    if export:
+        os.environ[TRACE_ENV_VAR] = path
+
+
+def enable_from_environment(process_name=None):
+    '''
+    Start recording trace events if :data:`TRACE_ENV_VAR` is set, e.g., by
+    parent launcher process.
+
+    Returns
+    -------
+    bool
+        ``True`` if tracing was enabled.
+    '''
+    path = os.environ.get(TRACE_ENV_VAR)
+    if not path:
+        return False
+    enable(path, export=False, process_name=process_name)
+    return True
+
+
+def instant(name, **kwargs):
+    '''
+    Record instant event (e.g., a milestone such as "window shown").
+    '''
+    if _trace_fd is None:
+        return
+    with _lock:
+        _thread_metadata()
+        _write_event({'name': name, 'ph': 'i', 's': 't',
+                      'ts': _timestamp(), 'pid': os.getpid(),
+                      'tid': threading.current_thread().ident,
+                      'args': kwargs})
+
+
+class span(object):
+    '''
+    Record duration of a phase as a complete (``"X"``) trace event.
+
+    Spans nest by time within each thread.  May be used as a context manager
+    or as a decorator.
+
+    Parameters
+    ----------
+    name : str
+        Phase name.
+    **kwargs
+        JSON-serializable event arguments.
+    '''
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.args = kwargs
+        self.start = None
+
+    def __enter__(self):
+        if _trace_fd is not None:
+            self.start = _timestamp()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        if self.start is None or _trace_fd is None:
+            return False
+        end = _timestamp()
+        args = dict(self.args)
+        if type_ is not None:
+            args['exception'] = type_.__name__
+        with _lock:
+            _thread_metadata()
+            _write_event({'name': self.name, 'cat': 'launcher', 'ph': 'X',
+                          'ts': self.start, 'dur': end - self.start,
+                          'pid': os.getpid(),
+                          'tid': threading.current_thread().ident,
+                          'args': args})
+        self.start = None
+        return False
+
+    def __call__(self, function):
+        @ft.wraps(function)
+        def _wrapped(*args, **kwargs):
+            with span(self.name, **self.args):
+                return function(*args, **kwargs)
+        return _wrapped
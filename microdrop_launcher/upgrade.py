@@ -0,0 +1,293 @@
+'''
+Install Conda package upgrades without blocking the GTK main loop.
+
+An upgrade is installed by :class:`UpgradeWorker` in two phases:
+
+ 1. ``download``: download packages to the Conda package cache (i.e., ``conda
+    install --download-only``), reporting progress.  May be cancelled, which
+    kills the Conda process group.
+ 2. ``link``: install the downloaded packages (i.e., ``conda install
+    --offline``).  Never cancelled, since killing Conda while linking may
+    leave the environment half-linked.
+
+If either phase fails (e.g., Conda does not support ``--download-only``), the
+upgrade is installed using a single (non-cancellable) ``conda install``
+instead (``install`` phase).
+
+:func:`upgrade_with_progress` shows the progress of an upgrade in a GTK
+dialog.
+
+.. versionadded:: 0.8
+'''
+import logging
+import threading
+
+from .conda_stream import CondaError, kill_process_group, stream_conda
+
+logger = logging.getLogger(__name__)
+
+
+class UpgradeWorker(threading.Thread):
+    '''
+    Install Conda package upgrade in a background thread.
+
+    Callbacks are called from the worker thread.
+
+    Parameters
+    ----------
+    specs : list
+        Conda package specifications, e.g., ``['microdrop ==2.11.0']``.
+    staged : bool, optional
+        If ``True``, packages have already been downloaded (see
+        :func:`microdrop_launcher.tasks.stage_microdrop_upgrade`), so skip
+        the ``download`` phase.
+    on_phase : callable, optional
+        Called with the name of each phase as it starts, i.e.,
+        ``"download"``, ``"link"``, ``"install"``.
+    on_progress : callable, optional
+        Called with each Conda download progress event (see
+        :class:`microdrop_launcher.conda_stream.CondaOutputReader`).
+    on_done : callable, optional
+        Called with :attr:`result` once finished.
+
+    Attributes
+    ----------
+    result : dict
+        Upgrade result (once finished):
+
+         - ``unlinked``, ``linked``: Packages uninstalled and installed,
+           respectively (see :func:`conda_helpers.install_info`).
+         - ``error``: Error message (or ``None`` if no error occurred).
+         - ``cancelled``: ``True`` if upgrade was cancelled.
+    '''
+    def __init__(self, specs, staged=False, on_phase=None, on_progress=None,
+                 on_done=None):
+        super(UpgradeWorker, self).__init__(name='upgrade')
+        self.daemon = True
+        self.specs = list(specs)
+        self.staged = staged
+        self.on_phase = on_phase
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.phase = None
+        self.result = None
+        self._lock = threading.Lock()
+        self._process = None
+        self._cancelled = False
+
+    @property
+    def cancellable(self):
+        '''
+        ``True`` if upgrade may (still) be cancelled.
+        '''
+        return self.phase in (None, 'download') and not self._cancelled
+
+    def cancel(self):
+        '''
+        Cancel upgrade, if still downloading.
+
+        Returns
+        -------
+        bool
+            ``True`` if upgrade will be cancelled.
+        '''
+        with self._lock:
+            if not self.cancellable:
+                return False
+            self._cancelled = True
+            process = self._process
+        if process is not None:
+            kill_process_group(process)
+        return True
+
+    def _on_start(self, process):
+        with self._lock:
+            self._process = process
+            cancelled = self._cancelled
+        if cancelled:
+            kill_process_group(process)
+
+    def _set_phase(self, phase):
+        with self._lock:
+            if phase != 'download' and self._cancelled:
+                return False
+            self.phase = phase
+        if self.on_phase is not None:
+            self.on_phase(phase)
+        return True
+
+    def _install(self, *args, **kwargs):
+        '''
+        Run ``conda install --json`` for :attr:`specs`.
+
+        Raises
+        ------
+        CondaError
+            If Conda fails, or reports that the install did not succeed.
+        ValueError
+            If Conda output is not a JSON document, i.e., the result cannot be
+            verified (see
+            :func:`microdrop_launcher.conda_stream.stream_conda`).
+        '''
+        response = stream_conda('install', '--json',
+                                *(args + tuple(self.specs)),
+                                on_message=logger.debug, **kwargs)
+        if isinstance(response, dict) and response.get('success') is False:
+            raise CondaError('Error executing `conda install`: {}'
+                             .format(response.get('message') or
+                                     response.get('error')),
+                             document=response)
+        return response
+
+    def run(self):
+        import conda_helpers as ch
+
+        result = {'unlinked': [], 'linked': [], 'error': None,
+                  'cancelled': False}
+        try:
+            response = None
+            linked = False
+            if not self.staged and self._set_phase('download'):
+                try:
+                    self._install('--download-only', '--quiet',
+                                  on_progress=self.on_progress,
+                                  on_start=self._on_start)
+                    self.staged = True
+                except (CondaError, ValueError), exception:
+                    # Download could not be verified, so install using a
+                    # single `conda install` instead.
+                    if not self._cancelled:
+                        logger.info('Error downloading upgrade: %s',
+                                    exception)
+            # **N.B.**, `_set_phase` returns `False` if upgrade was cancelled
+            # while downloading.
+            if self.staged and self._set_phase('link'):
+                try:
+                    response = self._install('--offline', '--quiet',
+                                             cancellable=False)
+                    linked = True
+                except CondaError, exception:
+                    # E.g., package cache was cleaned.
+                    logger.info('Error installing downloaded upgrade: %s',
+                                exception)
+            if not linked:
+                if self._set_phase('install'):
+                    response = self._install(on_progress=self.on_progress,
+                                             cancellable=False)
+                else:
+                    result['cancelled'] = True
+            if response is not None:
+                result['unlinked'], result['linked'] = \
+                    ch.install_info(response)
+        except ValueError, exception:
+            # Conda exited successfully, but the install result cannot be
+            # verified.
+            result['error'] = ('Could not decode Conda install log:\n{}'
+                               .format(getattr(exception, 'text',
+                                               exception)))
+        except Exception, exception:
+            logger.debug('Error upgrading `%s`.', ', '.join(self.specs),
+                         exc_info=True)
+            result['error'] = str(exception)
+        self.result = result
+        if self.on_done is not None:
+            self.on_done(result)
+
+
+def upgrade_with_progress(specs, title='Upgrade', staged=False, parent=None):
+    '''
+    Install Conda package upgrade (see :class:`UpgradeWorker`) while showing
+    progress in a GTK dialog.
+
+    The dialog remains responsive while Conda runs; the cancel button is
+    available until downloads are complete.
+
+    Parameters
+    ----------
+    specs : list
+        Conda package specifications, e.g., ``['microdrop ==2.11.0']``.
+    title : str, optional
+        Dialog title.
+    staged : bool, optional
+        See :class:`UpgradeWorker`.
+    parent : gtk.Window, optional
+        Parent window.
+
+    Returns
+    -------
+    dict
+        See :attr:`UpgradeWorker.result`.
+    '''
+    import gobject
+    import gtk
+
+    # Allow worker thread to run while GTK main loop is waiting for events.
+    gobject.threads_init()
+
+    dialog = gtk.Dialog(title=title, parent=parent,
+                        flags=gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT)
+    cancel_button = dialog.add_button(gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL)
+    dialog.set_default_size(420, -1)
+    label = gtk.Label('Starting...')
+    label.set_alignment(0, .5)
+    progress_bar = gtk.ProgressBar()
+    content_area = dialog.get_content_area()
+    content_area.pack_start(label, expand=False, fill=True, padding=5)
+    content_area.pack_start(progress_bar, expand=False, fill=True, padding=5)
+
+    phase_labels = {'download': 'Downloading packages...',
+                    'link': 'Installing packages...',
+                    'install': 'Downloading and installing packages...'}
+
+    def _on_phase(phase):
+        label.set_text(phase_labels.get(phase, phase))
+        cancel_button.set_sensitive(worker.cancellable)
+        progress_bar.set_fraction(0)
+        if phase == 'link':
+            progress_bar.set_text('')
+        return False
+
+    def _on_progress(event):
+        maxval = event.get('maxval') or 0
+        if maxval > 0:
+            progress_bar.set_fraction(min(1., float(event['progress']) /
+                                          maxval))
+        else:
+            progress_bar.pulse()
+        progress_bar.set_text(event.get('fetch') or '')
+        return False
+
+    def _pulse():
+        if worker.result is not None:
+            return False
+        if worker.phase != 'download':
+            progress_bar.pulse()
+        return True
+
+    def _on_done(result):
+        dialog.response(gtk.RESPONSE_OK)
+        return False
+
+    worker = UpgradeWorker(specs, staged=staged,
+                           on_phase=lambda *args:
+                           gtk.idle_add(_on_phase, *args),
+                           on_progress=lambda *args:
+                           gtk.idle_add(_on_progress, *args),
+                           on_done=lambda *args:
+                           gtk.idle_add(_on_done, *args))
+    dialog.show_all()
+    gtk.timeout_add(100, _pulse)
+    worker.start()
+    try:
+        while True:
+            response = dialog.run()
+            if worker.result is not None:
+                break
+            if response in (gtk.RESPONSE_CANCEL, gtk.RESPONSE_DELETE_EVENT):
+                # **N.B.**, keep dialog open until Conda has exited.
+                if worker.cancel():
+                    label.set_text('Cancelling...')
+                cancel_button.set_sensitive(False)
+    finally:
+        dialog.destroy()
+    return worker.result
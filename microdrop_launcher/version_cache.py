@@ -0,0 +1,543 @@
+'''
+Cache of available MicroDrop versions, shared by all launcher processes and
+MicroDrop major versions.
+
+The cache is a YAML document stored in the MicroDrop user configuration
+directory (see :func:`version_cache_path`), e.g.:
+
+.. code-block:: yaml
+
+    schema: 1
+    # Time of last successful Conda channel check.
+    checked: 1507221123.5
+    # Latest version of each package found on each channel.
+    channels:
+      https://conda.anaconda.org/sci-bots/win-32: {microdrop: 2.10.2}
+    # Latest version (and whether user chose to ignore it) per MicroDrop
+    # major version.
+    latest:
+      '2': {ignore: false, version: 2.10.2}
+    # Last failed channel check (``null`` after a successful check).
+    last_error: {failures: 1, message: ..., timestamp: 1507221123.5}
+    # Background task timeouts (see :mod:`microdrop_launcher.tasks`).
+    backoff:
+      conda-search: {count: 1, timestamp: 1507221123.5}
+    # Upgrade packages downloaded to Conda package cache, per MicroDrop major
+    # version (see :func:`microdrop_launcher.tasks.stage_microdrop_upgrade`).
+    staged:
+      '2': {prefix: C:\MicroDrop, timestamp: 1507221123.5, version: 2.11.0}
+    # Staging manifest of ``microdrop-launcher`` upgrade downloaded to Conda
+    # package cache, per Conda environment (see
+    # :func:`microdrop_launcher.auto_upgrade.apply_staged_upgrade`).
+    launcher_staged:
+      C:\MicroDrop: {failures: 0, timestamp: 1507221123.5, version: 0.8.1}
+
+Any launcher process may decide whether a network check is needed from a
+single read (see :func:`network_check_needed`).  Writers modify the cache
+while holding a lock (see :func:`update_version_cache`), and the file is
+replaced atomically, so readers need no lock.
+
+Supersedes the per-major-version ``latest-version.yml`` file, which is
+imported on first use.
+
+.. versionadded:: 0.8
+'''
+import contextlib
+import logging
+import time
+
+import path_helpers as ph
+
+from . import SEARCH_CACHE_TTL
+from .dirs import AppDirs
+from .files import FileLock, atomic_write, replace_file, yaml_dump, yaml_load
+from .version_context import VERSION_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+#: Version of cache file layout.
+SCHEMA_VERSION = 1
+#: Time (in seconds) to skip channel checks after a failed check.
+ERROR_BACKOFF = 5 * 60.
+#: Maximum time (in seconds) to skip channel checks after consecutive failed
+#: checks.
+MAX_ERROR_BACKOFF = 6 * 60 * 60.
+#: Time (in seconds) to back off from a background task after it timed out.
+TIMEOUT_BACKOFF = 15 * 60.
+#: Maximum back off time (in seconds) after consecutive timeouts.
+MAX_TIMEOUT_BACKOFF = 24 * 60 * 60.
+#: Number of failed attempts to install a staged ``microdrop-launcher``
+#: upgrade after which it is no longer attempted until it is staged again.
+MAX_STAGED_FAILURES = 3
+
+
+def version_cache_path():
+    '''
+    Returns
+    -------
+    path_helpers.path
+        Path to version cache file (not specific to a MicroDrop major
+        version).
+    '''
+    return AppDirs('MicroDrop').user_config_dir.joinpath('version-cache.yml')
+
+
+def legacy_version_cache_path(major_version):
+    '''
+    Parameters
+    ----------
+    major_version : int
+        MicroDrop major version.
+
+    Returns
+    -------
+    path_helpers.path
+        Path to ``latest-version.yml`` file written by launcher versions
+        before 0.8 (see :func:`load_version_cache`).
+    '''
+    return (AppDirs('MicroDrop', version='{}.0'.format(major_version))
+            .user_config_dir.joinpath('latest-version.yml'))
+
+
+def _empty_cache():
+    return {'schema': SCHEMA_VERSION, 'checked': None, 'channels': {},
+            'latest': {}, 'last_error': None, 'backoff': {}, 'staged': {},
+            'launcher_staged': {}}
+
+
+def _read(path):
+    with path.open('r') as input_:
+        cache = yaml_load(input_.read())
+    if not isinstance(cache, dict) or 'schema' not in cache:
+        raise ValueError('Not a version cache: `{}`'.format(path))
+    # **N.B.**, keys unknown to this version (e.g., written by a newer
+    # launcher) are preserved.
+    for key_i, value_i in _empty_cache().iteritems():
+        if cache.get(key_i) is None:
+            cache[key_i] = value_i
+    return cache
+
+
+def _import_legacy(cache):
+    # Import legacy file of installed MicroDrop major version (see
+    # `legacy_version_cache_path`).  The legacy file is left in place.
+    try:
+        major_version = VERSION_CONTEXT.major_version
+        legacy_path = legacy_version_cache_path(major_version)
+        if not legacy_path.isfile():
+            return
+        with legacy_path.open('r') as input_:
+            legacy_info = yaml_load(input_.read())
+        if isinstance(legacy_info, dict) and legacy_info.get('version'):
+            cache['latest'][str(major_version)] = \
+                {'version': str(legacy_info['version']),
+                 'ignore': bool(legacy_info.get('ignore'))}
+    except Exception:
+        logger.debug('Error importing legacy version cache.', exc_info=True)
+
+
+def load_version_cache(path=None):
+    '''
+    Read version cache (without locking).
+
+    Parameters
+    ----------
+    path : str, optional
+        Version cache path (default: :func:`version_cache_path`).
+
+    Returns
+    -------
+    dict
+        Version cache contents (empty cache if file does not exist or could
+        not be read).
+    '''
+    path = version_cache_path() if path is None else ph.path(path)
+    if not path.isfile():
+        cache = _empty_cache()
+        _import_legacy(cache)
+        return cache
+    try:
+        return _read(path)
+    except Exception:
+        logger.warning('Error reading version cache `%s`.', path,
+                       exc_info=True)
+        return _empty_cache()
+
+
+@contextlib.contextmanager
+def update_version_cache(path=None, timeout=10.):
+    '''
+    Context manager to modify version cache while holding its lock.
+
+    The cache is written atomically on exit (unless an exception occurred).
+    A corrupted cache file is kept (renamed with a ``.corrupt`` suffix) for
+    diagnosis rather than deleted.
+
+    Example:
+
+        >>> with update_version_cache() as cache:
+        ...     record_error(cache, 'Conda channels are not reachable.')
+
+    Parameters
+    ----------
+    path : str, optional
+        Version cache path (default: :func:`version_cache_path`).
+    timeout : float, optional
+        Time (in seconds) to wait for lock (see
+        :class:`microdrop_launcher.files.FileLock`).
+    '''
+    path = version_cache_path() if path is None else ph.path(path)
+    with FileLock(path + '.lock', timeout=timeout):
+        if path.isfile():
+            try:
+                cache = _read(path)
+            except Exception:
+                corrupt_path = path + '.corrupt'
+                logger.warning('Error reading version cache `%s`; moving to '
+                               '`%s`.', path, corrupt_path, exc_info=True)
+                replace_file(path, corrupt_path)
+                cache = _empty_cache()
+        else:
+            cache = _empty_cache()
+            _import_legacy(cache)
+        yield cache
+        atomic_write(path, yaml_dump(cache, default_flow_style=False))
+
+
+def latest_version(cache, major_version=None):
+    '''
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`load_version_cache`).
+    major_version : int, optional
+        MicroDrop major version (default: installed major version).
+
+    Returns
+    -------
+    dict
+        Latest known MicroDrop version with the specified major version, as a
+        dictionary that MAY contain a string version specifier with the key
+        ``version``, and MAY also contain a boolean value with the key
+        ``ignore``.
+    '''
+    if major_version is None:
+        major_version = VERSION_CONTEXT.major_version
+    return dict(cache['latest'].get(str(major_version)) or {})
+
+
+def ignore_version(cache, version):
+    '''
+    Do not prompt user to upgrade to the specified MicroDrop version.
+
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    version : str
+        MicroDrop version.
+    '''
+    cache['latest'][str(VERSION_CONTEXT.major(version))] = \
+        {'version': version, 'ignore': True}
+
+
+def staged_version(cache, major_version=None):
+    '''
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`load_version_cache`).
+    major_version : int, optional
+        MicroDrop major version (default: installed major version).
+
+    Returns
+    -------
+    dict
+        MicroDrop upgrade downloaded to Conda package cache (see
+        :func:`record_staged`), or empty dictionary if none.
+    '''
+    if major_version is None:
+        major_version = VERSION_CONTEXT.major_version
+    return dict(cache['staged'].get(str(major_version)) or {})
+
+
+def record_staged(cache, version, prefix=None):
+    '''
+    Record that packages to upgrade to the specified MicroDrop version have
+    been downloaded to the Conda package cache, such that the upgrade may be
+    installed offline.
+
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    version : str
+        MicroDrop version.
+    prefix : str, optional
+        Conda environment prefix the upgrade was resolved for.
+    '''
+    cache['staged'][str(VERSION_CONTEXT.major(version))] = \
+        {'version': version, 'prefix': str(prefix) if prefix else None,
+         'timestamp': time.time()}
+
+
+def clear_staged(cache, major_version=None):
+    '''
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    major_version : int, optional
+        MicroDrop major version (default: installed major version).
+    '''
+    if major_version is None:
+        major_version = VERSION_CONTEXT.major_version
+    cache['staged'].pop(str(major_version), None)
+
+
+def staged_launcher_version(cache, prefix):
+    '''
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`load_version_cache`).
+    prefix : str
+        Conda environment prefix.
+
+    Returns
+    -------
+    dict
+        ``microdrop-launcher`` upgrade downloaded to Conda package cache for
+        the specified environment (see :func:`record_staged_launcher`), or
+        empty dictionary if none.
+    '''
+    return dict(cache['launcher_staged'].get(str(prefix)) or {})
+
+
+def record_staged_launcher(cache, version, prefix):
+    '''
+    Record that packages to upgrade ``microdrop-launcher`` to the specified
+    version in the specified Conda environment have been downloaded to the
+    Conda package cache, such that the upgrade may be installed offline.
+
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    version : str
+        ``microdrop-launcher`` version.
+    prefix : str
+        Conda environment prefix the upgrade was resolved for.
+    '''
+    cache['launcher_staged'][str(prefix)] = {'version': version,
+                                             'timestamp': time.time(),
+                                             'failures': 0}
+
+
+def record_staged_launcher_failure(cache, prefix, message):
+    '''
+    Record failed attempt to install staged ``microdrop-launcher`` upgrade.
+
+    The staged upgrade is kept, such that it is retried at the next launcher
+    start, until it has failed :data:`MAX_STAGED_FAILURES` times (after which
+    it is staged again by the next background check).
+
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    prefix : str
+        Conda environment prefix.
+    message : str
+        Error message.
+    '''
+    staged = cache['launcher_staged'].get(str(prefix))
+    if not staged:
+        return
+    staged['failures'] = staged.get('failures', 0) + 1
+    staged['last_error'] = message
+
+
+def clear_staged_launcher(cache, prefix):
+    '''
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    prefix : str
+        Conda environment prefix.
+    '''
+    cache['launcher_staged'].pop(str(prefix), None)
+
+
+def record_check(cache, package_versions, fresh=True):
+    '''
+    Record result of Conda channel check.
+
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    package_versions : dict
+        Mapping from package name to list of available versions (e.g.,
+        ``versions`` of each package returned by
+        :func:`microdrop_launcher.conda_versions_info`).
+    fresh : bool, optional
+        If ``True``, versions were just looked up from Conda channels (rather
+        than cached repodata), so update the check timestamp.
+    '''
+    for name_i, versions_i in package_versions.iteritems():
+        for version_j in versions_i:
+            channel_j = version_j.get('channel')
+            if not channel_j:
+                # E.g., read from cached repodata.
+                continue
+            channel_versions = cache['channels'].setdefault(channel_j, {})
+            if (name_i not in channel_versions or
+                    VERSION_CONTEXT.parse(version_j['version']) >
+                    VERSION_CONTEXT.parse(channel_versions[name_i])):
+                channel_versions[name_i] = version_j['version']
+
+    # Latest MicroDrop version per major version.
+    for version_i in package_versions.get('microdrop', []):
+        key_i = str(VERSION_CONTEXT.major(version_i['version']))
+        latest_i = cache['latest'].get(key_i) or {}
+        if (not latest_i.get('version') or
+                VERSION_CONTEXT.parse(version_i['version']) >
+                VERSION_CONTEXT.parse(latest_i['version'])):
+            cache['latest'][key_i] = {'version': version_i['version'],
+                                      'ignore': False}
+
+    if fresh:
+        cache['checked'] = time.time()
+        cache['last_error'] = None
+
+
+def record_error(cache, message):
+    '''
+    Record failed Conda channel check, such that subsequent launches back
+    off (see :func:`error_backoff`).
+
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`update_version_cache`).
+    message : str
+        Error message.
+    '''
+    failures = (cache['last_error'] or {}).get('failures', 0) + 1
+    cache['last_error'] = {'message': message, 'timestamp': time.time(),
+                           'failures': failures}
+
+
+def _remaining(timestamp, backoff):
+    remaining = timestamp + backoff - time.time()
+    # Ignore timestamps in the future (e.g., after system clock change).
+    return remaining if 0 < remaining <= backoff else 0
+
+
+def error_backoff(cache):
+    '''
+    Time remaining before Conda channels should be checked again after a
+    failed check.
+
+    Back off time doubles with each consecutive failed check (starting at
+    :data:`ERROR_BACKOFF`, up to :data:`MAX_ERROR_BACKOFF`).
+
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`load_version_cache`).
+
+    Returns
+    -------
+    float
+        Time (in seconds) remaining (0 if last check did not fail).
+    '''
+    try:
+        last_error = cache['last_error']
+        return _remaining(last_error['timestamp'],
+                          min(ERROR_BACKOFF * 2 ** (last_error['failures'] -
+                                                    1), MAX_ERROR_BACKOFF))
+    except (KeyError, TypeError):
+        return 0
+
+
+def record_task_timeout(task_name, timed_out, path=None):
+    '''
+    Record (or clear) timeout of background task, such that subsequent
+    launches may back off (see :func:`task_backoff`).
+
+    Parameters
+    ----------
+    task_name : str
+        Background task name, e.g., ``"conda-search"``.
+    timed_out : bool
+        ``True`` if task was cancelled after its deadline expired.
+    path : str, optional
+        Version cache path (default: :func:`version_cache_path`).
+    '''
+    if not timed_out and task_name not in load_version_cache(path)['backoff']:
+        # Nothing to clear; avoid taking the lock.
+        return
+    with update_version_cache(path) as cache:
+        if timed_out:
+            count = cache['backoff'].get(task_name, {}).get('count', 0) + 1
+            cache['backoff'][task_name] = {'count': count,
+                                           'timestamp': time.time()}
+        else:
+            # Task completed, so stop backing off.
+            cache['backoff'].pop(task_name, None)
+
+
+def task_backoff(task_name, cache=None):
+    '''
+    Time remaining before a background task that timed out should be retried.
+
+    Back off time doubles with each consecutive timeout (starting at
+    :data:`TIMEOUT_BACKOFF`, up to :data:`MAX_TIMEOUT_BACKOFF`).
+
+    Parameters
+    ----------
+    task_name : str
+        Background task name (see :func:`record_task_timeout`).
+    cache : dict, optional
+        Version cache (default: read using :func:`load_version_cache`).
+
+    Returns
+    -------
+    float
+        Time (in seconds) remaining before background task should be retried
+        (0 if task has not timed out recently).
+    '''
+    if cache is None:
+        cache = load_version_cache()
+    try:
+        timeout = cache['backoff'][task_name]
+        return _remaining(timeout['timestamp'],
+                          min(TIMEOUT_BACKOFF * 2 ** (timeout['count'] - 1),
+                              MAX_TIMEOUT_BACKOFF))
+    except (KeyError, TypeError):
+        return 0
+
+
+def network_check_needed(cache, ttl=SEARCH_CACHE_TTL):
+    '''
+    Parameters
+    ----------
+    cache : dict
+        Version cache (see :func:`load_version_cache`).
+    ttl : float, optional
+        Maximum age (in seconds) of last successful channel check.
+
+    Returns
+    -------
+    bool
+        ``True`` unless Conda channels were checked within :data:`ttl`, or
+        checks are backing off after a failure or timeout.
+    '''
+    checked = cache.get('checked')
+    if checked is not None and 0 <= time.time() - checked <= ttl:
+        return False
+    return not (error_backoff(cache) > 0 or
+                task_backoff('conda-search', cache) > 0)
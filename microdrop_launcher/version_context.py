@@ -0,0 +1,126 @@
+'''
+Process-wide, memoized view of the installed MicroDrop version.
+
+Looking up a distribution using :mod:`pkg_resources` and parsing version
+strings is relatively expensive.  All launcher modules share
+:data:`VERSION_CONTEXT`, such that the installed MicroDrop distribution is
+looked up at most once per process (until explicitly invalidated, e.g., after
+an upgrade).
+
+.. versionadded:: 0.8
+'''
+import threading
+
+
+class VersionContext(object):
+    '''
+    Memoized installed version of a Python package.
+
+    Parameters
+    ----------
+    package_name : str
+        Name of Python distribution.
+    '''
+    def __init__(self, package_name):
+        self.package_name = package_name
+        self._lock = threading.RLock()
+        self._version = None
+        self._rescan = False
+        self._parsed = {}
+        self._major = {}
+
+    @property
+    def version(self):
+        '''
+        Installed version string, e.g., ``"2.10.2"``.
+
+        Raises
+        ------
+        pkg_resources.DistributionNotFound
+            If package is not installed.
+        '''
+        with self._lock:
+            if self._version is None:
+                import pkg_resources
+
+                if self._rescan:
+                    # Package may have changed since `pkg_resources` working
+                    # set was built, so scan installed distributions again.
+                    requirement = (pkg_resources.Requirement
+                                   .parse(self.package_name))
+                    distribution = pkg_resources.WorkingSet().find(requirement)
+                    if distribution is None:
+                        raise pkg_resources.DistributionNotFound(requirement)
+                else:
+                    distribution = (pkg_resources
+                                    .get_distribution(self.package_name))
+                self._version = distribution.version
+            return self._version
+
+    @property
+    def parsed_version(self):
+        '''
+        Installed version, as returned by :func:`pkg_resources.parse_version`.
+        '''
+        return self.parse(self.version)
+
+    @property
+    def major_version(self):
+        '''
+        Installed major version number (e.g., ``2``).
+        '''
+        return self.major(self.version)
+
+    @property
+    def major_version_str(self):
+        '''
+        Installed major version string (e.g., ``"2.0"``).
+        '''
+        return '{}.0'.format(self.major_version)
+
+    def parse(self, version_str):
+        '''
+        Memoized :func:`pkg_resources.parse_version`.
+        '''
+        try:
+            return self._parsed[version_str]
+        except KeyError:
+            import pkg_resources
+
+            parsed = pkg_resources.parse_version(version_str)
+            self._parsed[version_str] = parsed
+            return parsed
+
+    def major(self, version_str):
+        '''
+        Parameters
+        ----------
+        version_str : str
+            Version string, e.g., ``"2.10.2"``.
+
+        Returns
+        -------
+        int
+            Major version number, e.g., ``2``.
+        '''
+        try:
+            return self._major[version_str]
+        except KeyError:
+            major = int(version_str.split('.')[0])
+            self._major[version_str] = major
+            return major
+
+    def invalidate(self):
+        '''
+        Discard memoized installed version, e.g., after upgrading package.
+
+        The next access to :attr:`version` scans the installed distributions
+        again.
+        '''
+        with self._lock:
+            self._version = None
+            self._rescan = True
+
+
+#: Installed MicroDrop version (shared by all launcher modules).
+VERSION_CONTEXT = VersionContext('microdrop')
@@ -4,6 +4,8 @@ from win32com.shell import shell, shellcon
 import pkg_resources
 import pythoncom
 
+from .version_context import VERSION_CONTEXT
+
 
 def create_microdrop_shortcut(target_path, name, description=None,
                               overwrite=False, icon=None):
@@ -16,8 +18,7 @@ def create_microdrop_shortcut(target_path, name, description=None,
         batch_path (str) : Path to MicroDrop launch batch file.
     '''
     # Look up MicroDrop major version.
-    microdrop_dist = pkg_resources.get_distribution('microdrop')
-    major_version = '.'.join(microdrop_dist.version.split('.')[:2])
+    major_version = '.'.join(VERSION_CONTEXT.version.split('.')[:2])
 
     # Surround target path in quotes if it contains spaces.
     if ' ' in target_path and not (target_path.startswith('"') and
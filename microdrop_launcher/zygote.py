@@ -0,0 +1,304 @@
+'''
+Pre-initialized ("zygote") Python interpreter for fast MicroDrop (re)starts.
+
+A zygote server process imports heavy, GUI-free dependencies of MicroDrop
+(e.g., :mod:`numpy`, :mod:`pandas`) once, then forks a child process for each
+launch request.  Each child starts with those modules already imported, such
+that restarting MicroDrop (e.g., after enabling or disabling a plugin,
+indicated by return code 5) does not pay for importing them again.
+
+**N.B.**, requires :func:`os.fork` (i.e., not available on Windows).  Modules
+that import GTK or GObject (e.g., ``gtk``, ``matplotlib`` with a GTK backend,
+``microdrop``) must **not** be preloaded, since their state (e.g., the
+connection to the display, the main loop) must not be shared between
+processes.  If any of :data:`GUI_MODULES` is imported while preloading, the
+server reports it in its ready message (see :meth:`Zygote.start`) and the
+launcher falls back to starting a new interpreter.
+
+Protocol: the launcher writes one JSON request per line to the standard input
+of the server, and the server writes one JSON response per line to the
+response file descriptor passed on its command line.  For each request, the
+server responds once the child is forked (``{'pid': ..., 'started': true}``)
+and again once it has exited (``{'pid': ..., 'returncode': ...}``).
+
+.. versionadded:: 0.8
+'''
+import json
+import logging
+import os
+import subprocess as sp
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+#: Modules imported by zygote server before forking (must not import any of
+#: :data:`GUI_MODULES`).
+DEFAULT_PRELOAD = ('numpy', 'pandas')
+
+#: Modules that are not safe to use in a forked child process once imported
+#: by the zygote server.
+GUI_MODULES = ('gtk', 'gobject', 'gi')
+
+
+def zygote_available():
+    '''
+    Returns
+    -------
+    bool
+        ``True`` if zygote mode is supported on this platform.
+    '''
+    return hasattr(os, 'fork')
+
+
+class Zygote(object):
+    '''
+    Client for a zygote server process.
+
+    Parameters
+    ----------
+    preload : list, optional
+        Modules to import in zygote server (default:
+        :data:`DEFAULT_PRELOAD`).
+    env : dict, optional
+        Environment of zygote server (default: :data:`os.environ`).
+
+    Example
+    -------
+
+    >>> with Zygote() as zygote:
+    ...     return_code = zygote.run(module='microdrop.microdrop',
+    ...                              args=['-c', config_file])
+    '''
+    def __init__(self, preload=None, env=None):
+        if not zygote_available():
+            raise RuntimeError('Zygote mode requires `os.fork`.')
+        if preload is None:
+            preload = DEFAULT_PRELOAD
+        self.preload = list(preload)
+        self.env = env
+        self.process = None
+        self._responses = None
+
+    def start(self):
+        '''
+        Start zygote server process and wait until modules are preloaded.
+
+        Returns
+        -------
+        dict
+            Server ready message, i.e., ``{'pid': ..., 'preloaded': [...],
+            'failed': [...], 'gui_modules': [...], 'duration': ...}``, where
+            ``gui_modules`` lists any of :data:`GUI_MODULES` imported while
+            preloading (in which case children should not be forked).
+        '''
+        read_fd, write_fd = os.pipe()
+        try:
+            self.process = sp.Popen([sys.executable, '-m',
+                                     'microdrop_launcher.zygote', '--fd',
+                                     str(write_fd)] + self.preload,
+                                    stdin=sp.PIPE, env=self.env,
+                                    close_fds=False)
+        finally:
+            os.close(write_fd)
+        self._responses = os.fdopen(read_fd, 'r')
+        return self._response()
+
+    def _response(self):
+        line = self._responses.readline()
+        if not line:
+            raise RuntimeError('Zygote server exited (return code: {}).'
+                               .format(self.process.poll()))
+        return json.loads(line)
+
+    def run(self, module=None, args=None, code=None, cwd=None, env=None,
+            on_spawn=None):
+        '''
+        Fork child process from zygote server and wait for it to exit.
+
+        .. versionchanged:: 0.8
+            Add :data:`on_spawn` parameter.
+
+        Parameters
+        ----------
+        module : str, optional
+            Module to run as ``__main__`` in child process (e.g.,
+            ``"microdrop.microdrop"``).
+        args : list, optional
+            Command-line arguments (i.e., ``sys.argv[1:]``) of child process.
+        code : str, optional
+            Python source code to execute in child process (instead of
+            :data:`module`).
+        cwd : str, optional
+            Working directory of child process (default: current working
+            directory of launcher).
+        env : dict, optional
+            Environment of child process (default: :data:`os.environ`).
+        on_spawn : callable, optional
+            Called with process ID of child process once it is forked.
+
+        Returns
+        -------
+        int
+            Return code of child process.
+        '''
+        if self.process is None:
+            self.start()
+        request = {'module': module, 'code': code,
+                   'args': [str(arg_i) for arg_i in (args or [])],
+                   'cwd': os.getcwd() if cwd is None else str(cwd),
+                   'env': dict(os.environ if env is None else env)}
+        self.process.stdin.write(json.dumps(request) + '\n')
+        self.process.stdin.flush()
+        response = self._response()
+        if response.get('started'):
+            if on_spawn is not None:
+                on_spawn(response['pid'])
+            response = self._response()
+        logger.debug('Zygote child %s exited with return code %s.',
+                     response.get('pid'), response.get('returncode'))
+        return response['returncode']
+
+    def stop(self):
+        '''
+        Stop zygote server process.
+        '''
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait()
+        finally:
+            self._responses.close()
+            self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode(sys.getfilesystemencoding() or 'utf-8')
+    return value
+
+
+def _child(request, response_fd):
+    '''
+    Run request in forked child process (never returns).
+    '''
+    import runpy
+
+    return_code = 0
+    try:
+        os.close(response_fd)
+        # Do not share zygote request pipe.
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null_fd, 0)
+        os.close(null_fd)
+        os.environ.clear()
+        os.environ.update((_encode(key_i), _encode(value_i))
+                          for key_i, value_i in request['env'].iteritems())
+        os.chdir(request['cwd'])
+        args = [_encode(arg_i) for arg_i in request['args']]
+        if request.get('code') is not None:
+            sys.argv = ['-c'] + args
+            exec request['code'] in {'__name__': '__main__'}
+        else:
+            sys.argv = [request['module']] + args
+            runpy.run_module(request['module'], run_name='__main__',
+                             alter_sys=True)
+    except SystemExit, exception:
+        if exception.code is None:
+            return_code = 0
+        elif isinstance(exception.code, (int, long)):
+            return_code = exception.code
+        else:
+            print >> sys.stderr, exception.code
+            return_code = 1
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+        return_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(return_code)
+
+
+def serve(response_fd, preload):
+    '''
+    Zygote server loop: preload modules, then fork a child for each request
+    read from standard input until standard input is closed.
+
+    Parameters
+    ----------
+    response_fd : int
+        File descriptor to write responses to.
+    preload : list
+        Modules to import before forking.
+    '''
+    import importlib
+
+    # Keep `matplotlib` (e.g., imported by `pandas` plotting) from selecting
+    # a GTK backend in the server process.
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    start = time.time()
+    preloaded = []
+    failed = []
+    for module_i in preload:
+        try:
+            importlib.import_module(module_i)
+        except Exception:
+            logger.warning('Error preloading `%s`.', module_i, exc_info=True)
+            failed.append(module_i)
+        else:
+            preloaded.append(module_i)
+    gui_modules = [name_i for name_i in GUI_MODULES if name_i in sys.modules]
+    if gui_modules:
+        logger.warning('%s imported by zygote server; not safe to fork.',
+                       ', '.join(gui_modules))
+
+    def _respond(message):
+        os.write(response_fd, json.dumps(message) + '\n')
+
+    _respond({'pid': os.getpid(), 'preloaded': preloaded, 'failed': failed,
+              'gui_modules': gui_modules, 'duration': time.time() - start})
+
+    for line_i in iter(sys.stdin.readline, ''):
+        request_i = json.loads(line_i)
+        pid_i = os.fork()
+        if pid_i == 0:
+            _child(request_i, response_fd)
+        _respond({'pid': pid_i, 'started': True})
+        _, status_i = os.waitpid(pid_i, 0)
+        if os.WIFSIGNALED(status_i):
+            return_code_i = -os.WTERMSIG(status_i)
+        else:
+            return_code_i = os.WEXITSTATUS(status_i)
+        _respond({'pid': pid_i, 'returncode': return_code_i})
+
+
+def parse_args(args=None):
+    '''Parses arguments, returns (options, args).'''
+    from argparse import ArgumentParser
+
+    if args is None:
+        args = sys.argv
+
+    parser = ArgumentParser(description='MicroDrop zygote server (started '
+                            'by launcher).')
+    parser.add_argument('--fd', type=int, required=True,
+                        help='File descriptor to write responses to.')
+    parser.add_argument('preload', nargs='*', help='Modules to preload.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    serve(args.fd, args.preload)